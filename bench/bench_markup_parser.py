@@ -0,0 +1,60 @@
+import sys
+import os
+import re
+import time
+import json
+import random
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.markup_parser import parse_markups
+
+
+def legacy_parse(result_text):
+    # PCETools._parse_markup_text before the dedicated parser
+    string = result_text.replace("|\"", "\"").replace("|'", "'").replace("'{", "{").replace("}'", "}").replace("||", "\\").replace("'True'", "true").replace("'False'", "false").replace("'None'", "null").replace("'", '"')
+    if string.strip() == '':
+        return {}
+    string = re.sub(r'[\x00-\x1F\x7F]', lambda match: f'\\u{ord(match.group(0)):04x}', string)
+    return json.loads(string)
+
+
+def make_output(n, seed=0):
+    # ScriptEngine MarkupGetExList output without quotes in comments, so the legacy parser can read it too
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n):
+        props = {"color": rnd.choice(["#7A0000", "#FF0000", "#0000FF"]), "x": "{:.4f}".format(rnd.uniform(0, 3000)), "y": "{:.4f}".format(rnd.uniform(0, 2000)),
+                 "width": "{:.4f}".format(rnd.uniform(1, 100)), "height": "11.5", "subject": "Text Box", "locked": "False",
+                 "comment": "REVISION {} ISSUED FOR CONSTRUCTION||r{}".format(i, "X" * rnd.randint(0, 40))}
+        items.append("'{:016X}': '{{{}}}'".format(i, ", ".join("'{}': '{}'".format(k, v) for k, v in props.items())))
+    return "{" + ", ".join(items) + "}"
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ScriptEngine markup output parsing")
+    parser.add_argument("--markups", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    results = []
+    for n in args.markups:
+        text = make_output(n)
+        assert legacy_parse(text) == parse_markups(text)
+        r = {"markups": n, "bytes": len(text), "legacy": best_of(lambda: legacy_parse(text), args.repeat), "parser": best_of(lambda: parse_markups(text), args.repeat),
+             "parser_fields": best_of(lambda: parse_markups(text, fields=("x", "y", "color", "comment")), args.repeat)}
+        r["mb_per_s"] = len(text) / r["parser"] / 1e6
+        results.append(r)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print("{markups:>7} markups {bytes:>10} bytes  legacy {legacy:.3f}s  parser {parser:.3f}s ({mb_per_s:.1f} MB/s)  x/y/color/comment only {parser_fields:.3f}s".format(**r))
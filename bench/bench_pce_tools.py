@@ -0,0 +1,172 @@
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import fitz
+import pypdf
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.pce_tool import PCETools
+from pce.tracing import trace
+import stand_ins
+from synthetic import make_drawing, revision_context, A1
+
+# Times the PCETools entry points on synthetic drawings, with stand-ins for ScriptEngine.exe and inkscape.exe
+# so the whole suite runs anywhere. Compare two runs with --compare.
+CASES = ["overlay_page", "merge_page", "mix_patch", "pdf_set_color_v2", "pdf_color_v2", "pdf_color_inventory", "return_markups_for_document", "get_structured_markups_from", "resize_pdf", "split_pdf"]
+FORM_ANCHORS = (("#7A0000", (100, 100)), ("#00007A", (300, 310)))
+
+
+def make_inputs(workdir, pages, args):
+    def path(name):
+        return os.path.join(workdir, "{}_{}.pdf".format(name, pages))
+    return {
+        "drawing": make_drawing(path("drawing"), pages, args.annotations, args.density, revisions=True),
+        "overlay": make_drawing(path("overlay"), pages, args.annotations // 4, args.density // 4, seed=1),
+        # the form's markups define the anchor colors, so its notes must not share a color with the layers
+        "form": make_drawing(path("form"), 1, 0, args.density // 4, anchors=FORM_ANCHORS, seed=2),
+        "layers": [make_drawing(path("layer0"), pages, args.annotations, args.density, anchors=(("#7A0000", (110, 105)), ), seed=3),
+                   make_drawing(path("layer1"), pages, args.annotations // 4, args.density // 4, anchors=(("#00007A", (280, 300)), ), seed=4)],
+    }
+
+
+def case_functions(inputs, pages, workdir):
+    drawing, overlay = inputs["drawing"], inputs["overlay"]
+    output = os.path.join(workdir, "output_{}.pdf".format(pages))
+
+    def overlay_page():
+        for page in range(pages):
+            PCETools.overlay_page(drawing, overlay, None, page, page)
+
+    def merge_page():
+        for page in range(pages):
+            PCETools.merge_page([PCETools.get_ET(drawing, page), PCETools.get_ET(overlay, page)], [(0, 0), (10, 10)], A1)
+
+    def mix_patch():
+        PCETools.mix_patch(inputs["form"], inputs["layers"], output)
+
+    def pdf_set_color_v2():
+        PCETools.pdf_set_color_v2(drawing, range(pages), "#FF0000", "#00FF00", output)
+
+    def pdf_color_v2():
+        for page in range(pages):
+            PCETools.pdf_color_v2(drawing, page)
+
+    def pdf_color_inventory():
+        PCETools.pdf_color_inventory(drawing)
+
+    def return_markups_for_document():
+        PCETools.return_markups_for_document(drawing)
+
+    markups = PCETools.return_markups_for_document(drawing)
+
+    def get_structured_markups_from():
+        for page in range(1, pages + 1):
+            PCETools.get_structured_markups_from(markups[page], revision_context())
+
+    def resize_pdf():
+        PCETools.resize_pdf(drawing, "100", A1[0], A1[1], "50", A1[0] / 2, A1[1] / 2, output)
+
+    split_dir = os.path.join(workdir, "split_{}".format(pages))
+    os.makedirs(split_dir, exist_ok=True)
+
+    def split_pdf():
+        PCETools.split_pdf(drawing, split_dir)
+
+    return {name: func for name, func in locals().items() if name in CASES}
+
+
+def measure(func, repeat, warm):
+    timings = []
+    for _ in range(repeat):
+        if not warm:
+            PCETools.DOC_CACHE.invalidate()
+            PCETools.MARKUP_CACHE.invalidate()
+            PCETools.ANCHOR_CACHE.invalidate()
+            PCETools.SVG_CACHE.clear()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    report = {"meta": {"revision": git_revision(), "python": platform.python_version(), "platform": platform.platform(), "pymupdf": fitz.VersionBind,
+                       "pypdf": pypdf.__version__, "args": vars(args)}, "results": []}
+    with tempfile.TemporaryDirectory() as workdir:
+        env = stand_ins.install(workdir, args.engine_latency, args.command_latency, args.inkscape_latency, args.export_latency)
+        PCETools.SetEnvironment(PCETools.BLUEBEAM_DIR, env["BLUEBEAM_ENGINE_DIR"], env["INKSCAPE_DIRECTORY"], workdir)
+        PCETools.SVG_BACKEND = args.svg_backend
+        if args.svg_cache:
+            PCETools.SetSVGCache(os.path.join(workdir, "svg_cache"))
+        for pages in args.pages:
+            inputs = make_inputs(workdir, pages, args)
+            functions = case_functions(inputs, pages, workdir)
+            for name in args.cases:
+                if args.spans:
+                    with trace() as spans:
+                        timings = measure(functions[name], args.repeat, args.warm)
+                else:
+                    timings = measure(functions[name], args.repeat, args.warm)
+                result = {"case": name, "pages": pages, "best": min(timings), "timings": timings}
+                if args.spans:
+                    result["spans"] = spans.summary()["operations"]
+                report["results"].append(result)
+                print("{case:>28} {pages:>4} pages  {best:8.3f}s".format(**result), file=sys.stderr)
+    return report
+
+
+def compare(report, baseline, threshold):
+    # returns the cases that got slower than threshold x baseline
+    previous = {(r["case"], r["pages"]): r["best"] for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        before = previous.get((r["case"], r["pages"]))
+        if before is None:
+            continue
+        ratio = r["best"] / max(before, 1e-9)
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print("{:>28} {:>4} pages  {:8.3f}s -> {:8.3f}s  x{:.2f}{}".format(r["case"], r["pages"], before, r["best"], ratio, flag), file=sys.stderr)
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PCETools on synthetic drawings with ScriptEngine / Inkscape stand-ins")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--annotations", type=int, default=1000, help="markups per page")
+    parser.add_argument("--density", type=int, default=4000, help="vector segments per page")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warm", action="store_true", help="keep the document, markup, anchor and SVG caches between repeats")
+    parser.add_argument("--svg-backend", default="inkscape", choices=["inkscape", "pymupdf"])
+    parser.add_argument("--svg-cache", action="store_true", help="render page SVGs through a fresh on-disk SVG cache")
+    parser.add_argument("--engine-latency", type=float, default=0.0, help="seconds per ScriptEngine invocation")
+    parser.add_argument("--command-latency", type=float, default=0.0, help="seconds per ScriptEngine command")
+    parser.add_argument("--inkscape-latency", type=float, default=0.0, help="seconds per Inkscape invocation")
+    parser.add_argument("--export-latency", type=float, default=0.0, help="seconds per exported page")
+    parser.add_argument("--spans", action="store_true", help="add a per-operation span summary to every case")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="JSON report of an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio --compare reports as a regression")
+    args = parser.parse_args()
+    report = run(args)
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(report, json.load(f), args.threshold) else 0)
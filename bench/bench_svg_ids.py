@@ -0,0 +1,67 @@
+import sys
+import os
+import re
+import time
+import json
+import argparse
+from xml.etree import ElementTree as ET
+import fitz
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.svg_ids import rename_ids, parse_with_renamed_ids
+
+
+def legacy_rename_id(element, suffix):
+    # PCETools._rename_id before the single-pass rewrite
+    for elem in element.iter():
+        for key in elem.keys():
+            if key in ('id', ):
+                elem.set(key, elem.get(key) + '_' + suffix)
+        for key in elem.attrib:
+            if re.match(r".*url\(#.*\).*", elem.attrib[key]):
+                elem.attrib[key] = re.sub(r"\(#(.*?)\)", r"(#{}_{})".format(r"\1", suffix), elem.attrib[key])
+            if key.endswith("href") and re.match(r"#.*", elem.attrib[key]):
+                elem.attrib[key] = re.sub(r"#(.*)", r"#{}_{}".format(r"\1", suffix), elem.attrib[key])
+
+
+def make_svg(lines):
+    doc = fitz.open()
+    page = doc.new_page(width=2384, height=1684)
+    for i in range(lines):
+        page.insert_text((20, 20 + (i % 160) * 10), "PCE DRAWING {} REV A 1:100 MECHANICAL SERVICES".format(i), fontsize=6)
+        page.draw_rect(fitz.Rect(1200 + (i % 40) * 20, (i % 160) * 10, 1210 + (i % 40) * 20, 8 + (i % 160) * 10), color=(1, 0, 0))
+    return page.get_svg_image(text_as_path=True).replace("&", "&amp;")
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(lines, repeat):
+    svg = make_svg(lines)
+    elements = sum(1 for _ in ET.fromstring(svg).iter())
+    result = {"lines": lines, "svg_bytes": len(svg), "elements": elements}
+    result["legacy"] = best_of(lambda: legacy_rename_id(ET.fromstring(svg), "s1"), repeat)
+    result["single_pass"] = best_of(lambda: rename_ids(ET.fromstring(svg), "s1"), repeat)
+    result["streaming"] = best_of(lambda: parse_with_renamed_ids(svg, "s1"), repeat)
+    result["parse_only"] = best_of(lambda: ET.fromstring(svg), repeat)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SVG id renaming (times include parsing)")
+    parser.add_argument("--lines", type=int, nargs="+", default=[100, 1000, 4000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    results = [run(lines, args.repeat) for lines in args.lines]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print("{elements:>8} elements  parse {parse_only:.3f}s  legacy {legacy:.3f}s  single pass {single_pass:.3f}s  streaming {streaming:.3f}s  speedup x{speedup:.1f}".format(
+                speedup=(r["legacy"] - r["parse_only"]) / max(r["single_pass"] - r["parse_only"], 1e-9), **r))
@@ -0,0 +1,28 @@
+import os
+import sys
+import stat
+import shlex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_launcher(directory, name, script, *args):
+    # an executable that runs script with this interpreter, so it can stand in for ScriptEngine.exe / inkscape.exe
+    if os.name == "nt":
+        path = os.path.join(directory, name + ".cmd")
+        with open(path, "w") as f:
+            f.write('@"{}" "{}" {} %*\r\n'.format(sys.executable, script, " ".join(args)))
+        return path
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write('#!/bin/sh\nexec {} "$@"\n'.format(" ".join(shlex.quote(arg) for arg in (sys.executable, script, *args))))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def install(directory, engine_latency=0.0, command_latency=0.0, inkscape_latency=0.0, export_latency=0.0):
+    # returns the PCETools settings that point at the stand-ins
+    return {
+        "BLUEBEAM_ENGINE_DIR": write_launcher(directory, "ScriptEngine", os.path.join(HERE, "script_engine.py"), "--latency", str(engine_latency), "--command-latency", str(command_latency)),
+        "INKSCAPE_DIRECTORY": write_launcher(directory, "inkscape", os.path.join(HERE, "inkscape.py"), "--latency", str(inkscape_latency), "--export-latency", str(export_latency)),
+    }
@@ -0,0 +1,28 @@
+import sys
+import time
+import argparse
+try:
+    import pymupdf as fitz
+except ImportError:
+    import fitz
+
+# Stand-in for `inkscape --shell`: reads action lines from stdin and renders every file-open / export-filename
+# pair with MuPDF, the same way PyMuPDFConverter does, after the configured latency.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inkscape stand-in for benchmarks")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every invocation")
+    parser.add_argument("--export-latency", type=float, default=0.0, help="seconds added to every exported file")
+    parser.add_argument("--shell", action="store_true")
+    args = parser.parse_args()
+    time.sleep(args.latency)
+    for line in sys.stdin:
+        if line.strip() == "quit":
+            break
+        actions = dict(item.strip().split(":", 1) for item in line.split(";") if ":" in item)
+        if "file-open" not in actions:
+            continue
+        time.sleep(args.export_latency)
+        with fitz.open(actions["file-open"], filetype="svg") as svg_doc:
+            pdf_bytes = svg_doc.convert_to_pdf()
+        with open(actions["export-filename"], "wb") as f:
+            f.write(pdf_bytes)
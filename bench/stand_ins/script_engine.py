@@ -0,0 +1,159 @@
+import os
+import re
+import ast
+import sys
+import json
+import time
+import base64
+import argparse
+
+# Stand-in for Bluebeam's ScriptEngine.exe, implements the commands PCETools sends:
+#   Open, Close, Save, Script, Combine, MarkupGetExList, MarkupCopy, MarkupPaste, MarkupSet
+# Markups live in a "<pdf>.markups.json" sidecar, read from the PDF annotations the first time a file is opened.
+# Every command that returns something prints a count line and the result lines, like ScriptEngine does.
+# stdout is the result channel, so PyMuPDF's "fitz is deprecated" notice must not end up there
+COMMAND = re.compile(r"(\w+)\((.*?)\)(?=\s+\w+\(|\s*$)", re.S)
+
+
+def load_fitz():
+    try:
+        import pymupdf
+        return pymupdf
+    except ImportError:
+        import fitz
+        return fitz
+
+
+def sidecar_path(pdf_path):
+    return pdf_path + ".markups.json"
+
+
+def pdf_stat(pdf_path):
+    stat = os.stat(pdf_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def hex_color(rgb):
+    return "#" + "".join("{:02X}".format(round(c * 255)) for c in (rgb or (0, 0, 0)))
+
+
+def read_annotations(pdf_path):
+    fitz = load_fitz()
+    pages = {}
+    with fitz.open(pdf_path) as doc:
+        for page_id, page in enumerate(doc):
+            markups = {}
+            for annot in page.annots():
+                rect = annot.rect
+                markups[annot.info.get("name") or "{:016X}".format(annot.xref)] = {
+                    "color": hex_color(annot.colors.get("stroke") or annot.colors.get("fill")), "x": "{:.4f}".format(rect.x0), "y": "{:.4f}".format(rect.y0),
+                    "width": "{:.4f}".format(rect.width), "height": "{:.4f}".format(rect.height), "subject": annot.info.get("subject", ""), "comment": annot.info.get("content", "")}
+            pages[str(page_id + 1)] = markups
+    return pages
+
+
+def load_markups(pdf_path):
+    if os.path.exists(sidecar_path(pdf_path)):
+        with open(sidecar_path(pdf_path)) as f:
+            state = json.load(f)
+        if state["stat"] == pdf_stat(pdf_path):
+            return state["pages"]
+    return read_annotations(pdf_path)
+
+
+def save_markups(pdf_path, pages):
+    # touch the PDF like a real Save() would, then record the new stat in the sidecar
+    os.utime(pdf_path)
+    with open(sidecar_path(pdf_path), "w") as f:
+        json.dump({"stat": pdf_stat(pdf_path), "pages": pages}, f)
+
+
+def quote(value):
+    return value.replace("\\", "||||").replace("'", "|'").replace('"', '|"').replace("\r", "||r").replace("\n", "||n")
+
+
+def markup_text(markups):
+    return "{" + ", ".join("'{}': '{{{}}}'".format(k, ", ".join("'{}': '{}'".format(a, quote(str(b))) for a, b in v.items())) for k, v in markups.items()) + "}"
+
+
+def parse_commands(text):
+    commands = []
+    for line in text.splitlines():
+        for name, args in COMMAND.findall(line.strip()):
+            commands.append((name, ast.literal_eval("(" + args + ",)") if args.strip() else ()))
+    return commands
+
+
+class Engine:
+    def __init__(self, command_latency=0.0):
+        self.command_latency = command_latency
+        self.pdf_path = None
+        self.pages = None
+        self.combined = None
+        self.next_id = 0
+        self.out = []
+
+    def result(self, *lines):
+        self.out.append(str(len(lines)))
+        self.out.extend(lines)
+
+    def run(self, commands):
+        for name, args in commands:
+            time.sleep(self.command_latency)
+            if name == "Script":
+                with open(args[0]) as f:
+                    self.run(parse_commands(f.read()))
+            else:
+                getattr(self, name)(*args)
+
+    def Open(self, pdf_path):
+        self.pdf_path, self.pages = pdf_path, load_markups(pdf_path)
+
+    def Close(self):
+        self.pdf_path, self.pages, self.combined = None, None, None
+
+    def Save(self, output=None):
+        if self.combined is not None:
+            self.combined.save(output, garbage=1)
+            self.combined.close()
+            save_markups(output, self.pages)
+            return
+        save_markups(self.pdf_path, self.pages)
+
+    def Combine(self, *pdf_paths):
+        fitz = load_fitz()
+        self.combined, self.pages = fitz.open(), {}
+        for pdf_path in pdf_paths:
+            offset = self.combined.page_count
+            with fitz.open(pdf_path) as doc:
+                self.combined.insert_pdf(doc, annots=False)
+            for page, markups in load_markups(pdf_path).items():
+                self.pages[str(int(page) + offset)] = markups
+
+    def MarkupGetExList(self, page):
+        self.result(markup_text(self.pages.get(str(page), {})))
+
+    def MarkupCopy(self, page, key):
+        self.result(base64.b64encode(json.dumps(self.pages[str(page)][key]).encode("utf-8")).decode("ascii"))
+
+    def MarkupPaste(self, page, content, x, y):
+        markup = dict(json.loads(base64.b64decode(content)), x="{:.4f}".format(x), y="{:.4f}".format(y))
+        self.next_id += 1
+        markup_id = "P{:X}{:04X}".format(time.time_ns(), self.next_id)
+        self.pages.setdefault(str(page), {})[markup_id] = markup
+        self.result(markup_id)
+
+    def MarkupSet(self, page, markup_id, properties):
+        self.pages[str(page)][markup_id].update(json.loads(properties))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ScriptEngine stand-in for benchmarks")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every invocation")
+    parser.add_argument("--command-latency", type=float, default=0.0, help="seconds added to every command")
+    parser.add_argument("command")
+    args = parser.parse_args()
+    time.sleep(args.latency)
+    engine = Engine(args.command_latency)
+    engine.run(parse_commands(args.command))
+    sys.stdout.buffer.write(("\r\n".join(engine.out) + "\r\n").encode("utf-8"))
@@ -0,0 +1,77 @@
+import random
+import fitz
+
+# Synthetic drawings for the benchmarks: an A1 sheet with a title block, dense vector content and
+# rectangle annotations the ScriptEngine stand-in reports as markups.
+A1 = (2384, 1684)
+PALETTE = [(1, 0, 0), (0, 0, 1), (0, 0.6, 0), (0.3, 0.3, 0.3)]
+REVISION_ROWS = 5
+REVISION_COLUMNS = (1900, 1960, 2200)
+REVISION_TOP = 1500
+ROW_HEIGHT = 20
+
+
+def hex_to_rgb(hex_color):
+    return tuple(int(hex_color[i:i + 2], 16) / 255 for i in (1, 3, 5))
+
+
+def add_markup(page, rect, color, comment, subject="Text Box"):
+    annot = page.add_rect_annot(rect)
+    annot.set_colors(stroke=color)
+    annot.set_info(content=comment, subject=subject)
+    annot.update()
+
+
+def draw_title_block(page, size):
+    width, height = size
+    shape = page.new_shape()
+    shape.draw_rect(fitz.Rect(20, 20, width - 20, height - 20))
+    shape.draw_rect(fitz.Rect(width - 520, height - 300, width - 20, height - 20))
+    for i in range(1, 14):
+        shape.draw_line((width - 520, height - 300 + i * 20), (width - 20, height - 300 + i * 20))
+    shape.finish(color=(0, 0, 0), width=1)
+    shape.commit()
+    for i in range(13):
+        page.insert_text((width - 510, height - 286 + i * 20), "PCE ENGINEERING  DRAWING FIELD {}".format(i), fontsize=8)
+
+
+def draw_vectors(page, size, density, rnd):
+    # density line segments, grouped in a few paths per color like a CAD export
+    width, height = size
+    shape = page.new_shape()
+    for color in PALETTE:
+        for _ in range(density // len(PALETTE)):
+            x, y = rnd.uniform(40, width - 560), rnd.uniform(40, height - 40)
+            shape.draw_line((x, y), (x + rnd.uniform(-60, 60), y + rnd.uniform(-60, 60)))
+        shape.finish(color=color, width=0.5)
+    shape.commit()
+
+
+def make_drawing(path, pages=1, annotations=200, density=2000, anchors=(("#7A0000", (100, 100)), ), revisions=False, seed=0, size=A1):
+    # anchors: (color, (x, y)) markups every page gets, revisions=True adds a revision table to the title block
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    for page_id in range(pages):
+        page = doc.new_page(width=size[0], height=size[1])
+        draw_title_block(page, size)
+        draw_vectors(page, size, density, rnd)
+        for color, (x, y) in anchors:
+            add_markup(page, fitz.Rect(x, y, x + 40, y + 12), hex_to_rgb(color), "ANCHOR", "Rectangle")
+        for i in range(annotations):
+            x, y = rnd.uniform(40, size[0] - 600), rnd.uniform(40, size[1] - 60)
+            add_markup(page, fitz.Rect(x, y, x + 80, y + 12), (0, 0, 0), "NOTE {} ON PAGE {}".format(i, page_id + 1))
+        if revisions:
+            for row in range(REVISION_ROWS):
+                y = REVISION_TOP - row * ROW_HEIGHT
+                for column, text in zip(REVISION_COLUMNS, ("R{}".format(row), "ISSUED FOR REVIEW", "2024-01-0{}".format(row + 1))):
+                    add_markup(page, fitz.Rect(column, y, column + 50, y + 12), (0, 0, 0), text)
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+    return path
+
+
+def revision_context():
+    # get_structured_markups_from context for the revision table make_drawing(..., revisions=True) draws
+    first = {"$TYPE": "while-list", "$UPLIFT_SIZE": (0, -ROW_HEIGHT)}
+    first.update({name: (column, REVISION_TOP) for name, column in zip(("REV", "DESCRIPTION", "DATE"), REVISION_COLUMNS)})
+    return {"REVISIONS": first}
@@ -0,0 +1,94 @@
+import os
+import threading
+
+
+def _position(markup):
+    try:
+        return float(markup["x"]), float(markup["y"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class AnchorIndex:
+    # positions of the markups of a whole document by color and by subject, built from one
+    # return_markups_for_document result ({page: {id: markup}}); a page's positions keep the markup order
+    def __init__(self, markups_by_page):
+        self.pages = {}
+        for page, markups in markups_by_page.items():
+            by_key = {}
+            for markup in markups.values():
+                position = _position(markup)
+                if position is None:
+                    continue
+                for field in ("color", "subject"):
+                    value = str(markup.get(field) or "").strip().lower()
+                    if value:
+                        by_key.setdefault((field, value), []).append(position)
+            self.pages[page] = by_key
+
+    def __len__(self):
+        return len(self.pages)
+
+    def positions(self, page, color=None, subject=None):
+        field, value = ("color", color) if color is not None else ("subject", subject)
+        return self.pages.get(page, {}).get((field, str(value).strip().lower()), [])
+
+    def anchor(self, page, color=None, subject=None):
+        # the first matching markup, like the page by page search it replaces
+        positions = self.positions(page, color, subject)
+        assert len(positions) > 0, "expected markup with the {} {} on page {}".format("color" if color is not None else "subject", color or subject, page)
+        return positions[0]
+
+
+class AnchorCache:
+    # AnchorIndex per file, dropped when the file's mtime / size change or on invalidate()
+    def __init__(self, max_files=256):
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self._files = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(file_dir):
+        return os.path.normcase(os.path.abspath(file_dir))
+
+    @staticmethod
+    def _signature(file_dir):
+        stat = os.stat(file_dir)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, file_dir, build):
+        # build(file_dir) -> {page: markups} runs on a miss, outside the lock so files build in parallel
+        key, signature = self._key(file_dir), self._signature(file_dir)
+        with self._lock:
+            cached = self._files.get(key)
+            if cached is not None and cached[0] == signature:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        index = AnchorIndex(build(file_dir))
+        with self._lock:
+            self._files.pop(key, None)
+            self._files[key] = (signature, index)
+            while len(self._files) > self.max_files:
+                self._files.pop(next(iter(self._files)))
+        return index
+
+    def invalidate(self, file_dir=None):
+        with self._lock:
+            if file_dir is None:
+                self._files.clear()
+            else:
+                self._files.pop(self._key(file_dir), None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "files": len(self._files)}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits, self.misses = 0, 0
+
+
+anchor_cache = AnchorCache()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from .engine import EngineExecutor
+
+logger = logging.getLogger(__name__)
+
+# PCETools calls a manifest step may use
+OPERATIONS = ("mix_patch", "pdf_set_color_v2", "pdf_set_color_v3", "paste_markup_to_file", "paste_all_markup_to_file_by_anchor",
+              "set_structured_markups", "set_markup", "set_replace", "combine_pdf", "resize_pdf", "split_pdf", "pdf_content_move")
+
+
+def load_manifest(path):
+    # {"workers": 4, "jobs": [{"id": "sheet-001", "file": "out/001.pdf", "steps": [{"op": "pdf_set_color_v2", "args": {...}}]}]}
+    # or just the list of jobs, as JSON or (with PyYAML installed) YAML
+    with open(path, encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            import yaml
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+    ids = [job["id"] for job in manifest["jobs"]]
+    assert len(ids) == len(set(ids)), "job ids must be unique"
+    for job in manifest["jobs"]:
+        for step in job["steps"]:
+            assert step["op"] in OPERATIONS, "{}: unknown operation {}".format(job["id"], step["op"])
+    return manifest
+
+
+def step_key(step):
+    # a step whose op or args changed since it was journaled runs again
+    return hashlib.sha1(json.dumps(step, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Journal:
+    # JSON lines of finished steps, appended and flushed one at a time so a crash loses at most the step it was in
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                data = f.read()
+                # every record ends with a newline, anything after the last one is a line a crash cut short: cut it
+                # off, or the next record would be appended to it and be lost as well
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    f.truncate(end)
+            for line in data[:end].decode("utf-8").splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("status") == "done":
+                    self.done.add((record["job"], record["step"], record["key"]))
+        self._file = open(path, "a", encoding="utf-8")
+
+    def is_done(self, job_id, index, key):
+        return (job_id, index, key) in self.done
+
+    def record(self, **record):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if record["status"] == "done":
+                self.done.add((record["job"], record["step"], record["key"]))
+
+    def close(self):
+        self._file.close()
+
+
+class BatchRunner:
+    # Runs the jobs of a manifest on a worker pool. A job's steps run in order, and jobs naming the same "file" run
+    # one after another in manifest order (EngineExecutor), so they never write the same PDF at once. Steps in the
+    # journal are skipped; a failed step stops the rest of its job.
+    def __init__(self, manifest, journal_path, workers=None, tools=None):
+        if tools is None:
+            from .pce_tool import PCETools as tools
+        self.manifest = manifest
+        self.tools = tools
+        self.workers = workers or manifest.get("workers", 4)
+        self.journal_path = journal_path
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def _stage(self, op):
+        return self.stages.setdefault(op, {"steps": 0, "skipped": 0, "errors": 0, "busy": 0.0, "first": None, "last": None})
+
+    def _run_job(self, job, journal):
+        for index, step in enumerate(job["steps"]):
+            key = step_key(step)
+            if journal.is_done(job["id"], index, key):
+                with self._lock:
+                    self._stage(step["op"])["skipped"] += 1
+                continue
+            start = time.time()
+            try:
+                getattr(self.tools, step["op"])(**step.get("args", {}))
+            except Exception as e:
+                end = time.time()
+                logger.error("batch: job {} step {} ({}) failed: {}".format(job["id"], index, step["op"], e))
+                journal.record(job=job["id"], step=index, key=key, op=step["op"], status="error", error=repr(e), start=start, duration=end - start)
+                with self._lock:
+                    self._stage(step["op"])["errors"] += 1
+                raise
+            end = time.time()
+            journal.record(job=job["id"], step=index, key=key, op=step["op"], status="done", start=start, duration=end - start)
+            with self._lock:
+                stage = self._stage(step["op"])
+                stage["steps"] += 1
+                stage["busy"] += end - start
+                stage["first"] = start if stage["first"] is None else min(stage["first"], start)
+                stage["last"] = end if stage["last"] is None else max(stage["last"], end)
+            logger.info("batch: job {} step {} ({}) done in {:.2f}s".format(job["id"], index, step["op"], end - start))
+
+    def run(self):
+        # returns {"jobs": {id: "done" | "failed"}, "stages": {op: throughput}, "elapsed": seconds}
+        journal = Journal(self.journal_path)
+        executor = EngineExecutor(self.workers)
+        start = time.time()
+        try:
+            futures = {job["id"]: executor.submit(job.get("file"), self._run_job, job, journal) for job in self.manifest["jobs"]}
+            jobs = {job_id: "failed" if future.exception() is not None else "done" for job_id, future in futures.items()}
+        finally:
+            executor.shutdown()
+            journal.close()
+        return {"jobs": jobs, "stages": {op: self._throughput(stage) for op, stage in self.stages.items()}, "elapsed": time.time() - start}
+
+    @staticmethod
+    def _throughput(stage):
+        # per_second: steps over the wall time from the first start to the last end of the stage
+        wall = 0.0 if stage["first"] is None else stage["last"] - stage["first"]
+        return {"steps": stage["steps"], "skipped": stage["skipped"], "errors": stage["errors"], "busy": stage["busy"], "wall": wall,
+                "per_second": stage["steps"] / wall if wall > 0 else None}
+
+
+def run_manifest(path, journal_path=None, workers=None):
+    # the journal sits next to the manifest unless told otherwise, a second run picks up where the first stopped
+    journal_path = path + ".journal.jsonl" if journal_path is None else journal_path
+    return BatchRunner(load_manifest(path), journal_path, workers).run()
+
+
+def format_report(report):
+    lines = ["{} jobs, {} failed, {:.1f}s".format(len(report["jobs"]), sum(1 for s in report["jobs"].values() if s == "failed"), report["elapsed"])]
+    for op, stage in sorted(report["stages"].items()):
+        rate = "-" if stage["per_second"] is None else "{:.2f}/s".format(stage["per_second"])
+        lines.append("{:>36} {:>5} done {:>5} skipped {:>3} errors {:>9.2f}s busy {:>10}".format(op, stage["steps"], stage["skipped"], stage["errors"], stage["busy"], rate))
+    return "\n".join(lines)
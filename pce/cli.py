@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+# The pce command. Only argparse and logging are loaded up front: every subcommand imports what it needs
+# (fitz, pypdf, the Google client, ...) when it runs, so `pce --help` and `pce upload` stay cheap.
+logger = logging.getLogger("pce")
+
+
+def parse_pages(text):
+    # "1,3-5" -> [1, 3, 4, 5], 1-based like Bluebeam
+    pages = []
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        pages.extend(range(int(first), int(last or first) + 1))
+    return pages
+
+
+def _tools(args):
+    from .pce_tool import PCETools
+    for attr, value in (("BLUEBEAM_ENGINE_DIR", args.engine), ("INKSCAPE_DIRECTORY", args.inkscape), ("TEMP_PATH", args.temp)):
+        if value is not None:
+            setattr(PCETools, attr, value)
+    if args.svg_cache is not None:
+        PCETools.SetSVGCache(args.svg_cache)
+    return PCETools
+
+
+def combine(args):
+    _tools(args).combine_pdf(args.inputs, args.output, backend=args.backend)
+
+
+def recolor(args):
+    PCETools = _tools(args)
+    pages = parse_pages(args.pages) if args.pages else range(1, PCETools.page_count(args.input) + 1)
+    stats = PCETools.pdf_set_color_v3(args.input, [p - 1 for p in pages], args.pre_color, args.post_color, args.output, args.opacity, args.tolerance)
+    print("{} color operators changed on {} pages".format(sum(stats.values()), len(stats)))
+
+
+def mix(args):
+    _tools(args).mix_patch(args.standard_form, args.layers, args.output, workers=args.workers)
+
+
+def resize(args):
+    _tools(args).resize_pdf(args.input, args.input_scale, args.input_width, args.input_height, args.output_scale, args.output_width, args.output_height, args.output)
+
+
+def markups(args):
+    result = _tools(args).return_markups_for_document(args.input, parse_pages(args.pages) if args.pages else None)
+    if args.output is None:
+        json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+def colors(args):
+    result = _tools(args).pdf_color_inventory(args.input, [p - 1 for p in parse_pages(args.pages)] if args.pages else None, args.workers)
+    # 1-based pages in the output, like --pages
+    result["pages"] = {page_number + 1: counts for page_number, counts in result["pages"].items()}
+    if args.output is None:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+def upload(args):
+    from datetime import timedelta
+    from .google_drive import GoogleDrive
+    drive = GoogleDrive(args.credentials, cache_file=args.cache)
+    expiration = None if args.expires_days is None else timedelta(days=args.expires_days)
+    for link in drive.upload_many_for_someone_read(args.files, expirationTime=expiration, emailAddress=args.email, workers=args.workers):
+        print(link)
+
+
+def batch(args):
+    from .batch import run_manifest, format_report
+    report = run_manifest(args.manifest, args.journal, args.workers)
+    print(format_report(report))
+    if args.report is not None:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if any(status == "failed" for status in report["jobs"].values()):
+        raise RuntimeError("{} job(s) failed, run again to retry them".format(sum(1 for s in report["jobs"].values() if s == "failed")))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pce", description="PCETools from the command line")
+    parser.add_argument("--log-level", default=os.environ.get("PCE_LOG_LEVEL", "WARNING"), help="logging level (default: $PCE_LOG_LEVEL or WARNING)")
+    parser.add_argument("--log-file", default=os.environ.get("PCE_LOG_FILE"), help="log here instead of stderr")
+    parser.add_argument("--trace", metavar="JSONL", help="write a span for every external call and stage to this file")
+    parser.add_argument("--engine", default=os.environ.get("PCE_BLUEBEAM_ENGINE_DIR"), help="ScriptEngine.exe")
+    parser.add_argument("--inkscape", default=os.environ.get("PCE_INKSCAPE_DIRECTORY"), help="inkscape.exe")
+    parser.add_argument("--temp", default=os.environ.get("PCE_TEMP_PATH"), help="directory for intermediate files")
+    parser.add_argument("--svg-cache", help="directory of the page SVG cache (default: $PCE_SVG_CACHE, none)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("combine", help="combine PDFs into one")
+    command.add_argument("inputs", nargs="+")
+    command.add_argument("-o", "--output", required=True)
+    command.add_argument("--backend", choices=["auto", "native", "bluebeam"])
+    command.set_defaults(func=combine)
+
+    command = commands.add_parser("recolor", help="replace a color in the page content")
+    command.add_argument("input")
+    command.add_argument("pre_color", help="#RRGGBB")
+    command.add_argument("post_color", help="#RRGGBB")
+    command.add_argument("-o", "--output", required=True)
+    command.add_argument("--pages", help="e.g. 1,3-5 (default: all)")
+    command.add_argument("--opacity", type=float, default=1.0)
+    command.add_argument("--tolerance", type=int, default=0)
+    command.set_defaults(func=recolor)
+
+    command = commands.add_parser("mix", help="mix drawings onto a standard form by their anchor markups")
+    command.add_argument("standard_form")
+    command.add_argument("layers", nargs="+")
+    command.add_argument("-o", "--output", required=True)
+    command.add_argument("--workers", type=int, default=1)
+    command.set_defaults(func=mix)
+
+    command = commands.add_parser("resize", help="change page size and drawing scale")
+    command.add_argument("input")
+    for name in ("input_scale", "input_width", "input_height", "output_scale", "output_width", "output_height"):
+        command.add_argument("--" + name.replace("_", "-"), dest=name, required=True)
+    command.add_argument("-o", "--output", required=True)
+    command.set_defaults(func=resize)
+
+    command = commands.add_parser("markups", help="print the markups of a document as JSON")
+    command.add_argument("input")
+    command.add_argument("--pages", help="e.g. 1,3-5 (default: all)")
+    command.add_argument("-o", "--output")
+    command.set_defaults(func=markups)
+
+    command = commands.add_parser("colors", help="print the fill / stroke colors of every page and the document as JSON")
+    command.add_argument("input")
+    command.add_argument("--pages", help="e.g. 1,3-5 (default: all)")
+    command.add_argument("--workers", type=int, default=1)
+    command.add_argument("-o", "--output")
+    command.set_defaults(func=colors)
+
+    command = commands.add_parser("upload", help="upload files to Google Drive and print their download links")
+    command.add_argument("files", nargs="+")
+    command.add_argument("--credentials", default=os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"), help="service account file")
+    command.add_argument("--email", help="share with this user instead of anyone with the link")
+    command.add_argument("--expires-days", type=float)
+    command.add_argument("--workers", type=int, default=4)
+    command.add_argument("--cache", help="SQLite file for the Drive metadata cache")
+    command.set_defaults(func=upload)
+
+    command = commands.add_parser("batch", help="run a JSON / YAML manifest of operations, resuming from its journal")
+    command.add_argument("manifest")
+    command.add_argument("--journal", help="checkpoint journal (default: <manifest>.journal.jsonl)")
+    command.add_argument("--workers", type=int)
+    command.add_argument("--report", help="write the throughput report as JSON")
+    command.set_defaults(func=batch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), filename=args.log_file, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        if args.trace is None:
+            args.func(args)
+        else:
+            from .tracing import trace
+            with trace(args.trace):
+                args.func(args)
+    except Exception as e:
+        logger.debug("pce %s failed", args.command, exc_info=True)
+        print("pce {}: {}: {}".format(args.command, type(e).__name__, e), file=sys.stderr)
+        return 1
+    return 0
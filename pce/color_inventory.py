@@ -0,0 +1,178 @@
+import re
+from collections import Counter
+import fitz
+from .pipeline import imap_bounded, chunked
+
+# Color operators straight from the content streams, no SVG rendering. Strings, hex strings, comments and inline
+# images are blanked out first, so color-like text inside them isn't counted; the rest is split into tokens and an
+# operator's operands are the numbers right before it.
+_DELIMITER = rb"\s\[\]()<>/{}%"
+_OTHERS = rb"<[^<>]*>|%[^\r\n]*"
+_IMAGES = rb"|(?<![^" + _DELIMITER + rb"])BI\s.*?\sEI(?![^" + _DELIMITER + rb"])"
+_STRINGS = re.compile(rb"\((?:\\.|[^\\()])*\)|" + _OTHERS)
+# the inline image branch makes the scan several times slower, it only runs on streams that may have one
+_STRINGS_AND_IMAGES = re.compile(_STRINGS.pattern + _IMAGES, re.S)
+# a literal string may hold balanced parentheses, (a (b) c); the regexes can't count them, _blank_nested does
+_NESTED = re.compile(rb"\((?:\\.|[^\\()])*\(")
+_OPENERS = re.compile(rb"\(|" + _OTHERS + _IMAGES, re.S)
+_PARENTHESES = re.compile(rb"\\.|[()]", re.S)
+# operand count -> color model for each operator, sc / scn are read by their operand count
+_MODELS = {b"g": {1: "gray"}, b"rg": {3: "rgb"}, b"k": {4: "cmyk"}, b"sc": {1: "gray", 3: "rgb", 4: "cmyk"}, b"scn": {1: "gray", 3: "rgb", 4: "cmyk"}}
+_MODELS.update({op.upper(): models for op, models in list(_MODELS.items())})
+_NUMBER_START = frozenset(b"0123456789.+-")
+
+
+def to_hex(values, model):
+    # "#RRGGBB" for gray / rgb / cmyk operands in 0..1, cmyk through the naive conversion
+    if model == "gray":
+        values = values * 3
+    elif model == "cmyk":
+        c, m, y, k = values
+        values = [(1 - c) * (1 - k), (1 - m) * (1 - k), (1 - y) * (1 - k)]
+    return "#{:02X}{:02X}{:02X}".format(*(min(255, max(0, round(v * 255))) for v in values))
+
+
+def _empty():
+    return {"fill": {}, "stroke": {}}
+
+
+def _add(counts, other):
+    for kind in ("fill", "stroke"):
+        for color, n in other[kind].items():
+            counts[kind][color] = counts[kind].get(color, 0) + n
+    return counts
+
+
+def _operands(tokens):
+    # the numbers at the end of the (up to 4) tokens before an operator
+    operands = []
+    for token in reversed(tokens):
+        if not token or token[0] not in _NUMBER_START:
+            break
+        operands.append(float(token))
+    return operands[::-1]
+
+
+def _blank_nested(data):
+    # data with its strings, comments and inline images blanked, literal strings up to their balancing ")"
+    parts, pos = [], 0
+    while True:
+        match = _OPENERS.search(data, pos)
+        if match is None:
+            break
+        parts += [data[pos:match.start()], b" "]
+        pos, depth = match.end(), 1 if match.group() == b"(" else 0
+        while depth > 0:
+            paren = _PARENTHESES.search(data, pos)
+            if paren is None:
+                pos = len(data)
+                break
+            pos = paren.end()
+            if paren.group() == b"(":
+                depth += 1
+            elif paren.group() == b")":
+                depth -= 1
+    parts.append(data[pos:])
+    return b"".join(parts)
+
+
+def _scan(data):
+    # (color counts, names of the XObjects drawn with Do, once per use) of one content stream
+    if b"(" in data and _NESTED.search(data) is not None:
+        data = _blank_nested(data)
+    elif b"BI" in data:
+        data = _STRINGS_AND_IMAGES.sub(b" ", data)
+    elif b"(" in data or b"<" in data or b"%" in data:
+        data = _STRINGS.sub(b" ", data)
+    tokens = [b""] * 4 + data.replace(b"/", b" /").replace(b"[", b" [ ").replace(b"]", b" ] ").split()
+    # count the operators as written, with the 4 tokens before them, and convert each distinct one once
+    written = Counter([(op, *tokens[i - 4:i]) for i, op in enumerate(tokens) if op in _MODELS])
+    counts = _empty()
+    for (op, *before), n in written.items():
+        try:
+            operands = _operands(before)
+        except ValueError:
+            continue
+        model = _MODELS[op].get(len(operands))
+        if model is not None:
+            kind = counts["fill" if op.islower() else "stroke"]
+            color = to_hex(operands, model)
+            kind[color] = kind.get(color, 0) + n
+    drawn = [tokens[i - 1][1:].decode("latin-1") for i, op in enumerate(tokens) if op == b"Do" and tokens[i - 1][:1] == b"/"] if b"Do" in data else []
+    return counts, drawn
+
+
+def stream_colors(data):
+    # {"fill": {"#RRGGBB": operators}, "stroke": {...}} for one content stream
+    return _scan(data)[0]
+
+
+def _is_form(doc, xref):
+    return doc.xref_get_key(xref, "Subtype") == ("name", "/Form")
+
+
+def _open(input_file):
+    return fitz.open("pdf", input_file) if isinstance(input_file, (bytes, bytearray)) else fitz.open(input_file)
+
+
+def _scan_pages(task):
+    # ({page_number: (counts of its own content, form xrefs it draws, once per Do)}, {form xref: (counts, form xrefs
+    # it draws)}) for a range of pages. Only forms a content stream draws count, not everything in the resources
+    input_file, page_numbers = task
+    pages, forms = {}, {}
+    with _open(input_file) as doc:
+        for page_number in page_numbers:
+            page = doc[page_number]
+            # (xref of the form whose resources hold the name, 0 for the page, name) -> xref
+            resources = {(invoker, name): xref for xref, name, invoker, _ in page.get_xobjects()}
+
+            def resolve(invoker, names):
+                # a form without resources of its own uses the page's
+                xrefs = [resources.get((invoker, name), resources.get((0, name))) for name in names]
+                return [xref for xref in xrefs if xref is not None and _is_form(doc, xref)]
+            counts, drawn = _scan(page.read_contents())
+            pages[page_number] = (counts, resolve(0, drawn))
+            queue = list(dict.fromkeys(pages[page_number][1]))
+            while queue:
+                xref = queue.pop()
+                if xref in forms:
+                    continue
+                counts, drawn = _scan(doc.xref_stream(xref))
+                forms[xref] = (counts, resolve(xref, drawn))
+                queue.extend(forms[xref][1])
+    return pages, forms
+
+
+def color_inventory(input_file, page_numbers=None, workers=1, chunk_size=None):
+    # page_numbers are 0-based, all pages by default; workers > 1 scans chunks of pages in a process pool.
+    # Returns {"pages": {page_number: counts}, "document": counts}, counts being {"fill": {"#RRGGBB": operators},
+    # "stroke": {...}}. Colors count as drawn: a form XObject counts as often as a page draws it, and "document" is
+    # the sum of the pages.
+    with _open(input_file) as doc:
+        page_count = doc.page_count
+    page_numbers = range(page_count) if page_numbers is None else sorted(p for p in set(page_numbers) if 0 <= p < page_count)
+    if chunk_size is None:
+        chunk_size = max(1, min(64, len(page_numbers) // max(workers, 1)))
+    scanned, forms = {}, {}
+    for chunk_pages, chunk_forms in imap_bounded(_scan_pages, [(input_file, chunk) for chunk in chunked(page_numbers, chunk_size)], workers):
+        scanned.update(chunk_pages)
+        forms.update(chunk_forms)
+    totals = {}
+
+    def total(xref, active=()):
+        # a form's colors with everything it draws; a form drawing itself is a broken file, the loop is cut
+        if xref not in totals:
+            counts = _add(_empty(), forms[xref][0])
+            for child in forms[xref][1]:
+                if child not in active:
+                    _add(counts, total(child, active + (xref, )))
+            totals[xref] = counts
+        return totals[xref]
+    pages, document = {}, _empty()
+    for page_number in page_numbers:
+        content, drawn = scanned[page_number]
+        pages[page_number] = _add(_empty(), content)
+        for xref in drawn:
+            _add(pages[page_number], total(xref))
+        _add(document, pages[page_number])
+    return {"pages": pages, "document": document}
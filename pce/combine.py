@@ -0,0 +1,45 @@
+import io
+import fitz
+
+
+def _open_input(item):
+    # returns (document, owned), documents passed in by the caller are not closed here
+    if isinstance(item, fitz.Document):
+        return item, False
+    if isinstance(item, (bytes, bytearray)):
+        return fitz.open("pdf", bytes(item)), True
+    if isinstance(item, io.IOBase):
+        return fitz.open("pdf", item.read()), True
+    return fitz.open(item), True
+
+
+def is_path(item):
+    return isinstance(item, str) or hasattr(item, '__fspath__')
+
+
+def has_annotations(inputs):
+    for item in inputs:
+        doc, owned = _open_input(item)
+        try:
+            if any(page.first_annot is not None for page in doc):
+                return True
+        finally:
+            if owned:
+                doc.close()
+    return False
+
+
+def combine_documents(inputs, output=None, garbage=4, deflate=True):
+    # output=None returns the combined fitz.Document, otherwise it is saved to a path or file object
+    combined = fitz.open()
+    for item in inputs:
+        doc, owned = _open_input(item)
+        combined.insert_pdf(doc)
+        if owned:
+            doc.close()
+    if output is None:
+        return combined
+    # garbage=3 merges duplicate objects, 4 also duplicate streams such as fonts shared by the inputs
+    combined.save(output, garbage=garbage, deflate=deflate)
+    combined.close()
+    return output
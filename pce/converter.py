@@ -0,0 +1,128 @@
+import os
+import abc
+import subprocess
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import fitz
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _chunks(items, n):
+    n = max(1, min(n, len(items)))
+    return [items[i::n] for i in range(n)]
+
+
+def svg_bytes(src):
+    # SVG content as bytes, src is SVG text / bytes or a path to an .svg file
+    if isinstance(src, (bytes, bytearray)):
+        return bytes(src)
+    if src.lstrip().startswith('<'):
+        return src.encode('utf-8')
+    with open(src, 'rb') as f:
+        return f.read()
+
+
+class SVGConverter(abc.ABC):
+    def __init__(self, workers=1):
+        self.workers = workers
+
+    def convert(self, src, dest):
+        self.convert_many([src], [dest])
+
+    def convert_many(self, src_list, dest_list):
+        assert len(src_list) == len(dest_list), "src and dest count mismatch"
+        if len(src_list) == 0:
+            return
+        self._convert_batch(list(zip(src_list, dest_list)))
+        missing = [dest for dest in dest_list if not os.path.exists(dest)]
+        if len(missing) > 0:
+            raise RuntimeError("{} failed to convert {} file(s): {}".format(type(self).__name__, len(missing), missing))
+
+    def convert_bytes(self, svg_list):
+        # SVG contents in, PDF bytes out; backends that need files keep them in a private temp dir
+        with tempfile.TemporaryDirectory(prefix="pce_svg_") as tmp:
+            src_list = [os.path.join(tmp, f"{i}.svg") for i in range(len(svg_list))]
+            dest_list = [os.path.join(tmp, f"{i}.pdf") for i in range(len(svg_list))]
+            for src, svg in zip(src_list, svg_list):
+                with open(src, 'wb') as f:
+                    f.write(svg_bytes(svg))
+            self.convert_many(src_list, dest_list)
+            result = []
+            for dest in dest_list:
+                with open(dest, 'rb') as f:
+                    result.append(f.read())
+        return result
+
+    @abc.abstractmethod
+    def _convert_batch(self, pairs):
+        # writes every (src, dest) pair, src an .svg path and dest the .pdf path
+        pass
+
+
+class InkscapeConverter(SVGConverter):
+    # one `inkscape --shell` per worker, every page is an action line instead of a new process
+    def __init__(self, inkscape_path, workers=1):
+        super().__init__(workers)
+        self.inkscape_path = inkscape_path
+
+    @staticmethod
+    def _actions(src, dest):
+        return f"file-open:{src}; export-type:pdf; export-filename:{dest}; export-do; file-close"
+
+    def _run_shell(self, pairs):
+        script = '\n'.join([self._actions(src, dest) for src, dest in pairs] + ["quit", ""])
+        logger.info("inkscape shell: {} file(s)".format(len(pairs)))
+        with tracer.span("inkscape.shell", pages=len(pairs), command_length=len(script)):
+            subprocess.run([self.inkscape_path, "--shell"], input=script.encode('utf-8'), stdout=subprocess.DEVNULL, check=True)
+
+    def _convert_batch(self, pairs):
+        chunks = _chunks(pairs, self.workers)
+        if len(chunks) == 1:
+            self._run_shell(chunks[0])
+            return
+        with ThreadPoolExecutor(len(chunks)) as pool:
+            list(pool.map(self._run_shell, chunks))
+
+
+def _pymupdf_to_pdf(svg):
+    with fitz.open(stream=svg_bytes(svg), filetype="svg") as svg_doc:
+        return svg_doc.convert_to_pdf()
+
+
+def _pymupdf_convert(pairs):
+    for src, dest in pairs:
+        pdf_bytes = _pymupdf_to_pdf(src)
+        with open(dest, 'wb') as f:
+            f.write(pdf_bytes)
+
+
+def _pymupdf_convert_bytes(svg_list):
+    return [_pymupdf_to_pdf(svg) for svg in svg_list]
+
+
+class PyMuPDFConverter(SVGConverter):
+    # no external tool, MuPDF renders the SVG straight into a PDF page
+    def _convert_batch(self, pairs):
+        chunks = _chunks(pairs, self.workers)
+        if len(chunks) == 1:
+            _pymupdf_convert(chunks[0])
+            return
+        with ProcessPoolExecutor(len(chunks)) as pool:
+            list(pool.map(_pymupdf_convert, chunks))
+
+    def convert_bytes(self, svg_list):
+        if self.workers <= 1 or len(svg_list) <= 1:
+            return _pymupdf_convert_bytes(svg_list)
+        # contiguous chunks, so the results can simply be concatenated in order
+        size = -(-len(svg_list) // self.workers)
+        with ProcessPoolExecutor(self.workers) as pool:
+            return [pdf for chunk in pool.map(_pymupdf_convert_bytes, [svg_list[i:i + size] for i in range(0, len(svg_list), size)]) for pdf in chunk]
+
+
+CONVERTERS = {
+    "inkscape": lambda tools, workers: InkscapeConverter(tools.INKSCAPE_DIRECTORY, workers),
+    "pymupdf": lambda tools, workers: PyMuPDFConverter(workers),
+}
@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+import fitz
+
+
+class DocumentCache:
+    # Shared fitz handles by path. Handles that leave the cache (least recently used, the file changed on disk or
+    # invalidate()) are only dropped, never closed: another thread may still be reading them, they close once the
+    # last user lets go.
+    def __init__(self, max_handles=16):
+        self.max_handles = max_handles
+        self.hits = 0
+        self.misses = 0
+        self._docs = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(pdf_path):
+        return os.path.normcase(os.path.abspath(pdf_path))
+
+    @staticmethod
+    def _signature(pdf_path):
+        stat = os.stat(pdf_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def open(self, pdf_path):
+        key, signature = self._key(pdf_path), self._signature(pdf_path)
+        with self._lock:
+            cached = self._docs.get(key)
+            if cached is not None:
+                if cached[0] == signature and not cached[1].is_closed:
+                    self._docs.move_to_end(key)
+                    self.hits += 1
+                    return cached[1]
+                # stale handle, the file changed on disk
+                del self._docs[key]
+            self.misses += 1
+            doc = fitz.open(pdf_path)
+            self._docs[key] = (signature, doc)
+            while len(self._docs) > self.max_handles:
+                self._docs.popitem(last=False)
+            return doc
+
+    def signature(self, pdf_path, doc):
+        # (mtime_ns, size) pdf_path had when doc was opened, None once doc is no longer its cached handle
+        with self._lock:
+            cached = self._docs.get(self._key(pdf_path))
+        return cached[0] if cached is not None and cached[1] is doc else None
+
+    def invalidate(self, pdf_path=None):
+        with self._lock:
+            if pdf_path is None:
+                self._docs.clear()
+            else:
+                self._docs.pop(self._key(pdf_path), None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "open": len(self._docs), "max_handles": self.max_handles}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, pdf_path):
+        return self._key(pdf_path) in self._docs
+
+
+document_cache = DocumentCache()
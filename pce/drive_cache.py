@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import threading
+
+
+class DriveMetadataCache:
+    # Local SQLite copy of the Drive file metadata GoogleDrive sees, kept current through the changes feed
+    # (GoogleDrive.refresh_cache), so name -> id lookups don't need a request. path=":memory:" for a throwaway cache.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS files (id TEXT PRIMARY KEY, name TEXT, md5Checksum TEXT, data TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_name ON files (name)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+
+    def page_token(self):
+        # changes feed position of the last refresh, None before the first one
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = 'page_token'").fetchone()
+        return None if row is None else row[0]
+
+    def _set_token(self, token):
+        self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('page_token', ?)", (token, ))
+
+    def _put(self, file):
+        self._db.execute("INSERT OR REPLACE INTO files (id, name, md5Checksum, data) VALUES (?, ?, ?, ?)",
+                         (file["id"], file.get("name"), file.get("md5Checksum"), json.dumps(file)))
+
+    def replace(self, files, token):
+        # full listing: everything in files, nothing else
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files")
+            for file in files:
+                self._put(file)
+            self._set_token(token)
+
+    def apply(self, changes, token):
+        # one page of the changes feed, stored together with the token that follows it
+        with self._lock, self._db:
+            for change in changes:
+                file = change.get("file")
+                if change.get("removed") or file is None or file.get("trashed"):
+                    self._db.execute("DELETE FROM files WHERE id = ?", (change["fileId"], ))
+                else:
+                    self._put(file)
+            self._set_token(token)
+
+    def put(self, file):
+        with self._lock, self._db:
+            self._put(file)
+
+    def remove(self, file_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE id = ?", (file_id, ))
+
+    def get(self, file_id):
+        with self._lock:
+            row = self._db.execute("SELECT data FROM files WHERE id = ?", (file_id, )).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def find(self, name, md5Checksum=None):
+        # files called name (and with that content when md5Checksum is given), oldest first
+        query, params = "SELECT data FROM files WHERE name = ?", [name]
+        if md5Checksum is not None:
+            query, params = query + " AND md5Checksum = ?", params + [md5Checksum]
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY rowid", params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files")
+            self._db.execute("DELETE FROM state")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
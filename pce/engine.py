@@ -0,0 +1,87 @@
+import os
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class EngineExecutor:
+    # Runs ScriptEngine work on a bounded thread pool. Calls for the same file run one at a time, in the order they
+    # were submitted, so a Save() never races another script on that PDF; different files run in parallel.
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._pool = None
+        self._queues = {}
+        self._outstanding = 0
+        self._lock = threading.Condition()
+
+    @staticmethod
+    def _key(file_dir):
+        return None if file_dir is None else os.path.normcase(os.path.abspath(file_dir))
+
+    def submit(self, file_dir, func, *args, **kwargs):
+        # file_dir=None runs without ordering, returns a concurrent.futures.Future
+        task = (Future(), func, args, kwargs)
+        key = self._key(file_dir)
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="pce-engine")
+            self._outstanding += 1
+            start = key is None or key not in self._queues
+            if key is not None:
+                if start:
+                    self._queues[key] = deque()
+                else:
+                    self._queues[key].append(task)
+            pool = self._pool
+        if start:
+            pool.submit(self._run, key, task)
+        return task[0]
+
+    def run_async(self, file_dir, func, *args, **kwargs):
+        # awaitable from a running event loop
+        return asyncio.wrap_future(self.submit(file_dir, func, *args, **kwargs))
+
+    def _run(self, key, task):
+        future, func, args, kwargs = task
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        with self._lock:
+            self._outstanding -= 1
+            next_task = None
+            if key is not None:
+                if len(self._queues[key]) > 0:
+                    next_task = self._queues[key].popleft()
+                else:
+                    del self._queues[key]
+            pool = self._pool
+            self._lock.notify_all()
+        if next_task is not None:
+            # back through the pool instead of looping here, so one busy file can't hold a worker forever
+            try:
+                pool.submit(self._run, key, next_task)
+            except (AttributeError, RuntimeError):
+                # shutdown(wait=False) was called, finish the file's queue on this thread
+                self._run(key, next_task)
+
+    def join(self):
+        with self._lock:
+            self._lock.wait_for(lambda: self._outstanding == 0)
+
+    def shutdown(self, wait=True):
+        if wait:
+            self.join()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {"outstanding": self._outstanding, "busy_files": len(self._queues), "max_workers": self.max_workers}
+
+
+engine_executor = EngineExecutor()
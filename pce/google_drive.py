@@ -1,44 +1,167 @@
+import io
 import os
+import time
+import hashlib
+import threading
 from datetime import datetime
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload, MediaIoBaseDownload, BatchHttpRequest
+from .drive_cache import DriveMetadataCache
 
 class GoogleDrive:
-    def __init__(self, service_account_file):
+    # resumable uploads go up in CHUNK_SIZE pieces, a failed chunk is retried RETRIES times from where the server is
+    CHUNK_SIZE = 8 * 1024 * 1024
+    RETRIES = 5
+    RETRY_DELAY = 1.0
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    # Drive accepts at most 100 calls per batch request
+    BATCH_SIZE = 100
+    PAGE_SIZE = 1000
+    # downloads are fetched as ranges of DOWNLOAD_CHUNK_SIZE, several at a time
+    DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+    # what the metadata cache keeps for every file
+    FILE_FIELDS = "id, name, mimeType, md5Checksum, size, modifiedTime, parents"
+
+    def __init__(self, service_account_file, api_endpoint=None, http_factory=None, cache_file=None):
+        # api_endpoint / http_factory point the client at another server, e.g. a local stand-in in tests
+        # cache_file: SQLite file for a DriveMetadataCache, see refresh_cache()
         SCOPES = ['https://www.googleapis.com/auth/drive.file']
-        self.credentials = service_account.Credentials.from_service_account_file(service_account_file, scopes=SCOPES)
+        self.credentials = None if service_account_file is None else service_account.Credentials.from_service_account_file(service_account_file, scopes=SCOPES)
+        self.api_endpoint = api_endpoint
+        self.http_factory = httplib2.Http if http_factory is None else http_factory
         self._service = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.cache = None if cache_file is None else DriveMetadataCache(cache_file)
 
     def __getattr__(self, key):
         if key == 'service':
-            if self._service is None:
-                self._service = build('drive', 'v3', credentials=self.credentials)
+            with self._lock:
+                if self._service is None:
+                    client_options = None if self.api_endpoint is None else {"api_endpoint": self.api_endpoint}
+                    self._service = build('drive', 'v3', http=self._http(), client_options=client_options)
             return self._service
         else:
-            return super().__getattr__(key)
+            return super().__getattribute__(key)
+
+    def _http(self):
+        # httplib2 connections can't be shared between threads, every thread gets its own
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self.http_factory()
+            # a 308 is resumable upload progress, not a redirect (as in googleapiclient.http.build_http)
+            http.redirect_codes = http.redirect_codes - {308}
+            if self.credentials is not None:
+                http = AuthorizedHttp(self.credentials, http=http)
+            self._local.http = http
+        return http
+
+    def _retryable(self, error):
+        return not isinstance(error, HttpError) or error.resp.status in self.RETRY_STATUS
+
+    def _media(self, source, mimetype):
+        if isinstance(source, str):
+            return MediaFileUpload(source, mimetype=mimetype, chunksize=self.CHUNK_SIZE, resumable=True)
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        return MediaIoBaseUpload(source, mimetype=mimetype, chunksize=self.CHUNK_SIZE, resumable=True)
 
-    def upload(self, local_file, upstream_file=None):
+    def _send(self, request):
+        # resumable request, a failed chunk is retried from where the server is
+        response, failures = None, 0
+        while response is None:
+            try:
+                _, response = request.next_chunk(http=self._http())
+            except (HttpError, httplib2.HttpLib2Error, OSError) as e:
+                if not self._retryable(e) or failures >= self.RETRIES:
+                    raise
+                # the next next_chunk() asks the server how much it has and continues from there
+                time.sleep(self.RETRY_DELAY * 2 ** failures)
+                failures += 1
+        if self.cache is not None:
+            self.cache.put(response)
+        return response
+
+    def _execute(self, request):
+        failures = 0
+        while True:
+            try:
+                return request.execute(http=self._http())
+            except (HttpError, httplib2.HttpLib2Error, OSError) as e:
+                if not self._retryable(e) or failures >= self.RETRIES:
+                    raise
+                time.sleep(self.RETRY_DELAY * 2 ** failures)
+                failures += 1
+
+    def upload(self, local_file, upstream_file=None, mimetype='application/octet-stream'):
+        # local_file is a path, bytes or a binary file object
         if upstream_file is None:
+            assert isinstance(local_file, str), "in-memory uploads need an upstream_file name"
             upstream_file = os.path.basename(local_file)
         file_metadata = {'name': upstream_file}
-        media = MediaFileUpload(local_file, mimetype='application/octet-stream')
-        file = self.service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        file_id = file.get('id')
+        request = self.service.files().create(body=file_metadata, media_body=self._media(local_file, mimetype), fields=self.FILE_FIELDS)
+        file_id = self._send(request).get('id')
         return file_id
 
-    def change_permission(self, file_id, type, role, **kwargs):
-        # type == anyone, role == reader: normal configurations
+    def update(self, file_id, local_file, mimetype='application/octet-stream'):
+        # new content for an existing file, Drive keeps the old one as a revision
+        request = self.service.files().update(fileId=file_id, media_body=self._media(local_file, mimetype), fields=self.FILE_FIELDS)
+        return self._send(request).get('id')
+
+    def upload_many(self, files, workers=4, mimetype='application/octet-stream'):
+        # files: paths or (source, upstream_file) pairs, at most workers uploads at a time, ids in order
+        items = [f if isinstance(f, tuple) else (f, None) for f in files]
+        self.service  # built once, before the worker threads
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            return list(pool.map(lambda item: self.upload(item[0], item[1], mimetype), items))
+
+    @staticmethod
+    def _permission_body(type, role, **kwargs):
         body = {'type': type, 'role': role}
         if kwargs.get('expirationTime') is not None:
             expiration_time = (datetime.utcnow() + kwargs['expirationTime']).isoformat() + 'Z'
             body['expirationTime'] = expiration_time
-        elif kwargs.get('emailAddress') is not None:
+        if kwargs.get('emailAddress') is not None:
             body['emailAddress'] = kwargs['emailAddress']
+        return body
+
+    def change_permission(self, file_id, type, role, **kwargs):
+        # type == anyone, role == reader: normal configurations
+        body = self._permission_body(type, role, **kwargs)
         self.service.permissions().create(
             fileId=file_id,
             body=body
-        ).execute()
+        ).execute(http=self._http())
+
+    def change_permissions(self, file_ids, type, role, **kwargs):
+        # one permission for many files, BATCH_SIZE calls per HTTP request; throttled calls are sent again
+        body = self._permission_body(type, role, **kwargs)
+        batch_uri = urljoin(self.api_endpoint or "https://www.googleapis.com/", "/batch/drive/v3")
+        pending, failures = list(dict.fromkeys(file_ids)), 0
+        while len(pending) > 0:
+            errors = {}
+
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    errors[request_id] = exception
+            for start in range(0, len(pending), self.BATCH_SIZE):
+                batch = BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+                for file_id in pending[start:start + self.BATCH_SIZE]:
+                    batch.add(self.service.permissions().create(fileId=file_id, body=body, fields='id'), request_id=file_id)
+                batch.execute(http=self._http())
+            fatal = [e for e in errors.values() if not self._retryable(e)]
+            if len(fatal) > 0 or (len(errors) > 0 and failures >= self.RETRIES):
+                raise (fatal or list(errors.values()))[0]
+            pending = list(errors)
+            if len(pending) > 0:
+                time.sleep(self.RETRY_DELAY * 2 ** failures)
+                failures += 1
 
     def upload_for_someone_read(self, local_file, upstream_file=None, expirationTime=None, emailAddress=None):
         file_id = self.upload(local_file, upstream_file)
@@ -49,20 +172,130 @@ class GoogleDrive:
         download_link = self.enclose_file(file_id)
         return download_link
 
-    def download_file(self, file_id, local_path):
-        request = self.service.files().get_media(fileId=file_id)
+    def upload_many_for_someone_read(self, files, expirationTime=None, emailAddress=None, workers=4):
+        # upload_for_someone_read for a whole batch: parallel uploads, batched permissions, links in order
+        file_ids = self.upload_many(files, workers)
+        if emailAddress is None:
+            self.change_permissions(file_ids, 'anyone', 'reader', expirationTime=expirationTime)
+        else:
+            self.change_permissions(file_ids, 'user', 'reader', expirationTime=expirationTime, emailAddress=emailAddress)
+        return [self.enclose_file(file_id) for file_id in file_ids]
+
+    @staticmethod
+    def md5(local_file):
+        # same hex digest as Drive's md5Checksum
+        digest = hashlib.md5()
+        with open(local_file, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def sync(self, local_dir, workers=4, mimetype='application/octet-stream'):
+        # uploads the files in local_dir whose content isn't on Drive yet: a name that already exists gets a new
+        # revision, files with the same name and md5Checksum are skipped. Returns {name: (file_id, action)}.
+        names = sorted(n for n in os.listdir(local_dir) if os.path.isfile(os.path.join(local_dir, n)))
+        if self.cache is not None:
+            self.refresh_cache()
+            remote = {name: self.cache.find(name) for name in names}
+        else:
+            # one listing instead of a query per file
+            remote = {name: [] for name in names}
+            for f in self.iter_files("trashed = false", self.FILE_FIELDS):
+                if f['name'] in remote:
+                    remote[f['name']].append(f)
+
+        def sync_one(name):
+            path = os.path.join(local_dir, name)
+            checksum = self.md5(path)
+            if any(f.get('md5Checksum') == checksum for f in remote[name]):
+                return next(f['id'] for f in remote[name] if f.get('md5Checksum') == checksum), 'skipped'
+            if len(remote[name]) > 0:
+                return self.update(remote[name][0]['id'], path, mimetype), 'updated'
+            return self.upload(path, name, mimetype), 'uploaded'
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            return dict(zip(names, pool.map(sync_one, names)))
+
+    def download_file(self, file_id, local_path, chunk_size=None, workers=4):
+        # fetches byte ranges of chunk_size in parallel straight into their place in a preallocated local_path
+        chunk_size = chunk_size or self.DOWNLOAD_CHUNK_SIZE
+        size = self._execute(self.service.files().get(fileId=file_id, fields='size')).get('size')
+        if size is None:
+            # Google Docs files have no size (and no ranges), those come in one piece
+            with open(local_path, 'wb') as f:
+                downloader = MediaIoBaseDownload(f, self.service.files().get_media(fileId=file_id), chunksize=chunk_size)
+                done = False
+                while done is False:
+                    _, done = downloader.next_chunk()
+            return
+        size = int(size)
         with open(local_path, 'wb') as f:
-            downloader = MediaIoBaseDownload(f, request)
-            done = False
-            while done is False:
-                _, done = downloader.next_chunk()
+            f.truncate(size)
+
+        def fetch(start):
+            end = min(start + chunk_size, size) - 1
+            request = self.service.files().get_media(fileId=file_id)
+            request.headers['range'] = f'bytes={start}-{end}'
+            content = self._execute(request)
+            if len(content) != end - start + 1:
+                raise IOError(f"{file_id}: got {len(content)} bytes for range {start}-{end}")
+            with open(local_path, 'r+b') as f:
+                f.seek(start)
+                f.write(content)
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            list(pool.map(fetch, range(0, size, chunk_size)))
 
     def delete_file(self, file_id):
-        self.service.files().delete(fileId=file_id).execute()
+        self.service.files().delete(fileId=file_id).execute(http=self._http())
+        if self.cache is not None:
+            self.cache.remove(file_id)
+
+    def iter_files(self, q=None, fields="id, name", **kwargs):
+        # every file matching the query q, one page at a time; kwargs go to files().list (e.g. driveId, corpora)
+        page_token = None
+        while True:
+            results = self.service.files().list(q=q, pageSize=self.PAGE_SIZE, pageToken=page_token,
+                                                fields=f"nextPageToken, files({fields})", **kwargs).execute(http=self._http())
+            yield from results.get('files', [])
+            page_token = results.get('nextPageToken')
+            if page_token is None:
+                return
+
+    def list_all_files(self, q=None, fields="id, name", **kwargs):
+        return list(self.iter_files(q, fields, **kwargs))
+
+    def iter_changes(self, page_token):
+        # (changes, token after them) for every page of the changes feed since page_token
+        fields = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({self.FILE_FIELDS}, trashed))"
+        while page_token is not None:
+            results = self.service.changes().list(pageToken=page_token, pageSize=self.PAGE_SIZE, fields=fields).execute(http=self._http())
+            page_token = results.get('nextPageToken')
+            yield results.get('changes', []), page_token or results['newStartPageToken']
+
+    def refresh_cache(self):
+        # the first refresh lists everything, later ones only read the changes since the last one
+        token = self.cache.page_token()
+        if token is None:
+            # taken before the listing, so a change made during it shows up in the next refresh
+            token = self.service.changes().getStartPageToken().execute(http=self._http())['startPageToken']
+            self.cache.replace(self.iter_files("trashed = false", self.FILE_FIELDS), token)
+        else:
+            for changes, token in self.iter_changes(token):
+                self.cache.apply(changes, token)
+
+    def find_files(self, name, md5Checksum=None):
+        # files called name, from the cache when there is one (refreshed once if it was never filled)
+        if self.cache is not None:
+            if self.cache.page_token() is None:
+                self.refresh_cache()
+            return self.cache.find(name, md5Checksum)
+        escaped = name.replace("\\", "\\\\").replace("'", "\\'")
+        files = self.iter_files(f"name = '{escaped}' and trashed = false", self.FILE_FIELDS)
+        return [f for f in files if md5Checksum is None or f.get('md5Checksum') == md5Checksum]
 
-    def list_all_files(self):
-        results = self.service.files().list(pageSize=100, fields="nextPageToken, files(id, name)").execute()
-        return results.get('files', [])
+    def find_file(self, name):
+        # id of a file called name, None if there isn't one
+        files = self.find_files(name)
+        return files[0]['id'] if len(files) > 0 else None
 
     def enclose_file(self, file_id):
         return f"https://drive.google.com/uc?id={file_id}&export=download"
@@ -0,0 +1,70 @@
+import os
+import copy
+import threading
+
+
+class MarkupCache:
+    def __init__(self, max_files=64):
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self._files = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(file_dir):
+        return os.path.normcase(os.path.abspath(file_dir))
+
+    @staticmethod
+    def signature(file_dir):
+        stat = os.stat(file_dir)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, file_dir, pages):
+        # returns ({page: markups} found in the cache, [pages still to fetch])
+        key, signature = self._key(file_dir), self.signature(file_dir)
+        with self._lock:
+            cached = self._files.get(key)
+            if cached is None or cached[0] != signature:
+                self._files.pop(key, None)
+                self.misses += len(pages)
+                return {}, list(pages)
+            found = {i: copy.deepcopy(cached[1][i]) for i in pages if i in cached[1]}
+            self.hits += len(found)
+            self.misses += len(pages) - len(found)
+            return found, [i for i in pages if i not in found]
+
+    def put(self, file_dir, markups_by_page, signature=None):
+        # signature: the file's signature() from before the markups were read; if the file was saved since, they may
+        # be the old ones and are not cached
+        key, current = self._key(file_dir), self.signature(file_dir)
+        if signature is not None and signature != current:
+            return
+        signature = current
+        with self._lock:
+            cached = self._files.get(key)
+            if cached is None or cached[0] != signature:
+                cached = (signature, {})
+            self._files.pop(key, None)
+            self._files[key] = cached
+            cached[1].update(copy.deepcopy(markups_by_page))
+            while len(self._files) > self.max_files:
+                self._files.pop(next(iter(self._files)))
+
+    def invalidate(self, file_dir=None):
+        with self._lock:
+            if file_dir is None:
+                self._files.clear()
+            else:
+                self._files.pop(self._key(file_dir), None)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "files": len(self._files)}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits, self.misses = 0, 0
+
+
+markup_cache = MarkupCache()
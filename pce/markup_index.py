@@ -0,0 +1,107 @@
+import math
+import numpy as np
+
+
+def _floats(values):
+    result = np.full(len(values), np.nan)
+    for i, v in enumerate(values):
+        try:
+            result[i] = float(v)
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def _strings(values):
+    return np.array([str(v).strip().lower() if v is not None else '' for v in values], dtype=object)
+
+
+class MarkupIndex:
+    # uniform grid over the x / y of a return_markup_by_page result, matches come back in the original order
+    def __init__(self, markups, cell_size=None):
+        self.keys = list(markups.keys())
+        self.values = list(markups.values())
+        self.x = _floats([v.get('x') for v in self.values])
+        self.y = _floats([v.get('y') for v in self.values])
+        self.width = np.nan_to_num(_floats([v.get('width') for v in self.values]))
+        self.height = np.nan_to_num(_floats([v.get('height') for v in self.values]))
+        self.color = _strings([v.get('color') for v in self.values])
+        self.subject = _strings([v.get('subject') for v in self.values])
+        self.comment = _strings([v.get('comment') for v in self.values])
+        self._valid = np.flatnonzero(~np.isnan(self.x) & ~np.isnan(self.y))
+        if cell_size is None:
+            span = max(np.ptp(self.x[self._valid]), np.ptp(self.y[self._valid])) if len(self._valid) > 0 else 1.0
+            cell_size = max(span / math.sqrt(max(len(self._valid), 1)), 1.0)
+        self.cell_size = float(cell_size)
+        self._cells = {}
+        if len(self._valid) > 0:
+            cells = np.floor(np.stack([self.x[self._valid], self.y[self._valid]], axis=1) / self.cell_size).astype(np.int64)
+            unique, inverse = np.unique(cells, axis=0, return_inverse=True)
+            order = np.argsort(inverse.ravel(), kind='stable')
+            groups = np.split(self._valid[order], np.cumsum(np.bincount(inverse.ravel()))[:-1])
+            self._cells = {(int(cx), int(cy)): group for (cx, cy), group in zip(unique, groups)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _candidates(self, x0, y0, x1, y1):
+        cx0, cy0 = math.floor(x0 / self.cell_size), math.floor(y0 / self.cell_size)
+        cx1, cy1 = math.floor(x1 / self.cell_size), math.floor(y1 / self.cell_size)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            return self._valid
+        groups = [self._cells[(cx, cy)] for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1) if (cx, cy) in self._cells]
+        return np.concatenate(groups) if len(groups) > 0 else np.empty(0, dtype=np.int64)
+
+    def _mask(self, color=None, subject=None, comment=None):
+        mask = np.ones(len(self.keys), dtype=bool)
+        for column, wanted in ((self.color, color), (self.subject, subject), (self.comment, comment)):
+            if wanted is None:
+                continue
+            wanted = [wanted] if type(wanted) is str else wanted
+            mask &= np.isin(column, [str(item).strip().lower() for item in wanted])
+        return mask
+
+    def query_region(self, region, **filters):
+        # indices strictly inside region = [x, y, width, height], same test as PCETools.get_markup_in_region
+        x0, y0, x1, y1 = region[0], region[1], region[0] + region[2], region[1] + region[3]
+        candidates = self._candidates(x0, y0, x1, y1)
+        x, y = self.x[candidates], self.y[candidates]
+        candidates = candidates[(x0 < x) & (x < x1) & (y0 < y) & (y < y1)]
+        if len(filters) > 0:
+            candidates = candidates[self._mask(**filters)[candidates]]
+        return np.sort(candidates)
+
+    def query_overlapping(self, region, **filters):
+        # indices whose x / y / width / height box intersects region
+        x0, y0, x1, y1 = region[0], region[1], region[0] + region[2], region[1] + region[3]
+        mask = (self.x < x1) & (self.x + self.width > x0) & (self.y < y1) & (self.y + self.height > y0)
+        if len(filters) > 0:
+            mask &= self._mask(**filters)
+        return np.flatnonzero(mask)
+
+    def query_point(self, pos, tol, **filters):
+        return self.query_region((pos[0] - tol / 2, pos[1] - tol / 2, tol, tol), **filters)
+
+    def query_nearest(self, pos, k=1, **filters):
+        candidates = self._valid if len(filters) == 0 else self._valid[self._mask(**filters)[self._valid]]
+        distance = np.hypot(self.x[candidates] - pos[0], self.y[candidates] - pos[1])
+        k = min(k, len(candidates))
+        if k == 0:
+            return candidates
+        nearest = np.argpartition(distance, k - 1)[:k]
+        return candidates[nearest[np.argsort(distance[nearest], kind='stable')]]
+
+    def to_dict(self, indices):
+        return {self.keys[i]: self.values[i] for i in indices}
+
+    def region(self, region, **filters):
+        return self.to_dict(self.query_region(region, **filters))
+
+    def near(self, pos, tol, **filters):
+        return self.to_dict(self.query_point(pos, tol, **filters))
+
+    def nearest(self, pos, k=1, **filters):
+        return self.to_dict(self.query_nearest(pos, k, **filters))
+
+    def filter(self, color=None, subject=None, comment=None):
+        return self.to_dict(np.flatnonzero(self._mask(color, subject, comment)))
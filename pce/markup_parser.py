@@ -0,0 +1,148 @@
+import re
+
+# ScriptEngine prints markups as a quasi-Python literal:
+#   {'ID': '{'x': '10', 'comment': 'it|'s ||r'}', ...}
+# nested dicts are wrapped in quotes, '|' escapes quotes, '||' stands for a backslash escape
+# ('||r' is a carriage return) and 'True' / 'False' / 'None' are constants.
+# the body of a '...' string: '|' escapes the character after it, so the string ends at the first unescaped quote
+_BODY = r"[^'|]*(?:\|[\s\S][^'|]*)*"
+_STRING = re.compile("'(" + _BODY + ")'")
+_SPACE = re.compile(r"\s*")
+# a dict of plain string values (what a markup is) is read in one go, as is a 'id': '{...}', item holding one;
+# '{}' values are nested dicts, not plain strings
+_FLAT = r"\{\s*(?:'" + _BODY + r"'\s*:\s*'" + _BODY + r"'\s*(?:,\s*'" + _BODY + r"'\s*:\s*'" + _BODY + r"'\s*)*)?\}"
+_FLAT_DICT = re.compile(_FLAT)
+_FLAT_ITEM = re.compile(r"\s*'(" + _BODY + r")'\s*:\s*'(" + _FLAT + r")'\s*([,}])")
+# '|'' and '|"' are quotes, '||||' a backslash, '||u0041' a code point, '||r' ... escapes, any other '||' a backslash
+_ESCAPE = re.compile(r"""\|(?:\|(?:\|\||u[0-9a-fA-F]{4}|[rntbf/"])?|['"])""")
+_ESCAPES = {"|'": "'", '|"': '"', '||': '\\', '||||': '\\', '||r': '\r', '||n': '\n', '||t': '\t', '||b': '\b', '||f': '\f', '||/': '/', '||"': '"'}
+_CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+
+class MarkupParseError(ValueError):
+    pass
+
+
+def _escape(match):
+    escape = match.group()
+    return _ESCAPES[escape] if escape in _ESCAPES else chr(int(escape[3:], 16))
+
+
+def _unescape(body):
+    return _ESCAPE.sub(_escape, body) if '|' in body else body
+
+
+def _flat_dict(text, pos, end, fields=None):
+    # the dict of plain strings text[pos:end], which _FLAT matched: its strings are key, value, key, value, ...
+    strings = _STRING.findall(text, pos, end)
+    keys, values = strings[0::2], strings[1::2]
+    if text.find('|', pos, end) != -1:
+        keys, values = [_unescape(key) for key in keys] if '|' in ''.join(keys) else keys, [_unescape(value) if '|' in value else value for value in values]
+    values = map(_CONSTANTS.get, values, values)
+    if fields is None:
+        return dict(zip(keys, values))
+    return {key: value for key, value in zip(keys, values) if key in fields}
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def error(self, message):
+        return MarkupParseError("{} at {}: {!r}".format(message, self.pos, self.text[self.pos:self.pos + 40]))
+
+    def skip_space(self):
+        self.pos = _SPACE.match(self.text, self.pos).end()
+
+    def expect(self, char):
+        self.skip_space()
+        if not self.text.startswith(char, self.pos):
+            raise self.error("expected {!r}".format(char))
+        self.pos += len(char)
+
+    def raw_string(self):
+        self.skip_space()
+        match = _STRING.match(self.text, self.pos)
+        if match is None:
+            raise self.error("unterminated string" if self.text.startswith("'", self.pos) else "expected \"'\"")
+        self.pos = match.end()
+        return match.group(1)
+
+    def string(self):
+        return _unescape(self.raw_string())
+
+    def value(self, fields=None, keep=True):
+        # a nested dict is quoted: '{'key': ...}' or '{}'; keep=False only skips a plain string value
+        self.skip_space()
+        text = self.text
+        if text.startswith("'{'", self.pos) or text.startswith("'{}'", self.pos):
+            start = self.pos
+            match = _FLAT_DICT.match(text, start + 1)
+            if match is not None and text.startswith("'", match.end()) and text.find("'{}'", start + 1, match.end()) == -1:
+                self.pos = match.end() + 1
+                return _flat_dict(text, start + 1, match.end(), fields)
+            try:
+                self.pos += 1
+                result = self.dict(fields)
+                self.expect("'")
+                return result
+            except MarkupParseError:
+                # a comment that happens to start with '{'
+                self.pos = start
+        elif text.startswith("{", self.pos):
+            return self.dict(fields)
+        if not keep:
+            self.raw_string()
+            return None
+        result = self.string()
+        return _CONSTANTS.get(result, result)
+
+    def items(self, fields=None, item_fields=None):
+        # yields (key, value) of the dict at self.pos; fields drops keys, item_fields is passed to nested dicts
+        self.expect('{')
+        self.skip_space()
+        if self.text.startswith('}', self.pos):
+            self.pos += 1
+            return
+        text = self.text
+        while True:
+            match = _FLAT_ITEM.match(text, self.pos)
+            if match is not None and text.find("'{}'", match.start(2), match.end(2)) == -1:
+                key = _unescape(match.group(1))
+                if fields is None or key in fields:
+                    yield key, _flat_dict(text, match.start(2), match.end(2), item_fields)
+                self.pos = match.end()
+                if match.group(3) == ',':
+                    continue
+                return
+            key = self.string()
+            self.expect(':')
+            if fields is None or key in fields:
+                yield key, self.value(item_fields)
+            else:
+                self.value(item_fields, keep=False)
+            self.skip_space()
+            if self.text.startswith(',', self.pos):
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def dict(self, fields=None):
+        return dict(self.items(fields))
+
+
+def iter_markups(text, fields=None):
+    # yields (markup id, markup) one by one, fields=('x', 'y', ...) keeps only those properties
+    if text.strip() == '':
+        return
+    parser = _Parser(text)
+    yield from parser.items(item_fields=None if fields is None else set(fields))
+    parser.skip_space()
+    if parser.pos != len(text):
+        raise parser.error("trailing data")
+
+
+def parse_markups(text, fields=None):
+    return dict(iter_markups(text, fields))
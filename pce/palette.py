@@ -0,0 +1,31 @@
+import numpy as np
+
+# Layout of the Revu color palette on screen: swatches COLUMNS wide, STEP pixels apart from FIRST_SWATCH, as many
+# rows as the white PROBE column next to them goes down
+FIRST_SWATCH, PROBE, STEP, COLUMNS = (1765, 815), (1750, 825), 33, 8
+WHITE = (255, 255, 255)
+
+
+def palette_region(screen_height):
+    # (left, top, width, height) of the part of the screen palette_colors looks at
+    left, top = min(FIRST_SWATCH[0], PROBE[0]), min(FIRST_SWATCH[1], PROBE[1])
+    return left, top, FIRST_SWATCH[0] + STEP * (COLUMNS - 1) + 1 - left, screen_height - top
+
+
+def palette_colors(image, origin=(0, 0)):
+    # {color: (x, y) of its first swatch} for an image of the screen whose top left corner is at origin
+    pixels = np.asarray(image)
+    ox, oy = origin
+    probe = pixels[PROBE[1] - oy::STEP, PROBE[0] - ox]
+    white = np.all(probe[:, :3] == WHITE, axis=1) if probe.shape[-1] == 3 else np.zeros(len(probe), dtype=bool)
+    # rows up to the first non-white probe, less one
+    lines = (int(np.argmin(white)) if not white.all() else len(white)) - 1
+    if lines <= 0:
+        return {}
+    x0, y0 = FIRST_SWATCH[0] - ox, FIRST_SWATCH[1] - oy
+    grid = pixels[y0:y0 + STEP * lines:STEP, x0:x0 + STEP * COLUMNS:STEP]
+    rows, columns = grid.shape[:2]
+    colors, first = np.unique(grid.reshape(rows * columns, -1), axis=0, return_index=True)
+    order = np.argsort(first)
+    return {tuple(int(c) for c in colors[k]): (FIRST_SWATCH[0] + STEP * int(first[k] % columns), FIRST_SWATCH[1] + STEP * int(first[k] // columns))
+            for k in order}
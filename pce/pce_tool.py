@@ -1,4 +1,3 @@
-import uuid
 import os
 import shutil
 import subprocess
@@ -11,9 +10,26 @@ from xml.etree import ElementTree as ET
 import pypdf
 import json
 import copy
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from .doc_cache import document_cache
+from .markup_cache import markup_cache
+from .session import ScriptSession
+from .converter import CONVERTERS
+from .recolor import recolor_pdf
+from .color_inventory import color_inventory
+from .pipeline import imap_bounded, chunked
+from .markup_index import MarkupIndex
+from .anchor_index import anchor_cache
+from .svg_ids import rename_ids, parse_with_renamed_ids, make_suffix, register_namespaces
+from .combine import combine_documents, has_annotations, is_path
+from .transform import transform_pages
+from .markup_parser import parse_markups
+from .tracing import tracer, traced, describe
+from .engine import engine_executor
+from .svg_cache import svg_cache
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(filename='myapp.log', level=logging.INFO)
 
 class External(svgwrite.container.Group):
     def __init__(self, xml, **extra):
@@ -34,6 +50,20 @@ class PCETools:
     BLUEBEAM_ENGINE_DIR = r"C:\Program Files\Bluebeam Software\Bluebeam Revu\2017\Script\ScriptEngine.exe"
     INKSCAPE_DIRECTORY = r"C:\Progra~1\Inkscape\bin\inkscape.exe"
     TEMP_PATH = r"D:\Workspace\repos\pce_tools"
+    DOC_CACHE = document_cache
+    MARKUP_CACHE = markup_cache
+    # anchor positions of whole documents, built once per file from its markups
+    ANCHOR_CACHE = anchor_cache
+    SVG_BACKEND = "inkscape"
+    SVG_WORKERS = 1
+    # "auto" combines in-process unless an input carries markups, "native" / "bluebeam" force one
+    COMBINE_BACKEND = "auto"
+    # Windows command lines are limited to 32767 characters
+    INLINE_SCRIPT_LIMIT = 8000
+    # ScriptEngine work submitted through submit() / the a* coroutines, one file at a time, files in parallel
+    ENGINE = engine_executor
+    # page SVGs on disk by content hash, off until SetSVGCache() or $PCE_SVG_CACHE gives it a directory
+    SVG_CACHE = svg_cache
     @classmethod
     def SetEnvironment(cls, BLUEBEAM_DIR, BLUEBEAM_ENGINE_DIR, INKSCAPE_DIRECTORY, TEMP_PATH):
         cls.BLUEBEAM_DIR = BLUEBEAM_DIR
@@ -41,36 +71,75 @@ class PCETools:
         cls.INKSCAPE_DIRECTORY = INKSCAPE_DIRECTORY
         cls.TEMP_PATH = TEMP_PATH
 
+    @classmethod
+    def SetSVGCache(cls, directory, max_bytes=None):
+        cls.SVG_CACHE.configure(directory, max_bytes)
+
+    @classmethod
+    def _environment(cls):
+        return {"BLUEBEAM_DIR": cls.BLUEBEAM_DIR, "BLUEBEAM_ENGINE_DIR": cls.BLUEBEAM_ENGINE_DIR, "INKSCAPE_DIRECTORY": cls.INKSCAPE_DIRECTORY,
+                "TEMP_PATH": cls.TEMP_PATH, "SVG_BACKEND": cls.SVG_BACKEND, "SVG_CACHE": cls.SVG_CACHE}
+
+    @classmethod
+    def _apply_environment(cls, env):
+        # worker processes on Windows start fresh, SetEnvironment() calls have to be replayed there
+        for k, v in env.items():
+            setattr(cls, k, v)
+
     @staticmethod
     def _rename_id(element, suffix=None):
         if suffix is None:
-            suffix = str(uuid.uuid4()).split('-')[0]
-        for elem in element.iter():
-            for key in elem.keys():
-                if key in ('id', ):
-                    elem.set(key, elem.get(key) + '_' + suffix)
-            for key in elem.attrib:
-                if re.match(r".*url\(#.*\).*", elem.attrib[key]):
-                    elem.attrib[key] = re.sub(r"\(#(.*?)\)", r"(#{}_{})".format(r"\1", suffix), elem.attrib[key])
-                if key.endswith("href") and re.match(r"#.*", elem.attrib[key]):
-                    elem.attrib[key] = re.sub(r"#(.*)", r"#{}_{}".format(r"\1", suffix), elem.attrib[key])
+            suffix = make_suffix()
+        rename_ids(element, suffix)
+
+    @classmethod
+    def open_document(cls, pdf_path):
+        # shared handle, owned by the cache: do not close it. In-memory PDFs (bytes, fitz documents) are opened as they are
+        if isinstance(pdf_path, fitz.Document):
+            return pdf_path
+        if isinstance(pdf_path, (bytes, bytearray)):
+            return fitz.open("pdf", bytes(pdf_path))
+        return cls.DOC_CACHE.open(pdf_path)
+
+    @classmethod
+    def invalidate_document(cls, *pdf_paths):
+        for pdf_path in pdf_paths:
+            cls.DOC_CACHE.invalidate(pdf_path)
+            cls.MARKUP_CACHE.invalidate(pdf_path)
+            cls.ANCHOR_CACHE.invalidate(pdf_path)
 
     @staticmethod
-    def pdf_page_to_svg(pdf_path, page_number, svg_file):
-        doc = fitz.open(pdf_path)
-        page = doc.load_page(page_number)
+    def _render_svg(page):
         svg_image = page.get_svg_image()
-        svg_image = svg_image.replace("&", "&amp;")
-        svg_file.write(svg_image.encode('ascii'))
+        return svg_image.replace("&", "&amp;")
+
+    @staticmethod
+    def pdf_page_to_svg(pdf_path, page_number, svg_file):
+        with tracer.span("fitz.page_to_svg", file=describe(pdf_path), page=page_number) as span:
+            doc = PCETools.open_document(pdf_path)
+            page = doc.load_page(page_number)
+            cache = PCETools.SVG_CACHE
+            svg_image = None
+            if cache.enabled:
+                signature = PCETools.DOC_CACHE.signature(pdf_path, doc) if isinstance(pdf_path, str) else None
+                key = cache.key(pdf_path, doc, page_number, signature)
+                svg_image = cache.get(key)
+                span.set(cache_hit=svg_image is not None)
+            if svg_image is None:
+                svg_image = PCETools._render_svg(page)
+                if cache.enabled:
+                    cache.put(key, svg_image)
+            svg_file.write(svg_image.encode('ascii'))
+            span.set(bytes_out=len(svg_image))
 
     @staticmethod
     def page_count(pdf_path):
-        doc = fitz.open(pdf_path)
+        doc = PCETools.open_document(pdf_path)
         return doc.page_count
 
     @staticmethod
     def page_size(pdf_path, page_id):
-        doc = fitz.open(pdf_path)
+        doc = PCETools.open_document(pdf_path)
         page = doc.load_page(page_id)
         return (page.rect.width, page.rect.height)
 
@@ -83,13 +152,16 @@ class PCETools:
         return svg_file
 
     @staticmethod
-    def get_ET(file_name, page_number):
-        ET.register_namespace('', "http://www.w3.org/2000/svg")
-        if file_name.endswith(".pdf"):
+    def get_ET(file_name, page_number, id_suffix=None):
+        # id_suffix renames ids while parsing, instead of a _rename_id pass afterwards
+        register_namespaces()
+        if not isinstance(file_name, str) or file_name.endswith(".pdf"):
             svg_file = PCETools._get_svg_bytes_from_pdf(file_name, page_number)
         else:
             with open(file_name, 'r') as f:
                 svg_file = f.read()
+        if id_suffix is not None:
+            return parse_with_renamed_ids(svg_file, id_suffix)
         root = ET.fromstring(svg_file)
         return root
 
@@ -101,9 +173,8 @@ class PCETools:
     @staticmethod
     def overlay_page(file_name1, overlay, output_path, page_number=0, page_number_overlay=0, position=(10, 10)):
         background_root = PCETools.get_ET(file_name1, page_number)
-        overlay_root = PCETools.get_ET(overlay, page_number_overlay)
         # avoid duplication of namespace
-        PCETools._rename_id(overlay_root)
+        overlay_root = PCETools.get_ET(overlay, page_number_overlay, id_suffix=make_suffix(overlay, page_number_overlay))
 
         # same size as background
         background_width = background_root.attrib.get('width', '100%')
@@ -118,22 +189,32 @@ class PCETools:
         overlay_group.add(External(overlay_root))
         dwg.add(overlay_group)
 
-        dwg.save()
+        with tracer.span("svg.overlay_save", file=output_path):
+            if output_path is None:
+                return dwg.tostring()
+            dwg.save()
 
     @staticmethod
-    def merge_page(et_list, coordinate_list, page_size, output_path):
-        for item_root in et_list[1:]:
-            PCETools._rename_id(item_root)
+    def merge_page(et_list, coordinate_list, page_size, output_path=None, rename_ids=True):
+        # rename_ids=False when the layers were loaded with get_ET(..., id_suffix=...), output_path=None returns the SVG text
+        for i, item_root in enumerate(et_list):
+            if rename_ids and i > 0:
+                PCETools._rename_id(item_root, "svg{}".format(i))
         dwg = svgwrite.Drawing(output_path, size=page_size)
         for i, item in enumerate(et_list):
             group = dwg.g(id="svg_{}".format(i), transform='translate(%f, %f)' % (coordinate_list[i][0], coordinate_list[i][1]))
             group.add(External(item))
             dwg.add(group)
-        dwg.save()
+        with tracer.span("svg.merge_save", file=output_path, layers=len(et_list)):
+            if output_path is None:
+                return dwg.tostring()
+            dwg.save()
 
     @staticmethod
-    def resize_pdf(input_file, input_scale, input_size_x, input_size_y, output_scale, output_size_x, output_size_y, output_dir):
-        reader = pypdf.PdfReader(input_file)
+    @traced("pdf.resize", file=0)
+    def resize_pdf(input_file, input_scale, input_size_x, input_size_y, output_scale, output_size_x, output_size_y, output_dir=None):
+        # input_file may be PDF bytes, output_dir=None returns the resized PDF as bytes
+        reader = pypdf.PdfReader(io.BytesIO(input_file) if isinstance(input_file, (bytes, bytearray)) else input_file)
         writer = pypdf.PdfWriter()
         page_scale_x = float(output_size_x) / float(input_size_x)
         page_scale_y = float(output_size_y) / float(input_size_y)
@@ -149,49 +230,195 @@ class PCETools:
             if content_scale_x != 1 or content_scale_y != 1:
                 page.add_transformation(op)
             writer.add_page(page)
+        if output_dir is None:
+            with io.BytesIO() as buffer:
+                writer.write(buffer)
+                return buffer.getvalue()
+        PCETools.invalidate_document(output_dir)
         writer.write(output_dir)
 
+    @classmethod
+    def get_converter(cls, backend=None, workers=None):
+        backend = cls.SVG_BACKEND if backend is None else backend
+        workers = cls.SVG_WORKERS if workers is None else workers
+        return CONVERTERS[backend](cls, workers)
+
     @staticmethod
-    def svg_to_pdf(src, dest):
-        command = [f'"{src}"', "--export-type=pdf", f'--export-filename="{dest}"']
-        os.system(' '.join([f'{PCETools.INKSCAPE_DIRECTORY}'] + command))
+    def svg_to_pdf(src, dest=None):
+        # src is an .svg path or SVG text, dest=None returns the PDF bytes
+        if dest is None:
+            return PCETools.svgs_to_pdf_bytes([src])[0]
+        PCETools.svgs_to_pdf([src], [dest])
 
-    # Bluebeam
     @staticmethod
-    def combine_pdf(input_file_list, output_file):
-        if len(input_file_list) == 1:
+    @traced("svg.to_pdf_bytes")
+    def svgs_to_pdf_bytes(svg_list, backend=None, workers=None):
+        return PCETools.get_converter(backend, workers).convert_bytes(svg_list)
+
+    @staticmethod
+    @traced("svg.to_pdf")
+    def svgs_to_pdf(src_list, dest_list, backend=None, workers=None):
+        PCETools.invalidate_document(*dest_list)
+        PCETools.get_converter(backend, workers).convert_many(src_list, dest_list)
+
+    @staticmethod
+    @traced("pdf.combine")
+    def combine_pdf(input_file_list, output_file, backend=None, garbage=4, deflate=True):
+        # inputs may be paths, bytes or fitz documents, output_file=None returns the combined fitz document
+        backend = PCETools.COMBINE_BACKEND if backend is None else backend
+        paths = all(is_path(f) for f in input_file_list) and is_path(output_file)
+        if backend == "auto":
+            backend = "bluebeam" if paths and has_annotations(input_file_list) else "native"
+        if output_file is not None:
+            PCETools.invalidate_document(output_file)
+        if paths and len(input_file_list) == 1:
             shutil.copy(input_file_list[0], output_file)
             return
+        if backend == "native":
+            return combine_documents(input_file_list, output_file, garbage, deflate)
+        assert paths, "Bluebeam can only combine files on disk"
+        PCETools.combine_pdf_bluebeam(input_file_list, output_file)
+
+    # Bluebeam
+    @staticmethod
+    def combine_pdf_bluebeam(input_file_list, output_file):
         combine_pdfs = []
         for file in input_file_list:
             combine_pdfs.append('\'' + file + '\'')
 
         command = f"Combine({', '.join(combine_pdfs)}) Save('{output_file}') Close()"
-        subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, command])
+        PCETools._check_output(command, "bluebeam.combine", file=output_file)
+
+    @staticmethod
+    def _check_output(command, operation, **attrs):
+        # every ScriptEngine call goes through here and is traced as one span
+        attrs.setdefault("command_length", len(command))
+        with tracer.span(operation, **attrs) as span:
+            result_bytes = subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, command])
+            span.set(bytes_out=len(result_bytes or b""))
+        return result_bytes
+
+    @staticmethod
+    def _run_script(script_name, command):
+        # short scripts go on the command line, long ones into a private temp file, never a fixed name in the CWD
+        command_length = sum(len(line) + 1 for line in command)
+        file_dir = command[0][len("Open('"):-len("')")] if command[0].startswith("Open('") else None
+        attrs = {"file": file_dir, "script": script_name, "commands": len(command), "command_length": command_length}
+        if command_length < PCETools.INLINE_SCRIPT_LIMIT and not any('\n' in line for line in command):
+            return PCETools._check_output(' '.join(command), "bluebeam.script", **attrs)
+        prefix, suffix = os.path.splitext(script_name)
+        fd, script_path = tempfile.mkstemp(prefix=prefix + "_", suffix=suffix or ".bci")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(command))
+            return PCETools._check_output(f"Script('{script_path}')", "bluebeam.script", **attrs)
+        finally:
+            os.remove(script_path)
+
+    @classmethod
+    def submit(cls, file_dir, func, *args, **kwargs):
+        # runs func(*args) on the engine pool after every earlier call submitted for file_dir, returns a Future
+        return cls.ENGINE.submit(file_dir, func, *args, **kwargs)
+
+    @classmethod
+    def map_files(cls, func, file_list, *args):
+        # func(file, *args) for every file in parallel, results in file_list order
+        return [future.result() for future in [cls.submit(f, func, f, *args) for f in file_list]]
+
+    @classmethod
+    async def arun(cls, file_dir, func, *args, **kwargs):
+        return await cls.ENGINE.run_async(file_dir, func, *args, **kwargs)
+
+    @classmethod
+    async def areturn_markup_by_page(cls, file_dir, i):
+        return await cls.arun(file_dir, cls.return_markup_by_page, file_dir, i)
+
+    @classmethod
+    async def areturn_markups_for_document(cls, file_dir, pages=None):
+        return await cls.arun(file_dir, cls.return_markups_for_document, file_dir, pages)
+
+    @classmethod
+    async def acopy_markup_batch(cls, file_dir, i, dct):
+        return await cls.arun(file_dir, cls.copy_markup_batch, file_dir, i, dct)
+
+    @classmethod
+    async def apaste_markup(cls, file_dir, i, content, content_replace_dict=None):
+        return await cls.arun(file_dir, cls.paste_markup, file_dir, i, content, content_replace_dict)
+
+    @classmethod
+    async def aset_markup(cls, file_dir, i, markup_ids_dict):
+        return await cls.arun(file_dir, cls.set_markup, file_dir, i, markup_ids_dict)
+
+    @classmethod
+    async def aset_replace(cls, file_dir, i, before, after):
+        return await cls.arun(file_dir, cls.set_replace, file_dir, i, before, after)
+
+    @classmethod
+    async def aset_structured_markups(cls, file_dir, i, context, up_lift):
+        return await cls.arun(file_dir, cls.set_structured_markups, file_dir, i, context, up_lift)
+
+    @classmethod
+    async def apaste_markup_to_file(cls, standard_form, new_file, page_number=1, new_page_number=1, region=None, offset=(0, 0), content_replace_dict=None):
+        # ordered on new_file, the standard form is only read
+        return await cls.arun(new_file, cls.paste_markup_to_file, standard_form, new_file, page_number, new_page_number, region, offset, content_replace_dict)
+
+    @classmethod
+    async def apaste_all_markup_to_file_by_anchor(cls, standard_form, new_file, anchor_color="#7A0000"):
+        return await cls.arun(new_file, cls.paste_all_markup_to_file_by_anchor, standard_form, new_file, anchor_color)
+
+    @classmethod
+    def session(cls, file_dir):
+        # with PCETools.session(file_dir) as s: queue s.copy / s.paste / s.set, saved on exit
+        return ScriptSession(file_dir, lambda command: cls._run_script("session.bci", command), on_write=cls.invalidate_document)
 
     @staticmethod
-    def _replace_control_chars(s):
-        def replacer(match):
-            char = match.group(0)
-            return f'\\u{ord(char):04x}'
-        return re.sub(r'[\x00-\x1F\x7F]', replacer, s)
+    def _parse_markup_text(result_text, fields=None):
+        return parse_markups(result_text, fields)
 
     @staticmethod
     def return_markup_by_page(file_dir, i):
+        found, _ = PCETools.MARKUP_CACHE.get(file_dir, [i])
+        if i in found:
+            return found[i]
         command = f"Open('{file_dir}') MarkupGetExList({i}) Close()"
-
-        result_bytes = subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, command])
+        signature = PCETools.MARKUP_CACHE.signature(file_dir)
+        result_bytes = PCETools._check_output(command, "bluebeam.get_markup", file=file_dir, page=i)
         result_text = result_bytes.decode("gbk").split("\r\n")[1]
-        string = result_text.replace("|\"", "\"").replace("|'", "'").replace("'{", "{").replace("}'", "}").replace("||", "\\").replace("'True'", "true").replace("'False'", "false").replace("'None'", "null").replace("'", '"')
-        if string.strip() == '':
-            return {}
-        string = PCETools._replace_control_chars(string)
-        result_json = json.loads(string)
+        result_json = PCETools._parse_markup_text(result_text)
+        PCETools.MARKUP_CACHE.put(file_dir, {i: result_json}, signature)
         return result_json
 
+    @staticmethod
+    def return_markups_for_document(file_dir, pages=None):
+        # pages are 1-based like return_markup_by_page, all pages by default
+        if pages is None:
+            pages = range(1, PCETools.page_count(file_dir) + 1)
+        pages = list(dict.fromkeys(pages))
+        result, missing = PCETools.MARKUP_CACHE.get(file_dir, pages)
+        if len(missing) > 0:
+            logger.info("return_markups_for_document: {}, pages: {}".format(file_dir, len(missing)))
+            command = [f"Open('{file_dir}')", *[f"MarkupGetExList({i})" for i in missing], "Close()"]
+            signature = PCETools.MARKUP_CACHE.signature(file_dir)
+            result_bytes = PCETools._run_script("get_markup.bci", command)
+            result_text = result_bytes.decode("gbk").split("\r\n")[1::2]
+            if len(result_text) < len(missing):
+                logger.warning("return_markups_for_document: expected {} results, got {}, falling back to single pages".format(len(missing), len(result_text)))
+                fetched = {i: PCETools.return_markup_by_page(file_dir, i) for i in missing}
+            else:
+                fetched = {i: PCETools._parse_markup_text(text) for i, text in zip(missing, result_text)}
+                PCETools.MARKUP_CACHE.put(file_dir, fetched, signature)
+            result.update(fetched)
+        return {i: result[i] for i in pages}
+
+    @staticmethod
+    def build_markup_index(markups, cell_size=None):
+        return MarkupIndex(markups, cell_size)
+
     @staticmethod
     def get_markup_in_region(markups, region):
         # region should be in the format of [x, y, width, height]
+        if isinstance(markups, MarkupIndex):
+            return markups.region(region)
         markups = {k: v for k, v in markups.items() if region[0] < float(v.get('x', -1)) < region[0] + region[2] and region[1] < float(v.get('y', -1)) < region[1] + region[3]}
         return markups
 
@@ -214,75 +441,78 @@ class PCETools:
     @staticmethod
     def copy_markup(file_dir, i, key):
         command = f"Open('{file_dir}') MarkupCopy({i}, '{key}') Close()"
-        result_bytes = subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, command])
+        result_bytes = PCETools._check_output(command, "bluebeam.copy_markup", file=file_dir, page=i)
         result_text = result_bytes.decode("utf-8").split("\n")[1].strip()
         return result_text
 
     @staticmethod
     def paste_markup_single(file_dir, i, format_xml, position):
         command = f"Open('{file_dir}') MarkupPaste({i}, '{format_xml}', {position[0]}, {position[1]}) Save() Close()"
-        result_bytes = subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, command])
+        PCETools.invalidate_document(file_dir)
+        result_bytes = PCETools._check_output(command, "bluebeam.paste_markup", file=file_dir, page=i)
         result_text = result_bytes.decode("utf-8").split("\n")[1].strip()
         return result_text
 
     @staticmethod
-    def get_offset(standard_form, new_file, anchor_color="#7A0000", scale=(28.3463544, 28.3463544)):
+    def anchor_index(file_dir):
+        # AnchorIndex of every page of file_dir, one markup extraction per file until it changes
+        return PCETools.ANCHOR_CACHE.get(file_dir, PCETools.return_markups_for_document)
+
+    @staticmethod
+    def anchor_indexes(file_list, workers=None):
+        # anchor_index of every file, missing ones extracted workers at a time. A pool of its own, not the engine pool:
+        # callers may themselves be running there, queued on one of these files
+        if len(file_list) <= 1:
+            return [PCETools.anchor_index(f) for f in file_list]
+        with ThreadPoolExecutor(min(workers or PCETools.ENGINE.max_workers, len(file_list)), thread_name_prefix="pce-anchors") as pool:
+            return list(pool.map(PCETools.anchor_index, file_list))
+
+    @staticmethod
+    def get_offsets(standard_form, file_list, anchor_color="#7A0000", scale=(28.3463544, 28.3463544), workers=None):
+        # [[(dx, dy) per page] per file] of the anchor_color markup in each file against the same page of standard_form,
+        # one markup extraction per file
         pages = PCETools.page_count(standard_form)
-        assert pages == PCETools.page_count(new_file), "file page count mismatch"
-        offsets = []
-        for i in range(1, pages + 1):
-            markups_1, markups_2 = PCETools.return_markup_by_page(standard_form, i), PCETools.return_markup_by_page(new_file, i)
-            markups_1, markups_2 = [markup for markup in markups_1.values() if markup["color"].lower() == anchor_color.lower()], [markup for markup in markups_2.values() if markup["color"].lower() == anchor_color.lower()]
-            assert len(markups_1) > 0 and len(markups_2) > 0, "expected markup with the color {}, but found ({}, {})".format(anchor_color, len(markups_1), len(markups_2))
-            markup_1, markup_2 = markups_1[0], markups_2[0]
-            offset = (float(markup_2['x']) - float(markup_1['x']), float(markup_2['y']) - float(markup_1['y']))
-            offset = (offset[0] / scale[0], offset[1] / scale[1])
-            offsets.append(offset)
-        return offsets
+        for new_file in file_list:
+            assert pages == PCETools.page_count(new_file), "file page count mismatch: {}".format(new_file)
+        form = PCETools.anchor_index(standard_form)
+        result = []
+        for index in PCETools.anchor_indexes(file_list, workers):
+            offsets = []
+            for i in range(1, pages + 1):
+                (x1, y1), (x2, y2) = form.anchor(i, color=anchor_color), index.anchor(i, color=anchor_color)
+                offsets.append(((x2 - x1) / scale[0], (y2 - y1) / scale[1]))
+            result.append(offsets)
+        return result
+
+    @staticmethod
+    def get_offset(standard_form, new_file, anchor_color="#7A0000", scale=(28.3463544, 28.3463544)):
+        return PCETools.get_offsets(standard_form, [new_file], anchor_color, scale)[0]
 
     @staticmethod
     def copy_markup_batch(file_dir, i, dct):
         logger.info("page: {}, copy: {}".format(i, len(dct)))
         command = [f"Open('{file_dir}')", *[f"MarkupCopy({i}, '{key}')" for key in dct.keys()], "Close()"]
-        with open("copy_markup.bci", 'w') as f:
-            f.write('\n'.join(command))
-        result_bytes = subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, "Script('copy_markup.bci')"])
+        result_bytes = PCETools._run_script("copy_markup.bci", command)
         result_text = result_bytes.decode("utf-8").split("\r\n")[1::2]
         logger.info("page: {}, copy: {} result".format(i, len(result_text)))
-        os.remove("copy_markup.bci")
         return result_text
 
     @staticmethod
     def paste_markup(file_dir, i, content, content_replace_dict=None):
-        # paste
         logger.info("page: {}, paste: {}".format(i, len(content)))
-        command = [f"Open('{file_dir}')"]
-        for item in content:
-            format_xml, position = item
-            new_position = (position[1] + position[2], position[0]) if all([position[i] is not None for i in range(3)]) else (0, 0)
-            command.append(f"MarkupPaste({i}, '{format_xml}', {new_position[0]}, {new_position[1]})")
-        command.extend(["Save()", "Close()"])
-        with open("paste_markup.bci", 'w') as f:
-            f.write('\n'.join(command))
-        markup_ids = subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, "Script('paste_markup.bci')"])
-        markup_ids_result = [markup_id.strip() for markup_id in markup_ids.decode('utf-8').strip().split('\r\n')]
-        line_id, markup_ids = 0, []
-        while line_id < len(markup_ids_result):
-            k = int(markup_ids_result[line_id])
-            markup_ids.append(markup_ids_result[line_id + 1: line_id + 1 + k])
-            line_id += 1 + k
-        # set
-        logger.info("paste_markup: page: {}, set: {}".format(i, len(markup_ids)))
-        markup_setter = {}
-        for item, markup_id in zip(content, markup_ids):
-            if any([item[1][i] is None for i in range(3)]):
-                continue
-            markup_id = markup_id[0]
-            markup_setter[markup_id] = {"x": str(item[1][0]), "y": str(item[1][1])}
-            if content_replace_dict is not None and item[1][3] in content_replace_dict:
-                markup_setter[markup_id]["comment"] = content_replace_dict[item[1][3]]
-        PCETools.set_markup(file_dir, i, markup_setter)
-        os.remove("paste_markup.bci")
+        with PCETools.session(file_dir) as s:
+            markup_setter = {}
+            for item in content:
+                format_xml, position = item
+                new_position = (position[1] + position[2], position[0]) if all([position[i] is not None for i in range(3)]) else (0, 0)
+                markup_id = s.paste(i, format_xml, new_position)
+                if any([position[i] is None for i in range(3)]):
+                    continue
+                markup_setter[markup_id] = {"x": str(position[0]), "y": str(position[1])}
+                if content_replace_dict is not None and position[3] in content_replace_dict:
+                    markup_setter[markup_id]["comment"] = content_replace_dict[position[3]]
+            logger.info("paste_markup: page: {}, set: {}".format(i, len(markup_setter)))
+            s.set(i, markup_setter)
 
     @staticmethod
     def set_markup(file_dir, i, markup_ids_dict):
@@ -291,10 +521,8 @@ class PCETools:
             command.append("MarkupSet({}, '{}', '{}')".format(i, markup_id, json.dumps(cont)))
         command.extend(["Save()", "Close()"])
         logger.info("paste_markup for page {} Complete.".format(i))
-        with open("set_markup.bci", 'w') as f:
-            f.write('\n'.join(command))
-        _ = subprocess.check_output([PCETools.BLUEBEAM_ENGINE_DIR, "Script('set_markup.bci')"])
-        os.remove("set_markup.bci")
+        PCETools.invalidate_document(file_dir)
+        _ = PCETools._run_script("set_markup.bci", command)
 
     @staticmethod
     def set_replace(file_dir, i, before, after):
@@ -320,44 +548,59 @@ class PCETools:
 
     @staticmethod
     def paste_all_markup_to_file_by_anchor(standard_form, new_file, anchor_color="#7A0000"):
-        pages = PCETools.page_count(standard_form)
-        assert pages == PCETools.page_count(new_file), "file page count mismatch"
-        for i in range(1, pages + 1):
-            markups_1, markups_2 = PCETools.return_markup_by_page(standard_form, i), PCETools.return_markup_by_page(new_file, i)
-            markups_1, markups_2 = [markup for markup in markups_1.values() if markup["color"].lower() == anchor_color.lower()], [markup for markup in markups_2.values() if markup["color"].lower() == anchor_color.lower()]
-            assert len(markups_1) > 0 and len(markups_2) > 0, "expected markup with the color {}, but found ({}, {})".format(anchor_color, len(markups_1), len(markups_2))
-            markup_1, markup_2 = markups_1[0], markups_2[0]
-            offset = (float(markup_2['x']) - float(markup_1['x']), float(markup_2['y']) - float(markup_1['y']))
-            PCETools.paste_markup_to_file(standard_form, new_file, i, i, offset)
-
-    @staticmethod
-    def mix_patch(standard_form, file_list, output_path):
-        markups = PCETools.return_markup_by_page(standard_form, 1)
-        color_position = {item["color"].upper(): (float(item["x"]), float(item["y"])) for item in markups.values()}
+        offsets = PCETools.get_offset(standard_form, new_file, anchor_color, scale=(1, 1))
+        for i, offset in enumerate(offsets, 1):
+            PCETools.paste_markup_to_file(standard_form, new_file, i, i, offset=offset)
+
+    @staticmethod
+    @traced("mix_patch.pages")
+    def _mix_pages(task):
+        # merged SVGs stay in memory, only the page PDFs Bluebeam pastes markups into are written
+        standard_form_size, pages = task
+        svg_list, pdf_list = [], [pdf_path for _, pdf_path in pages]
+        for layers, _ in pages:
+            et_list = [PCETools.get_ET(file_name, page_number, None if k == 0 else "svg{}".format(k)) for k, (file_name, page_number, _) in enumerate(layers)]
+            svg_list.append(PCETools.merge_page(et_list, [coord for _, _, coord in layers], standard_form_size, rename_ids=False))
+        for pdf_bytes, pdf_path in zip(PCETools.svgs_to_pdf_bytes(svg_list), pdf_list):
+            new_size = PCETools.page_size(pdf_bytes, 0)
+            # TODO: This should be removed if svg_to_pdf is fixed well
+            PCETools.resize_pdf(pdf_bytes, '100', new_size[0], new_size[1], 100 / standard_form_size[0] * new_size[0], standard_form_size[0], standard_form_size[1], pdf_path)
+        return pdf_list
+
+    @staticmethod
+    @traced("job.mix_patch", file=0)
+    def mix_patch(standard_form, file_list, output_path, workers=1, max_in_flight=None, chunk_size=None):
+        # workers > 1 renders pages in a process pool, at most max_in_flight chunks of chunk_size pages at a time
+        form = PCETools.anchor_index(standard_form)
+        color_position = {color: positions[-1] for (field, color), positions in form.pages[1].items() if field == "color"}
         page_counts = [PCETools.page_count(f) for f in file_list]
+        file_anchors = PCETools.anchor_indexes(file_list)
+        standard_form_size = PCETools.page_size(standard_form, 0)
+        pages = []
         for i in range(max(page_counts)):
-            et_list, coord_list = [], []
+            layers = []
             for j in range(len(file_list)):
                 if i >= page_counts[j]:
                     continue
-                markup_list = list(PCETools.return_markup_by_page(file_list[j], i + 1).values())
-                markup_item = [(markup["color"].upper(), (float(markup["x"]), float(markup["y"]))) for markup in markup_list if markup["color"].upper() in color_position]
+                markup_item = [(color, position) for color in color_position for position in file_anchors[j].positions(i + 1, color=color)]
                 assert len(markup_item) == 1, f"Bad page in {file_list[j]}, page {i}: {markup_item}"
                 markup_item = markup_item[0]
-                coord_list.append((color_position[markup_item[0]][0] - markup_item[1][0], color_position[markup_item[0]][1] - markup_item[1][1]))
-                et_list.append(PCETools.get_ET(file_list[j], i))
-            standard_form_size = PCETools.page_size(standard_form, 0)
-            PCETools.merge_page(et_list, coord_list, standard_form_size, os.path.join(PCETools.TEMP_PATH, f"{output_path}.{i}.svg"))
-            pdf_path = os.path.join(PCETools.TEMP_PATH, f"{output_path}.{i}.pdf")
-            PCETools.svg_to_pdf(os.path.join(PCETools.TEMP_PATH, f"{output_path}.{i}.svg"), pdf_path)
-            new_size = PCETools.page_size(pdf_path, 0)
-            # TODO: This should be removed if svg_to_pdf is fixed well
-            PCETools.resize_pdf(pdf_path, '100', new_size[0], new_size[1], 100 / standard_form_size[0] * new_size[0], standard_form_size[0], standard_form_size[1], pdf_path)
-            PCETools.paste_markup_to_file(standard_form, pdf_path)
-            if os.path.exists(os.path.join(PCETools.TEMP_PATH, f"{output_path}.{i}.svg")):
-                os.remove(os.path.join(PCETools.TEMP_PATH, f"{output_path}.{i}.svg"))
-        pdf_list = [os.path.join(PCETools.TEMP_PATH, f"{output_path}.{i}.pdf") for i in range(max(page_counts))]
+                layers.append((file_list[j], i, (color_position[markup_item[0]][0] - markup_item[1][0], color_position[markup_item[0]][1] - markup_item[1][1])))
+            pages.append((layers, os.path.join(PCETools.TEMP_PATH, f"{output_path}.{i}.pdf")))
+        if chunk_size is None:
+            # a chunk of merged SVGs is held in memory and converted in one batch
+            chunk_size = max(1, min(8, len(pages) // max(workers, 1)))
+        tasks = [(standard_form_size, chunk) for chunk in chunked(pages, chunk_size)]
+        pdf_list = []
+        for pdf_chunk in imap_bounded(PCETools._mix_pages, tasks, workers, max_in_flight, PCETools._apply_environment, (PCETools._environment(), )):
+            for pdf_path in pdf_chunk:
+                PCETools.invalidate_document(pdf_path)
+                PCETools.paste_markup_to_file(standard_form, pdf_path)
+                PCETools.invalidate_document(pdf_path)
+            pdf_list.extend(pdf_chunk)
+            logger.info("mix_patch: {} / {} pages done".format(len(pdf_list), len(pages)))
         PCETools.combine_pdf(pdf_list, output_path)
+        PCETools.invalidate_document(*pdf_list)
         for f in pdf_list:
             if os.path.exists(f):
                 os.remove(f)
@@ -370,23 +613,15 @@ class PCETools:
         return set(final_list)
 
     @staticmethod
+    @traced("job.pdf_set_color", file=0)
     def pdf_set_color(page, page_numbers, pre_color, post_color, output_path):
-        page_count = PCETools.page_count(page)
-        output_file = os.path.basename(output_path)
-        svg_list = [os.path.join(PCETools.TEMP_PATH, f"{output_file}.{i}.svg") for i in range(page_count)]
-        pdf_list = [os.path.join(PCETools.TEMP_PATH, f"{output_file}.{i}.pdf") for i in range(page_count)]
-        for page_number in range(page_count):
+        svg_list = []
+        for page_number in range(PCETools.page_count(page)):
             svg_file = PCETools._get_svg_bytes_from_pdf(page, page_number)
             if page_number in page_numbers:
                 svg_file = svg_file.replace(pre_color.lower(), post_color).replace(pre_color.upper(), post_color)
-            with open(svg_list[page_number], 'w') as f:
-                f.write(svg_file)
-            PCETools.svg_to_pdf(svg_list[page_number], pdf_list[page_number])
-        PCETools.combine_pdf(pdf_list, output_path)
-        for f in svg_list:
-            os.remove(f)
-        for f in pdf_list:
-            os.remove(f)
+            svg_list.append(svg_file)
+        PCETools.combine_pdf(PCETools.svgs_to_pdf_bytes(svg_list), output_path)
 
     @staticmethod
     def pdf_color_v2(page, page_number):
@@ -402,12 +637,17 @@ class PCETools:
         return result
 
     @staticmethod
+    @traced("pdf.color_inventory", file=0)
+    def pdf_color_inventory(page, page_numbers=None, workers=1):
+        # fill / stroke color counts of every page and of the whole document, read from the content streams and form
+        # XObjects instead of an SVG per page; gray, rgb and cmyk operators all come back as "#RRGGBB"
+        return color_inventory(page, page_numbers, workers)
+
+    @staticmethod
+    @traced("job.pdf_set_color_v2", file=0)
     def pdf_set_color_v2(page, page_numbers, pre_color, post_color, output_path, opacity=1.0):
-        page_count = PCETools.page_count(page)
-        output_file = os.path.basename(output_path)
-        svg_list = [os.path.join(PCETools.TEMP_PATH, f"{output_file}.{i}.svg") for i in range(page_count)]
-        pdf_list = [os.path.join(PCETools.TEMP_PATH, f"{output_file}.{i}.pdf") for i in range(page_count)]
-        for page_number in range(page_count):
+        svg_list = []
+        for page_number in range(PCETools.page_count(page)):
             et = PCETools.get_ET(page, page_number)
             if page_number in page_numbers:
                 for elem in et.iter():
@@ -419,66 +659,59 @@ class PCETools:
                         elem.attrib["stroke"] = elem.attrib["stroke"].replace(pre_color.lower(), post_color).replace(pre_color.upper(), post_color)
                         if float(opacity) < 1.0:
                             elem.attrib["stroke-opacity"] = str(opacity)
-            with open(svg_list[page_number], 'wb') as f:
-                root = ET.ElementTree(et)
-                root.write(f)
-            PCETools.svg_to_pdf(svg_list[page_number], pdf_list[page_number])
-        PCETools.combine_pdf(pdf_list, output_path)
-        for f in svg_list:
-            os.remove(f)
-        for f in pdf_list:
-            os.remove(f)
+            svg_list.append(ET.tostring(et))
+        PCETools.combine_pdf(PCETools.svgs_to_pdf_bytes(svg_list), output_path)
+
+    @staticmethod
+    @traced("pdf.recolor", file=0)
+    def pdf_set_color_v3(page, page_numbers, pre_color, post_color, output_path, opacity=1.0, tolerance=0):
+        # rewrites the color operators in the content streams, pages not in page_numbers are left as they are
+        PCETools.invalidate_document(output_path)
+        stats = recolor_pdf(page, page_numbers, pre_color, post_color, output_path, opacity, tolerance)
+        logger.info("pdf_set_color_v3: {} color operators changed on {} pages".format(sum(stats.values()), len(stats)))
+        return stats
 
     @staticmethod
+    @traced("pdf.split", file=0)
     def split_pdf(input_pdf, output_dir):
         with open(input_pdf, 'rb') as file:
             reader = pypdf.PdfReader(file)
             if len(reader.pages) == 1:
                 output_list = [os.path.join(output_dir, '0.pdf')]
+                PCETools.invalidate_document(output_list[0])
                 shutil.copy(input_pdf, output_list[0])
                 return output_list
             for i in range(len(reader.pages)):
                 writer = pypdf.PdfWriter()
                 writer.add_page(reader.pages[i])
                 output_pdf = os.path.join(output_dir, '{}.pdf'.format(i))
+                PCETools.invalidate_document(output_pdf)
                 with open(output_pdf, 'wb') as output_file:
                     writer.write(output_file)
             return [os.path.join(output_dir, '{}.pdf'.format(i)) for i in range(len(reader.pages))]
 
+    @staticmethod
+    @traced("pdf.transform", file=0)
+    def transform_pages(input_file, output_file, transforms, workers=1, shard_size=None):
+        # transforms: {page: pypdf.Transformation | (x, y) offset | {"offset", "content_scale", "page_scale", "transformation"}}
+        if output_file is not None:
+            PCETools.invalidate_document(output_file)
+        return transform_pages(input_file, output_file, transforms, workers, shard_size)
+
     @staticmethod
     def pdf_content_move(input_file, output_file, offset, pages="all"):
-        reader = pypdf.PdfReader(input_file)
-        writer = pypdf.PdfWriter()
-        page = reader.pages[0]
-        offset_x, offset_y = offset
-        for page_id in range(len(reader.pages)):
-            if pages != 'all' and (type(pages) == 'list' and page_id not in pages):
-                writer.add_page(page)
-                continue
-            assert page.rotation in [0, 90, 180, 270]
-            if page.rotation == 0:
-                op = pypdf.Transformation().translate(offset_x, offset_y)
-            elif page.rotation == 90:
-                op = pypdf.Transformation().translate(-offset_y, offset_x)
-            elif page.rotation == 180:
-                op = pypdf.Transformation().translate(-offset_x, -offset_y)
-            else:
-                op = pypdf.Transformation().translate(offset_y, -offset_x)
-            page.add_transformation(op)
-            writer.add_page(page)
-        writer.write(output_file)
+        page_ids = range(PCETools.page_count(input_file)) if pages == "all" else pages
+        PCETools.transform_pages(input_file, output_file, {page_id: offset for page_id in page_ids})
 
     @staticmethod
     def get_structured_markups_from(markups, context, tol=6, offset=(0, 0)):
-        def inside_with_tol(pos, target, tol, offset):
-            pos = (pos[0] + offset[0], pos[1] + offset[1])
-            return pos[0] - tol / 2 < target[0] < pos[0] + tol / 2 and pos[1] - tol / 2 < target[1] < pos[1] + tol / 2
+        # markups may be a prebuilt MarkupIndex, nested calls reuse it
+        if not isinstance(markups, MarkupIndex):
+            markups = MarkupIndex(markups)
         def get_markup_info_with_tol(markups, pos, tol, offset):
             result = []
-            for ki, vi in markups.items():
-                x, y, comment = float(vi.get('x', 0)), float(vi.get('y', 0)), vi.get('comment', 0)
-                if inside_with_tol(pos, (x, y), tol, offset):
-                    result.append([ki, [x, y, comment]])
+            for i in markups.query_point((pos[0] + offset[0], pos[1] + offset[1]), tol):
+                result.append([markups.keys[i], [float(markups.x[i]), float(markups.y[i]), markups.values[i].get('comment', 0)]])
             return result
         result = {}
         for item, v in copy.deepcopy(context).items():
@@ -508,13 +741,14 @@ class PCETools:
         context = copy.deepcopy(context)
         version = context.pop("VERSION")
         assert len(version) > 0, "At least one version Row in the page"
-        PCETools.set_markup(file_dir, i, {k: {"x": str(x), "y": str(y), "comment": comment} for _, (k, (x, y, comment)) in context.items()})
-        for j, item in enumerate(version):
-            PCETools.set_markup(file_dir, i, {k: {"x": str(x), "y": str(y), "comment": comment} for _, (k, (x, y, comment)) in item.items() if k not in ("", None)})
-            for name, (k, (_, _, comment)) in item.items():
-                if k not in ("", None):
-                    continue
-                markup_content = PCETools.copy_markup(file_dir, i, version[0][name][0])
-                k = PCETools.paste_markup_single(file_dir, i, markup_content, (0, 0))
-                x, y = version[0][name][1][0], version[0][name][1][1]
-                PCETools.set_markup(file_dir, i, {k: {"x": str(x + j * up_lift[0]), "y": str(y + j * up_lift[1]), "comment": comment}})
+        with PCETools.session(file_dir) as s:
+            s.set(i, {k: {"x": str(x), "y": str(y), "comment": comment} for _, (k, (x, y, comment)) in context.items()})
+            for j, item in enumerate(version):
+                s.set(i, {k: {"x": str(x), "y": str(y), "comment": comment} for _, (k, (x, y, comment)) in item.items() if k not in ("", None)})
+                for name, (k, (_, _, comment)) in item.items():
+                    if k not in ("", None):
+                        continue
+                    markup_content = s.copy(i, version[0][name][0])
+                    k = s.paste(i, markup_content, (0, 0))
+                    x, y = version[0][name][1][0], version[0][name][1][1]
+                    s.set(i, {k: {"x": str(x + j * up_lift[0]), "y": str(y + j * up_lift[1]), "comment": comment}})
@@ -0,0 +1,25 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def imap_bounded(func, items, workers=1, max_in_flight=None, initializer=None, initargs=()):
+    # like Pool.imap: results come back in order, but at most max_in_flight tasks are submitted at a time
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    max_in_flight = workers * 2 if max_in_flight is None else max(1, max_in_flight)
+    with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+def chunked(items, chunk_size):
+    items = list(items)
+    chunk_size = max(1, chunk_size)
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
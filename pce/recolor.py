@@ -0,0 +1,272 @@
+import os
+import re
+import fitz
+from pypdf.generic import ContentStream, DecodedStreamObject, FloatObject, NameObject
+
+FILL_OPS, STROKE_OPS = (b'rg', b'sc', b'scn', b'g'), (b'RG', b'SC', b'SCN', b'G')
+GRAY_OPS = (b'g', b'G')
+# a path starts with m / re and ends with one of PAINT_OPS
+PATH_START_OPS, PAINT_OPS = (b'm', b're'), (b'S', b's', b'f', b'F', b'f*', b'B', b'B*', b'b', b'b*', b'n')
+TEXT_SHOW_OPS = (b'Tj', b'TJ', b"'", b'"')
+SPACE_OPS = {b'rg': True, b'RG': True, b'g': False, b'G': False, b'k': False, b'K': False}
+
+
+def gs_name(stroke, alpha):
+    # ExtGState injected to set the fill / stroke alpha, e.g. PCEFillAlpha0_5
+    return "PCE{}Alpha{}".format("Stroke" if stroke else "Fill", "{:g}".format(alpha).replace(".", "_"))
+
+
+def hex_to_rgb(color):
+    color = color.lstrip('#')
+    assert len(color) == 6, "expected a #rrggbb color, got {}".format(color)
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _color_operands(operands, op):
+    if not all(isinstance(v, (int, float)) for v in operands):
+        return None
+    if op in GRAY_OPS and len(operands) == 1:
+        return [float(operands[0])] * 3
+    if len(operands) == 3:
+        return [float(v) for v in operands]
+    return None
+
+
+def recolor_operations(operations, pre_rgb, post_rgb, opacity=1.0, tolerance=0, gs_alpha=None, rgb_space=None):
+    # returns (new operations, number of rewritten color operators, {injected ExtGState name: (key, alpha)}).
+    # sc / scn only match in an RGB color space: DeviceRGB or, through rgb_space(name), a CalRGB / ICC RGB resource
+    # the injected alpha is set right before a path or text show painted in a recolored color and set back to the
+    # content's own alpha (gs_alpha(name) gives the ca / CA a content gs operator sets) right after its painting op,
+    # so images, shadings and other paints keep their alpha
+    new_color = [FloatObject(round(v / 255, 4)) for v in post_rgb]
+    # recolored: whether the current color is a recolored one, applied: whether the injected alpha is on,
+    # content: the content's own alpha, rgb: whether the current color space is an RGB one
+    recolored, applied, content, stack, gs_used = {False: False, True: False}, {False: False, True: False}, {False: 1.0, True: 1.0}, [], {}
+    rgb = {False: False, True: False}
+    result, changed, in_path = [], 0, False
+
+    def set_alpha(stroke, value):
+        name = gs_name(stroke, value)
+        gs_used[name] = ("CA" if stroke else "ca", value)
+        result.append(([NameObject("/" + name)], b'gs'))
+
+    def apply_alpha(stroke):
+        if recolored[stroke] and not applied[stroke]:
+            set_alpha(stroke, opacity)
+            applied[stroke] = True
+
+    def restore_alpha(stroke):
+        if applied[stroke]:
+            set_alpha(stroke, content[stroke])
+            applied[stroke] = False
+
+    for operands, op in operations:
+        if op == b'q':
+            stack.append((dict(recolored), dict(content), dict(rgb)))
+        elif op == b'Q' and len(stack) > 0:
+            recolored, content, rgb = stack.pop()
+        elif op in (b'cs', b'CS') and len(operands) == 1:
+            name = str(operands[0]).lstrip("/")
+            rgb[op == b'CS'] = name == "DeviceRGB" or (rgb_space is not None and rgb_space(name))
+            recolored[op == b'CS'] = False
+        elif op in SPACE_OPS:
+            rgb[op.isupper()] = SPACE_OPS[op]
+        elif op == b'gs' and gs_alpha is not None and len(operands) == 1:
+            values = gs_alpha(str(operands[0]).lstrip("/"))
+            for stroke, key in ((False, "ca"), (True, "CA")):
+                if key in values:
+                    content[stroke] = values[key]
+        elif op in PATH_START_OPS or op in TEXT_SHOW_OPS:
+            in_path = in_path or op in PATH_START_OPS
+            apply_alpha(False)
+            apply_alpha(True)
+        if op in FILL_OPS or op in STROKE_OPS:
+            stroke = op in STROKE_OPS
+            values = _color_operands(operands, op) if op in SPACE_OPS or rgb[stroke] else None
+            matched = values is not None and all(abs(round(v * 255) - c) <= tolerance for v, c in zip(values, pre_rgb))
+            recolored[stroke] = matched and opacity < 1.0
+            if matched:
+                result.append((list(new_color), (b'RG' if stroke else b'rg') if op in GRAY_OPS else op))
+                changed += 1
+                # some writers set the color inside the path, right before painting it
+                if in_path:
+                    apply_alpha(stroke)
+                continue
+            restore_alpha(stroke)
+        result.append((operands, op))
+        if op in PAINT_OPS or op in TEXT_SHOW_OPS:
+            in_path = False
+            restore_alpha(False)
+            restore_alpha(True)
+    return result, changed, gs_used
+
+
+def _recolor_stream(data, pre_rgb, post_rgb, opacity, tolerance, gs_alpha=None, rgb_space=None):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    content = ContentStream(stream, None)
+    operations, changed, gs_used = recolor_operations(content.operations, pre_rgb, post_rgb, opacity, tolerance, gs_alpha, rgb_space)
+    if changed == 0:
+        return None, 0, gs_used
+    content.operations = operations
+    return content.get_data(), changed, gs_used
+
+
+def _resources_owner(doc, xref):
+    # (xref, key path) of the Resources dictionary, following indirect objects and inherited page resources
+    while True:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind == "xref":
+            return int(value.split()[0]), ""
+        if kind == "dict":
+            return xref, "Resources"
+        kind, value = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            return xref, "Resources"
+        xref = int(value.split()[0])
+
+
+def _gs_alpha(doc, xref):
+    # name -> {"ca": alpha, "CA": alpha}, what an ExtGState of xref's resources sets of the two
+    owner, path = _resources_owner(doc, xref)
+    prefix = "ExtGState" if path == "" else path + "/ExtGState"
+
+    def lookup(name):
+        values = {}
+        for key in ("ca", "CA"):
+            kind, value = doc.xref_get_key(owner, "{}/{}/{}".format(prefix, name, key))
+            if kind in ("float", "int"):
+                values[key] = float(value)
+        return values
+    return lookup
+
+
+def _rgb_space(doc, xref):
+    # name -> whether a ColorSpace of xref's resources is a CalRGB or 3 component ICCBased space
+    owner, path = _resources_owner(doc, xref)
+    prefix = "ColorSpace" if path == "" else path + "/ColorSpace"
+
+    def lookup(name):
+        kind, value = doc.xref_get_key(owner, "{}/{}".format(prefix, name))
+        if kind == "xref":
+            value = doc.xref_object(int(value.split()[0]), compressed=True)
+        match = re.match(r"\s*\[\s*/(\w+)\s*(?:(\d+)\s+\d+\s+R)?", value)
+        if match is None:
+            return value.strip() == "/DeviceRGB"
+        if match.group(1) == "ICCBased" and match.group(2) is not None:
+            return doc.xref_get_key(int(match.group(2)), "N") == ("int", "3")
+        return match.group(1) in ("CalRGB", "DeviceRGB")
+    return lookup
+
+
+def _add_ext_gstates(doc, xref, gs_used):
+    owner, path = _resources_owner(doc, xref)
+    sub_path = "ExtGState" if path == "" else path + "/ExtGState"
+    kind, value = doc.xref_get_key(owner, sub_path)
+    if kind == "xref":
+        owner, sub_path = int(value.split()[0]), ""
+    for name, (key, alpha) in gs_used.items():
+        doc.xref_set_key(owner, name if sub_path == "" else sub_path + "/" + name, f"<</Type/ExtGState/{key} {alpha}>>")
+
+
+def _is_form(doc, xref):
+    return doc.xref_get_key(xref, "Subtype") == ("name", "/Form")
+
+
+def _private_xobjects(doc, xref):
+    # make xref's Resources and their XObject dictionary direct objects of xref, so repointing one of its names
+    # doesn't change the other pages / forms sharing them
+    owner, path = _resources_owner(doc, xref)
+    if owner != xref or path == "":
+        doc.xref_set_key(xref, "Resources", doc.xref_object(owner, compressed=True) if path == "" else doc.xref_get_key(owner, "Resources")[1])
+    kind, value = doc.xref_get_key(xref, "Resources/XObject")
+    if kind == "xref":
+        doc.xref_set_key(xref, "Resources/XObject", doc.xref_object(int(value.split()[0]), compressed=True))
+
+
+def _copy_stream_object(doc, xref):
+    new_xref = doc.get_new_xref()
+    doc.update_object(new_xref, doc.xref_object(xref, compressed=True))
+    doc.update_stream(new_xref, doc.xref_stream(xref), compress=True)
+    return new_xref
+
+
+def _repoint(doc, xref, names):
+    if len(names) > 0:
+        _private_xobjects(doc, xref)
+        for name, new_xref in names:
+            doc.xref_set_key(xref, "Resources/XObject/" + name, f"{new_xref} 0 R")
+
+
+def recolor_pdf(input_file, page_numbers, pre_color, post_color, output_file, opacity=1.0, tolerance=0):
+    # page_numbers are 0-based, returns {page_number: rewritten color operators}.
+    # a form xobject also drawn by other pages is recolored in a copy the selected pages are repointed at
+    pre_rgb, post_rgb, opacity = hex_to_rgb(pre_color), hex_to_rgb(post_color), float(opacity)
+    doc = fitz.open(input_file)
+    page_numbers = set(page_numbers)
+    form_pages = {}
+    for page in doc:
+        for xref, *_ in page.get_xobjects():
+            if _is_form(doc, xref):
+                form_pages.setdefault(xref, set()).add(page.number)
+    done_forms, copies, visiting = set(), {}, set()
+
+    def recolor_form(xref, children):
+        # (rewritten color operators, xref of the copy the invoker must point at or None)
+        shared = not form_pages.get(xref, set()) <= page_numbers
+        if xref in copies:
+            return 0, copies[xref]
+        if xref in done_forms or xref in visiting:
+            return 0, None
+        visiting.add(xref)
+        data, changed, gs_used = _recolor_stream(doc.xref_stream(xref), pre_rgb, post_rgb, opacity, tolerance, _gs_alpha(doc, xref), _rgb_space(doc, xref))
+        names = []
+        for name, child in children.get(xref, []):
+            child_changed, child_copy = recolor_form(child, children)
+            changed += child_changed
+            if child_copy is not None:
+                names.append((name, child_copy))
+        visiting.discard(xref)
+        target = xref
+        if shared and (data is not None or len(names) > 0):
+            target = copies[xref] = _copy_stream_object(doc, xref)
+        else:
+            done_forms.add(xref)
+        if data is not None:
+            doc.update_stream(target, data, compress=True)
+            _add_ext_gstates(doc, target, gs_used)
+        _repoint(doc, target, names)
+        return changed, target if target != xref else None
+
+    stats = {}
+    for page_number in sorted(page_numbers):
+        if not 0 <= page_number < doc.page_count:
+            continue
+        page = doc[page_number]
+        data, changed, gs_used = _recolor_stream(page.read_contents(), pre_rgb, post_rgb, opacity, tolerance, _gs_alpha(doc, page.xref), _rgb_space(doc, page.xref))
+        if data is not None:
+            # a fresh stream, the old ones may be shared with other pages
+            new_xref = doc.get_new_xref()
+            doc.update_object(new_xref, "<<>>")
+            doc.update_stream(new_xref, data, compress=True)
+            doc.xref_set_key(page.xref, "Contents", f"{new_xref} 0 R")
+            _add_ext_gstates(doc, page.xref, gs_used)
+        # {invoker: [(name, form xref)]}, the page itself is invoker 0
+        children = {}
+        for xref, name, invoker, _ in page.get_xobjects():
+            if _is_form(doc, xref):
+                children.setdefault(invoker, []).append((name, xref))
+        names = []
+        for name, xref in children.get(0, []):
+            form_changed, form_copy = recolor_form(xref, children)
+            changed += form_changed
+            if form_copy is not None:
+                names.append((name, form_copy))
+        _repoint(doc, page.xref, names)
+        stats[page_number] = changed
+    if os.path.abspath(output_file) == os.path.abspath(input_file):
+        doc.save(output_file, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+    else:
+        doc.save(output_file, garbage=1)
+    doc.close()
+    return stats
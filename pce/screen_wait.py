@@ -0,0 +1,84 @@
+import time
+import numpy as np
+
+
+class ScreenWaiter:
+    # Polls the screen until something happens instead of sleeping a fixed time. screenshot() returns a frame
+    # (a PIL image from pyautogui, or anything numpy.asarray turns into a height x width x channels array) and
+    # window_title() the title of the active window, so both can be replaced by synthetic ones in tests.
+    # Polling starts at interval and backs off by backoff up to max_interval; a wait that runs past its timeout
+    # raises TimeoutError.
+    def __init__(self, screenshot, window_title=None, timeout=30.0, interval=0.05, max_interval=0.5, backoff=1.5,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.screenshot = screenshot
+        self.window_title = window_title
+        self.timeout = timeout
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.clock = clock
+        self.sleep = sleep
+
+    def until(self, condition, timeout=None, description="condition"):
+        # returns the first truthy condition() result
+        timeout = self.timeout if timeout is None else timeout
+        deadline, interval = self.clock() + timeout, self.interval
+        while True:
+            result = condition()
+            if result:
+                return result
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                raise TimeoutError("{} not met within {}s".format(description, timeout))
+            self.sleep(min(interval, remaining))
+            interval = min(interval * self.backoff, self.max_interval)
+
+    def grab(self, region=None):
+        # region: (left, top, right, bottom) in pixels, None for the whole screen
+        frame = np.asarray(self.screenshot())
+        if region is None:
+            return frame
+        left, top, right, bottom = region
+        return frame[top:bottom, left:right]
+
+    def pixel(self, position):
+        x, y = position
+        return tuple(int(c) for c in self.grab((x, y, x + 1, y + 1))[0, 0][:3])
+
+    @staticmethod
+    def _same(a, b):
+        return a.shape == b.shape and np.array_equal(a, b)
+
+    def for_change(self, region=None, reference=None, timeout=None):
+        # until the region looks different from reference (default: how it looks now), returns the new region
+        reference = self.grab(region) if reference is None else np.asarray(reference)
+        seen = [reference]
+
+        def changed():
+            seen[0] = self.grab(region)
+            return not self._same(seen[0], reference)
+        self.until(changed, timeout, "change in {}".format(region))
+        return seen[0]
+
+    def for_stable(self, region=None, settle=0.3, timeout=None):
+        # until the region has not changed for settle seconds, e.g. a page finished rendering; returns the region
+        seen, since = [self.grab(region)], [self.clock()]
+
+        def stable():
+            current = self.grab(region)
+            if not self._same(current, seen[0]):
+                seen[0], since[0] = current, self.clock()
+            return self.clock() - since[0] >= settle
+        self.until(stable, timeout, "{} to settle".format(region))
+        return seen[0]
+
+    def for_pixel(self, position, color, tolerance=0, timeout=None):
+        # until the pixel at position is color (r, g, b), each channel within tolerance
+        def matches():
+            return all(abs(a - b) <= tolerance for a, b in zip(self.pixel(position), color))
+        return self.until(matches, timeout, "{} at {}".format(color, position))
+
+    def for_window(self, predicate, timeout=None):
+        # until predicate(title of the active window) holds, predicate may also be a substring of the title
+        check = (lambda title: predicate in title) if isinstance(predicate, str) else predicate
+        return self.until(lambda: check(self.window_title() or ""), timeout, "window {!r}".format(predicate))
@@ -0,0 +1,129 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Deferred:
+    # result of a queued ScriptEngine command, available once its batch ran
+    def __init__(self, command):
+        self.command = command
+        self.resolved = False
+        self._value = None
+
+    def resolve(self, value):
+        self._value, self.resolved = value, True
+
+    def get(self):
+        if not self.resolved:
+            raise RuntimeError("{} has not been executed yet, flush the session first".format(self.command.name))
+        return self._value
+
+
+class _Command:
+    def __init__(self, name, page, args, writes, returns):
+        self.name, self.page, self.args = name, page, args
+        self.writes, self.returns = writes, returns
+        self.result = Deferred(self) if returns else None
+        self.round = 0
+
+    def deps(self):
+        values = list(self.args)
+        if self.name == "MarkupSet":
+            values = list(self.args[0].keys())
+        return [v for v in values if isinstance(v, Deferred)]
+
+    def keys(self):
+        # markups this command reads or writes, used to keep their order
+        if self.name == "MarkupCopy":
+            return [self.args[0]]
+        if self.name == "MarkupSet":
+            return list(self.args[0].keys())
+        return []
+
+    def to_script(self):
+        if self.name == "MarkupCopy":
+            return f"MarkupCopy({self.page}, '{self.args[0]}')"
+        if self.name == "MarkupPaste":
+            format_xml, position = self.args
+            if isinstance(format_xml, Deferred):
+                format_xml = format_xml.get()
+            return f"MarkupPaste({self.page}, '{format_xml}', {position[0]}, {position[1]})"
+        lines = []
+        for markup_id, cont in self.args[0].items():
+            if isinstance(markup_id, Deferred):
+                markup_id = markup_id.get()
+                # pasted markups resolve to a list of ids
+                markup_id = markup_id[0] if isinstance(markup_id, list) else markup_id
+            lines.append("MarkupSet({}, '{}', '{}')".format(self.page, markup_id, json.dumps(cont)))
+        return '\n'.join(lines)
+
+
+class ScriptSession:
+    # Queues MarkupCopy / MarkupPaste / MarkupSet on one file and sends them as few scripts as possible.
+    # ScriptEngine scripts cannot pass results between commands, so a command that uses a Deferred
+    # (e.g. setting a pasted markup) runs in a later round; every round is one Open ... Save() Close().
+    def __init__(self, file_dir, run_script, on_write=None):
+        self.file_dir = file_dir
+        self._run_script = run_script
+        self._on_write = on_write
+        self._pending = []
+        self._key_round = {}
+        self.scripts_run = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+    def _queue(self, command):
+        rounds = [dep.command.round + 1 for dep in command.deps() if not dep.resolved]
+        rounds += [self._key_round[key] for key in command.keys() if key in self._key_round]
+        command.round = max(rounds, default=0)
+        for key in command.keys():
+            self._key_round[key] = command.round
+        self._pending.append(command)
+        return command.result
+
+    def copy(self, i, key):
+        return self._queue(_Command("MarkupCopy", i, (key, ), writes=False, returns=True))
+
+    def paste(self, i, format_xml, position):
+        return self._queue(_Command("MarkupPaste", i, (format_xml, position), writes=True, returns=True))
+
+    def set(self, i, markup_ids_dict):
+        if len(markup_ids_dict) == 0:
+            return None
+        return self._queue(_Command("MarkupSet", i, (dict(markup_ids_dict), ), writes=True, returns=False))
+
+    def discard(self):
+        self._pending, self._key_round = [], {}
+
+    def flush(self):
+        pending, self._pending, self._key_round = self._pending, [], {}
+        for round_id in sorted(set(command.round for command in pending)):
+            self._run_round([command for command in pending if command.round == round_id])
+
+    def _run_round(self, commands):
+        writes = any(command.writes for command in commands)
+        script = [f"Open('{self.file_dir}')", *[command.to_script() for command in commands]]
+        script.extend(["Save()", "Close()"] if writes else ["Close()"])
+        logger.info("session: {}, commands: {}, save: {}".format(self.file_dir, len(commands), writes))
+        if writes and self._on_write is not None:
+            self._on_write(self.file_dir)
+        output = self._run_script(script)
+        self.scripts_run += 1
+        lines = [line.strip() for line in output.decode('utf-8').strip().split('\r\n')]
+        line_id = 0
+        for command in commands:
+            if not command.returns:
+                continue
+            k = int(lines[line_id])
+            values = lines[line_id + 1: line_id + 1 + k]
+            line_id += 1 + k
+            command.result.resolve(values[0] if command.name == "MarkupCopy" else values)
@@ -1,57 +1,95 @@
-import pyautogui
-import keyboard
 import time
 from .pce_tool import PCETools
+from .screen_wait import ScreenWaiter
+from .palette import palette_region, palette_colors
 import subprocess
 
+# pyautogui and keyboard are imported where they are used: both need a display / input devices and fail or hang
+# on headless hosts, which shouldn't stop anyone importing this module
 class Simulator:
-    def __init__(self):
-        pass
+    # seconds between typed characters
+    TYPE_INTERVAL = 0.0
+    # how long an action gets to start changing the screen before settle() only waits for it to be still
+    CHANGE_TIMEOUT = 2.0
+
+    def __init__(self, screenshot=None, window_title=None, timeout=60.0):
+        # screenshot / window_title replace pyautogui's, e.g. with synthetic frames; pyautogui is only loaded when
+        # there is no screenshot, an injected one runs headless without window titles unless given one
+        if screenshot is None:
+            import pyautogui
+            screenshot = pyautogui.screenshot
+            window_title = getattr(pyautogui, "getActiveWindowTitle", None) if window_title is None else window_title
+        self.wait = ScreenWaiter(screenshot, window_title, timeout=timeout)
 
     def type_text(self, text):
-        for char in text:
-            pyautogui.write(char)
-            time.sleep(0.1)
+        import pyautogui
+        pyautogui.write(text, interval=self.TYPE_INTERVAL)
+
+    def press(self, keys):
+        import keyboard
+        keyboard.press_and_release(keys)
 
     def click_at(self, position):
+        import pyautogui
         x, y = position
         pyautogui.moveTo(x, y)
-        time.sleep(0.5)
         pyautogui.click()
 
+    def settle(self, region=None, reference=None, settle=0.3):
+        # waits for region to differ from reference (when given and it does so within CHANGE_TIMEOUT), then
+        # for it to stop changing
+        if reference is not None:
+            try:
+                self.wait.for_change(region, reference, self.CHANGE_TIMEOUT)
+            except TimeoutError:
+                pass
+        return self.wait.for_stable(region, settle)
+
     @staticmethod
-    def copy_and_write(file_path_a, file_path_b):
+    def copy_and_write(file_path_a, file_path_b, sim=None):
         pages = PCETools.page_count(file_path_a)
-        print([f'"{PCETools.BLUEBEAM_DIR}"', f'{file_path_a} {file_path_b}'])
-        subprocess.Popen(f'"{PCETools.BLUEBEAM_DIR}" {file_path_a} {file_path_b}', shell=True)
+        sim = Simulator() if sim is None else sim
         position_doc, position_doc_2 = (385, 158), (445, 158)
         position_left, position_right = (1000, 500), (2500, 500)
         position_start, position_next = (1769, 2026), (2092, 2026)
         position_division = (415, 2023)
         position_close = (3820, 15)
-        time.sleep(5)
-        sim = Simulator()
+        region_left, region_right = (0, 200, 1750, 1950), (1750, 200, 3840, 1950)
+        screen = sim.wait.grab()
+        print([f'"{PCETools.BLUEBEAM_DIR}"', f'{file_path_a} {file_path_b}'])
+        subprocess.Popen(f'"{PCETools.BLUEBEAM_DIR}" {file_path_a} {file_path_b}', shell=True)
+        # Revu is ready once its window shows up and has finished drawing both documents
+        sim.wait.for_change(reference=screen)
+        sim.settle(settle=1.0)
         sim.click_at(position_doc)
+        screen = sim.wait.grab()
         sim.click_at(position_division)
-        time.sleep(1)
+        sim.settle(reference=screen)
+        screen = sim.wait.grab()
         sim.click_at(position_doc_2)
-        time.sleep(1)
+        sim.settle(reference=screen)
+        screen = sim.wait.grab()
         sim.click_at(position_start)
-        time.sleep(1)
+        sim.settle(reference=screen)
         for i in range(pages):
             sim.click_at(position_left)
-            keyboard.press_and_release('ctrl+a')
-            keyboard.press_and_release('ctrl+c')
-            # time.sleep(3)
+            sim.press('ctrl+a')
+            sim.press('ctrl+c')
+            right = sim.wait.grab(region_right)
             sim.click_at(position_right)
-            keyboard.press_and_release('ctrl+shift+v')
+            sim.press('ctrl+shift+v')
+            sim.settle(region_right, right)
             if i < pages - 1:
-                time.sleep(5)
+                left = sim.wait.grab(region_left)
                 sim.click_at(position_next)
-                time.sleep(1)
+                sim.settle(region_left, left)
             else:
-                keyboard.press_and_release('ctrl+s')
-                time.sleep(5)
+                sim.press('ctrl+s')
+                if sim.wait.window_title is not None:
+                    # the unsaved marker goes away once the save is done
+                    sim.wait.for_window(lambda title: '*' not in title)
+                else:
+                    sim.settle(settle=1.0)
                 sim.click_at(position_close)
 
     @staticmethod
@@ -70,21 +108,12 @@ class Simulator:
         return a1, b1, c1, d1
 
     @staticmethod
-    def get_color():
-        time.sleep(3)
-        data = pyautogui.screenshot()
-        first_point, y_sampling_point, step = (1765, 815), (1750, 825), 33
-        lines = 0
-        while y_sampling_point[1] + step * lines < data.height:
-            if data.getpixel((y_sampling_point[0], y_sampling_point[1] + step * lines)) != (255, 255, 255):
-                break
-            lines += 1
-        lines -= 1
-        res = {}
-        for i in range(lines):
-            for j in range(8):
-                xy = (first_point[0] + step * j, first_point[1] + step * i)
-                color = data.getpixel(xy)
-                if color not in res:
-                    res[color] = xy
-        return res
+    def get_color(image=None, origin=(0, 0), delay=3):
+        # image: a screenshot (PIL image or array) whose top left corner is at origin; None takes one of just the
+        # palette after delay seconds
+        if image is None:
+            import pyautogui
+            time.sleep(delay)
+            region = palette_region(pyautogui.size()[1])
+            image, origin = pyautogui.screenshot(region=region), region[:2]
+        return palette_colors(image, origin)
@@ -0,0 +1,248 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import fitz
+
+# bump when the SVG text stored for a page changes for the same PDF content
+FORMAT = 1
+# references to the page and page-tree parents, following them would hash the whole document
+_BACK_REFERENCES = (b"/P", b"/Parent")
+_REFERENCE = re.compile(rb"(/[^\s/\[\]<>(){}%]+)?(\s*)(\d+) (\d+) R\b")
+
+
+def _walk(doc, digest, text):
+    # hashes text and every object it references, breadth first; a reference becomes the position of its object in
+    # the walk, so equal content hashes the same whatever the object numbers are
+    order, queue = {}, []
+
+    def replace(match):
+        key, space, xref = match.group(1) or b"", match.group(2), int(match.group(3))
+        if key in _BACK_REFERENCES:
+            return key + space + b"^"
+        if xref not in order:
+            order[xref] = len(order)
+            queue.append(xref)
+        return key + space + b"#%d" % order[xref]
+    digest.update(_REFERENCE.sub(replace, text))
+    for xref in queue:
+        try:
+            text = doc.xref_object(xref, compressed=True).encode("latin-1", "replace")
+        except (ValueError, RuntimeError):
+            # a dangling reference
+            digest.update(b"-")
+            continue
+        digest.update(_REFERENCE.sub(replace, text))
+        if b"/Length" in text:
+            digest.update(doc.xref_stream_raw(xref) or b"")
+
+
+def _page_value(doc, page, key):
+    # page attribute, inherited through the page tree like /Resources may be
+    xref = page.xref
+    for _ in range(64):
+        kind, value = doc.xref_get_key(xref, key)
+        if kind != "null":
+            return value.encode("latin-1", "replace")
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            return b""
+        xref = int(parent.split()[0])
+    return b""
+
+
+def page_key(doc, page, options=""):
+    # content address of a page's rendering: its content streams, resources and annotations (with everything they
+    # reference), geometry, the renderer version and the render options
+    digest = hashlib.sha256("{}|{}|{}".format(FORMAT, fitz.VersionBind, options).encode("utf-8"))
+    digest.update(repr((tuple(page.mediabox), tuple(page.cropbox), page.rotation)).encode("ascii"))
+    digest.update(hashlib.sha256(page.read_contents()).digest())
+    for key in ("Resources", "Annots"):
+        digest.update(key.encode("ascii"))
+        _walk(doc, digest, _page_value(doc, page, key))
+    return digest.hexdigest()
+
+
+class SVGCache:
+    # Page SVGs on disk under their page_key, shared by every process pointed at the same directory. Files are
+    # written to a temp file and renamed into place, a hit refreshes the file's mtime and the least recently used
+    # files go once the directory grows past max_bytes. directory=None turns the cache off.
+    # Walking a page's objects for page_key costs about as much as rendering a simple page, so key() also keeps
+    # (hash of the whole PDF, page) -> page_key aliases: an unchanged file only costs a file hash. For a path the
+    # hash is only used while the file still has the signature (mtime_ns, size) doc was opened with, so a file
+    # changed since can't get an alias to the old document's keys.
+    def __init__(self, directory=None, max_bytes=1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self._file_digests = {}
+        self.reset_stats()
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def configure(self, directory, max_bytes=None):
+        with self._lock:
+            self.directory = directory
+            self.max_bytes = self.max_bytes if max_bytes is None else max_bytes
+            self._size = None
+
+    def _path(self, key, suffix=".svg"):
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @staticmethod
+    def file_signature(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _file_digest(self, source, signature=None):
+        # sha256 of PDF bytes, or of a PDF path still at signature; None for an open fitz document, a path without
+        # signature or one that changed
+        if isinstance(source, (bytes, bytearray)):
+            return hashlib.sha256(source).hexdigest()
+        if not isinstance(source, str) or signature is None:
+            return None
+        path = os.path.normcase(os.path.abspath(source))
+        if self.file_signature(path) != signature:
+            return None
+        with self._lock:
+            cached = self._file_digests.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        if self.file_signature(path) != signature:
+            # written to while it was hashed
+            return None
+        with self._lock:
+            if len(self._file_digests) >= 4096:
+                self._file_digests.clear()
+            self._file_digests[path] = (signature, digest.hexdigest())
+        return digest.hexdigest()
+
+    def key(self, source, doc, page_number, signature=None):
+        # page_key of page page_number of doc, which was opened from source (a path, PDF bytes or the document);
+        # signature: file_signature() of a path source when doc was opened from it
+        file_digest = self._file_digest(source, signature)
+        if file_digest is not None:
+            alias = hashlib.sha256("{}|{}|{}|{}".format(FORMAT, fitz.VersionBind, file_digest, page_number).encode("ascii")).hexdigest()
+            key = self._read(self._path(alias, ".key"))
+            if key is not None:
+                return key.decode("ascii")
+        key = page_key(doc, doc.load_page(page_number))
+        if file_digest is not None:
+            self._write(self._path(alias, ".key"), key.encode("ascii"))
+        return key
+
+    def get(self, key):
+        data = self._read(self._path(key))
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if data is None else data.decode("utf-8")
+
+    def put(self, key, svg):
+        data = svg.encode("utf-8")
+        self._write(self._path(key), data)
+        with self._lock:
+            self.writes += 1
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data)
+            evict = self._size > self.max_bytes
+        if evict:
+            self.evict()
+
+    def _entries(self):
+        # (mtime, size, path) of every cached SVG and alias
+        entries = []
+        if self.directory is None or not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith((".svg", ".key")):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def evict(self, target=None):
+        # least recently used first, down to target bytes (90% of max_bytes, so not every put scans the directory)
+        target = int(self.max_bytes * 0.9) if target is None else target
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                # another process got there first
+                pass
+            total -= size
+        with self._lock:
+            self._size = total
+            self.evictions += removed
+
+    def clear(self):
+        # every cached SVG and alias, and the remembered file hashes
+        with self._lock:
+            self._file_digests.clear()
+        self.evict(0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups > 0 else None,
+                    "writes": self.writes, "evictions": self.evictions, "bytes": self._size}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.writes = self.evictions = 0
+
+    def __getstate__(self):
+        # worker processes get the same directory and limit, with their own lock and counters
+        return {"directory": self.directory, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"], state["max_bytes"])
+
+
+svg_cache = SVGCache(os.environ.get("PCE_SVG_CACHE"), int(os.environ.get("PCE_SVG_CACHE_MAX_BYTES", 1024 ** 3)))
@@ -0,0 +1,60 @@
+import io
+import re
+import uuid
+import hashlib
+from xml.etree import ElementTree as ET
+
+URL_REF = re.compile(r"\(#(.*?)\)")
+SVG_NAMESPACE = "http://www.w3.org/2000/svg"
+XLINK_NAMESPACE = "http://www.w3.org/1999/xlink"
+
+
+def register_namespaces():
+    # ElementTree writes unregistered namespaces as ns0:, ns1:, ... and MuPDF can't resolve ns0:href, every
+    # <use> glyph of the page's text would be dropped
+    ET.register_namespace('', SVG_NAMESPACE)
+    ET.register_namespace('xlink', XLINK_NAMESPACE)
+
+
+def make_suffix(*parts):
+    # deterministic suffix, the same inputs give the same ids on every run
+    if len(parts) == 0:
+        return str(uuid.uuid4()).split('-')[0]
+    return hashlib.sha1('\x00'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:8]
+
+
+def _rename_element(elem, suffix, url_repl):
+    attrib = elem.attrib
+    for key, value in attrib.items():
+        if key == 'id':
+            attrib[key] = value + '_' + suffix
+        elif value[:1] == '#' and key.endswith('href'):
+            attrib[key] = value + '_' + suffix
+        elif 'url(#' in value:
+            attrib[key] = URL_REF.sub(url_repl, value)
+
+
+def rename_ids(element, suffix):
+    # single pass, only id / *href="#..." / url(#...) attributes are touched
+    url_repl = r"(#\1_" + suffix.replace('\\', r'\\') + ")"
+    for elem in element.iter():
+        if elem.attrib:
+            _rename_element(elem, suffix, url_repl)
+    return element
+
+
+def parse_with_renamed_ids(source, suffix):
+    # streaming variant, ids are rewritten while the document is parsed
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    register_namespaces()
+    url_repl = r"(#\1_" + suffix.replace('\\', r'\\') + ")"
+    root = None
+    for _, elem in ET.iterparse(source, events=('start', )):
+        if root is None:
+            root = elem
+        if elem.attrib:
+            _rename_element(elem, suffix, url_repl)
+    return root
@@ -0,0 +1,191 @@
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+# Structured timing spans for external tools and pipeline stages.
+# Nothing is measured until a sink is added, span() then hands out a shared no-op span.
+FIELDS = ("operation", "file", "page", "command_length", "bytes_in", "bytes_out", "duration", "status")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **attrs):
+        return self
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, operation, attrs):
+        self.tracer = tracer
+        self.operation = operation
+        self.attrs = attrs
+        self.start = None
+        self.duration = None
+        self.status = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        self.start = time.time()
+        self._counter = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self._counter
+        if self.status is None:
+            # a failed external call reports its exit code, anything else the exception type
+            self.status = 0 if exc_type is None else getattr(exc_value, "returncode", exc_type.__name__)
+        self.tracer.emit(self)
+        return False
+
+    def to_dict(self):
+        result = {"operation": self.operation, "start": self.start, "duration": self.duration, "status": self.status}
+        result.update(self.attrs)
+        return result
+
+
+class Tracer:
+    def __init__(self):
+        self.sinks = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return len(self.sinks) > 0
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks = self.sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self.sinks = [s for s in self.sinks if s is not sink]
+
+    def span(self, operation, **attrs):
+        # with tracer.span("bluebeam.script", file=..., command_length=...) as span: ... span.set(bytes_out=...)
+        if not self.sinks:
+            return _NULL_SPAN
+        return Span(self, operation, attrs)
+
+    def emit(self, span):
+        record = span.to_dict()
+        for sink in self.sinks:
+            sink.write(record)
+
+
+class JSONLinesSink:
+    # one JSON object per span, to a path (appended) or an open text stream
+    def __init__(self, target):
+        self._own = isinstance(target, str)
+        self._stream = open(target, "a", encoding="utf-8") if self._own else target
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._stream.write(line)
+            self._stream.flush()
+
+    def close(self):
+        if self._own:
+            self._stream.close()
+
+
+class MemorySink:
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def summary(self, slowest=5):
+        return summarize(self.spans, slowest)
+
+
+def summarize(spans, slowest=5):
+    # per operation: count, total / mean / max seconds, failures and bytes, plus the slowest spans overall
+    operations = {}
+    for span in spans:
+        item = operations.setdefault(span["operation"], {"count": 0, "total": 0.0, "max": 0.0, "errors": 0, "bytes_in": 0, "bytes_out": 0})
+        item["count"] += 1
+        item["total"] += span["duration"]
+        item["max"] = max(item["max"], span["duration"])
+        item["errors"] += span["status"] != 0
+        item["bytes_in"] += span.get("bytes_in") or 0
+        item["bytes_out"] += span.get("bytes_out") or 0
+    for item in operations.values():
+        item["mean"] = item["total"] / item["count"]
+    return {"spans": len(spans), "operations": dict(sorted(operations.items(), key=lambda kv: -kv[1]["total"])),
+            "slowest": sorted(spans, key=lambda span: -span["duration"])[:slowest]}
+
+
+def format_summary(summary):
+    lines = ["{:<32} {:>6} {:>10} {:>10} {:>10} {:>6}".format("operation", "count", "total s", "mean s", "max s", "errors")]
+    for operation, item in summary["operations"].items():
+        lines.append("{:<32} {count:>6} {total:>10.3f} {mean:>10.4f} {max:>10.3f} {errors:>6}".format(operation, **item))
+    for span in summary["slowest"]:
+        lines.append("slowest: {} {:.3f}s {}".format(span["operation"], span["duration"], {k: v for k, v in span.items() if k in FIELDS[1:4] and v is not None}))
+    return "\n".join(lines)
+
+
+def describe(source):
+    # the file attribute of a span: paths as they are, in-memory PDFs by kind and size
+    if source is None or isinstance(source, str):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return "<{} bytes>".format(len(source))
+    return "<{}>".format(type(source).__name__)
+
+
+tracer = Tracer()
+
+
+def traced(operation, file=None, page=None):
+    # decorator for a whole stage: file / page are the positions of the arguments to record
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.sinks:
+                return func(*args, **kwargs)
+            source = args[file] if file is not None and file < len(args) else None
+            with tracer.span(operation, file=describe(source), page=args[page] if page is not None and page < len(args) else None) as span:
+                if isinstance(source, (bytes, bytearray)):
+                    span.set(bytes_in=len(source))
+                result = func(*args, **kwargs)
+                if isinstance(result, (bytes, str)):
+                    span.set(bytes_out=len(result))
+                return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace(jsonl=None, tracer=tracer):
+    # collects the spans of one job: with trace() as spans: ...; spans.summary()
+    memory = tracer.add_sink(MemorySink())
+    lines = tracer.add_sink(JSONLinesSink(jsonl)) if jsonl is not None else None
+    try:
+        yield memory
+    finally:
+        tracer.remove_sink(memory)
+        if lines is not None:
+            tracer.remove_sink(lines)
+            lines.close()
@@ -0,0 +1,78 @@
+import io
+import pypdf
+from .pipeline import imap_bounded
+from .combine import combine_documents
+
+
+def rotation_aware_translation(rotation, offset):
+    # offset is in the page's visual orientation, the content stream lives in the unrotated one
+    offset_x, offset_y = offset
+    assert rotation in [0, 90, 180, 270]
+    if rotation == 0:
+        return pypdf.Transformation().translate(offset_x, offset_y)
+    elif rotation == 90:
+        return pypdf.Transformation().translate(-offset_y, offset_x)
+    elif rotation == 180:
+        return pypdf.Transformation().translate(-offset_x, -offset_y)
+    return pypdf.Transformation().translate(offset_y, -offset_x)
+
+
+def apply_transform(page, spec):
+    # spec: a pypdf.Transformation, an (x, y) offset, or a dict with any of
+    # "page_scale": (sx, sy), "content_scale": (sx, sy), "offset": (x, y), "transformation": pypdf.Transformation
+    if isinstance(spec, pypdf.Transformation):
+        spec = {"transformation": spec}
+    elif not isinstance(spec, dict):
+        spec = {"offset": spec}
+    if "/VP" in page.keys() and "page_scale" in spec:
+        page.pop("/VP")
+    page_scale = spec.get("page_scale", (1, 1))
+    if page_scale[0] != 1 or page_scale[1] != 1:
+        page.scale(page_scale[0], page_scale[1])
+    op = pypdf.Transformation()
+    content_scale = spec.get("content_scale", (1, 1))
+    if content_scale[0] != 1 or content_scale[1] != 1:
+        op = op.scale(content_scale[0], content_scale[1])
+    if "offset" in spec:
+        op = op.transform(rotation_aware_translation(page.rotation, spec["offset"]))
+    if "transformation" in spec:
+        op = op.transform(spec["transformation"])
+    if op.ctm != pypdf.Transformation().ctm:
+        page.add_transformation(op)
+
+
+def _transform_range(task):
+    input_file, start, stop, transforms, as_bytes = task
+    reader = pypdf.PdfReader(io.BytesIO(input_file) if isinstance(input_file, (bytes, bytearray)) else input_file)
+    writer = pypdf.PdfWriter()
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for page_id in range(start, stop):
+        page = writer.add_page(reader.pages[page_id])
+        if page_id in transforms:
+            apply_transform(page, transforms[page_id])
+    if not as_bytes:
+        return writer
+    with io.BytesIO() as buffer:
+        writer.write(buffer)
+        return buffer.getvalue()
+
+
+def transform_pages(input_file, output_file, transforms, workers=1, shard_size=None):
+    # transforms: {0-based page: spec}, pages without an entry are copied as they are
+    # output_file=None returns the PDF bytes; with workers > 1 page shards are transformed in parallel and joined once
+    if workers <= 1:
+        writer = _transform_range((input_file, 0, None, transforms, False))
+        if output_file is None:
+            with io.BytesIO() as buffer:
+                writer.write(buffer)
+                return buffer.getvalue()
+        writer.write(output_file)
+        return output_file
+    page_count = len(pypdf.PdfReader(io.BytesIO(input_file) if isinstance(input_file, (bytes, bytearray)) else input_file).pages)
+    shard_size = max(1, -(-page_count // workers) if shard_size is None else shard_size)
+    tasks = [(input_file, start, start + shard_size, {k: v for k, v in transforms.items() if start <= k < start + shard_size}, True) for start in range(0, page_count, shard_size)]
+    shards = list(imap_bounded(_transform_range, tasks, workers))
+    if output_file is None:
+        return combine_documents(shards).tobytes(garbage=4, deflate=True)
+    combine_documents(shards, output_file)
+    return output_file
@@ -14,12 +14,19 @@ setup(
         "svgwrite",
         "pyautogui",
         "keyboard",
+        "numpy",
         "pydrive",
         "google-auth",
         "google-auth-oauthlib",
         "google-auth-httplib2",
         "google-api-python-client"
     ],
+    extras_require={
+        "yaml": ["PyYAML"],
+    },
+    entry_points={
+        "console_scripts": ["pce=pce.cli:main"],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',
@@ -0,0 +1,227 @@
+import re
+import json
+import hashlib
+import threading
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import httplib2
+
+# A local stand-in for the parts of the Drive v3 REST API that GoogleDrive uses.
+# Point the client at it with GoogleDrive(None, api_endpoint=server.url, http_factory=LocalHttp).
+
+
+class LocalHttp(httplib2.Http):
+    # googleapiclient keeps the https scheme for upload URLs when api_endpoint is overridden
+    def request(self, uri, *args, **kwargs):
+        return super().request(uri.replace("https://", "http://", 1), *args, **kwargs)
+
+
+class DriveState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.uploads = {}
+        self.next_id = 0
+        self.requests = []
+        self.batches = []
+        self.fail_puts = set()
+        self.puts = 0
+        self.active_uploads = 0
+        self.peak_uploads = 0
+        # ids of changed files in order, a changes page token is a position in it
+        self.changes = []
+        self.page_size = None
+        self.ranges = []
+
+    def add_file(self, name, content=b""):
+        file_id = self.new_id("F")
+        self.files[file_id] = {"id": file_id, "name": name, "mimeType": "application/octet-stream", "md5Checksum": hashlib.md5(content).hexdigest(),
+                               "size": str(len(content)), "content": content, "permissions": []}
+        self.changes.append(file_id)
+        return file_id
+
+    def set_content(self, file_id, content):
+        self.files[file_id].update(content=content, md5Checksum=hashlib.md5(content).hexdigest(), size=str(len(content)))
+        self.files[file_id]["revisions"] = self.files[file_id].get("revisions", 1) + 1
+        self.changes.append(file_id)
+
+    def metadata(self, file_id):
+        return {k: v for k, v in self.files[file_id].items() if k not in ("content", "permissions", "revisions")}
+
+    def new_id(self, prefix):
+        self.next_id += 1
+        return "{}{}".format(prefix, self.next_id)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def reply(self, status, payload=b"", headers=None, content_type="application/json"):
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def start_upload(self, body, file_id=None):
+        with self.state.lock:
+            upload_id = self.state.new_id("U")
+            self.state.uploads[upload_id] = {"metadata": json.loads(body or b"{}"), "data": bytearray(), "file_id": file_id}
+            self.state.active_uploads += 1
+            self.state.peak_uploads = max(self.state.peak_uploads, self.state.active_uploads)
+        location = "http://{}:{}/upload/drive/v3/files?uploadType=resumable&upload_id={}".format(*self.server.server_address, upload_id)
+        self.reply(200, {}, {"Location": location})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.body()
+        with self.state.lock:
+            self.state.requests.append(("POST", url.path))
+        if url.path == "/upload/drive/v3/files" and parse_qs(url.query).get("uploadType") == ["resumable"]:
+            return self.start_upload(body)
+        if url.path == "/batch/drive/v3":
+            return self.batch(body)
+        self.reply(404, {"error": {"code": 404, "message": url.path}})
+
+    def do_PATCH(self):
+        url = urlparse(self.path)
+        body = self.body()
+        with self.state.lock:
+            self.state.requests.append(("PATCH", url.path))
+        match = re.match(r"/upload/drive/v3/files/([^/]+)$", url.path)
+        if match is not None and parse_qs(url.query).get("uploadType") == ["resumable"] and match.group(1) in self.state.files:
+            return self.start_upload(body, match.group(1))
+        self.reply(404, {"error": {"code": 404, "message": url.path}})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self.state.lock:
+            self.state.requests.append(("GET", url.path))
+            page_size = min(int(query.get("pageSize", 100)), self.state.page_size or 1000)
+            start = int(query.get("pageToken", 0))
+            match = re.match(r"/drive/v3/files/([^/]+)$", url.path)
+            if match is not None and match.group(1) in self.state.files:
+                if query.get("alt") != "media":
+                    return self.reply(200, self.state.metadata(match.group(1)))
+                content = self.state.files[match.group(1)]["content"]
+                ranged = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+                if ranged is None:
+                    return self.reply(200, content, content_type="application/octet-stream")
+                first, last = int(ranged.group(1)), min(int(ranged.group(2)), len(content) - 1)
+                self.state.ranges.append((first, last))
+                return self.reply(206, content[first:last + 1], {"Content-Range": "bytes {}-{}/{}".format(first, last, len(content))}, "application/octet-stream")
+            if url.path == "/drive/v3/files":
+                name = re.search(r"name = '((?:[^'\\]|\\.)*)'", query.get("q", ""))
+                ids = [i for i in self.state.files if name is None or self.state.files[i]["name"] == re.sub(r"\\(.)", r"\1", name.group(1))]
+                result = {"files": [self.state.metadata(i) for i in ids[start:start + page_size]]}
+                if start + page_size < len(ids):
+                    result["nextPageToken"] = str(start + page_size)
+                return self.reply(200, result)
+            if url.path == "/drive/v3/changes/startPageToken":
+                return self.reply(200, {"startPageToken": str(len(self.state.changes))})
+            if url.path == "/drive/v3/changes":
+                changes = []
+                for file_id in self.state.changes[start:start + page_size]:
+                    if file_id in self.state.files:
+                        changes.append({"fileId": file_id, "removed": False, "file": dict(self.state.metadata(file_id), trashed=False)})
+                    else:
+                        changes.append({"fileId": file_id, "removed": True})
+                result = {"changes": changes}
+                if start + page_size < len(self.state.changes):
+                    result["nextPageToken"] = str(start + page_size)
+                else:
+                    result["newStartPageToken"] = str(len(self.state.changes))
+                return self.reply(200, result)
+        self.reply(404, {"error": {"code": 404, "message": url.path}})
+
+    def do_DELETE(self):
+        url = urlparse(self.path)
+        self.body()
+        with self.state.lock:
+            self.state.requests.append(("DELETE", url.path))
+            file_id = url.path.rsplit("/", 1)[1]
+            if file_id not in self.state.files:
+                return self.reply(404, {"error": {"code": 404, "message": url.path}})
+            del self.state.files[file_id]
+            self.state.changes.append(file_id)
+        self.reply(204)
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        body = self.body()
+        upload_id = parse_qs(url.query)["upload_id"][0]
+        with self.state.lock:
+            self.state.puts += 1
+            if self.state.puts in self.state.fail_puts:
+                return self.reply(503, {"error": {"code": 503, "message": "injected failure"}})
+            upload = self.state.uploads[upload_id]
+            match = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", self.headers.get("Content-Range", ""))
+            total = re.match(r"bytes .*/(\d+)", self.headers.get("Content-Range", ""))
+            if match is not None and int(match.group(1)) == len(upload["data"]):
+                upload["data"].extend(body)
+            if total is not None and len(upload["data"]) == int(total.group(1)):
+                if upload["file_id"] is None:
+                    file_id = self.state.add_file(upload["metadata"].get("name"), bytes(upload["data"]))
+                else:
+                    file_id = upload["file_id"]
+                    self.state.set_content(file_id, bytes(upload["data"]))
+                self.state.active_uploads -= 1
+                return self.reply(200, self.state.metadata(file_id))
+            headers = {"Range": "bytes=0-{}".format(len(upload["data"]) - 1)} if len(upload["data"]) > 0 else {}
+        self.reply(308, b"", headers)
+
+    def batch(self, body):
+        message = BytesParser().parsebytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+        boundary = "batch_stand_in"
+        parts = []
+        with self.state.lock:
+            self.state.batches.append(len(message.get_payload()))
+            for part in message.get_payload():
+                request_line, _, rest = part.get_payload().partition("\n")
+                method, path, _ = request_line.split(" ")
+                payload = json.loads(rest.split("\n\n", 1)[1] or "{}") if "\n\n" in rest else {}
+                match = re.match(r"/drive/v3/files/([^/?]+)/permissions", path)
+                if method == "POST" and match is not None and match.group(1) in self.state.files:
+                    permission = dict(payload, id=self.state.new_id("P"))
+                    self.state.files[match.group(1)]["permissions"].append(permission)
+                    status, result = "200 OK", {"id": permission["id"]}
+                else:
+                    status, result = "404 Not Found", {"error": {"code": 404, "message": path}}
+                content_id = part["Content-ID"].replace("<", "<response-", 1)
+                parts.append("--{}\r\nContent-Type: application/http\r\nContent-ID: {}\r\n\r\nHTTP/1.1 {}\r\nContent-Type: application/json\r\n\r\n{}\r\n".format(
+                    boundary, content_id, status, json.dumps(result)))
+        self.reply(200, ("".join(parts) + "--{}--\r\n".format(boundary)).encode("utf-8"), content_type='multipart/mixed; boundary="{}"'.format(boundary))
+
+
+class DriveStandIn:
+    def __init__(self):
+        self.state = DriveState()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.state = self.state
+        self.url = "http://{}:{}/drive/v3/".format(*self.server.server_address)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05, ), daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
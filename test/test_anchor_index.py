@@ -0,0 +1,78 @@
+import sys
+import os
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.anchor_index import AnchorIndex, AnchorCache
+from pce.pce_tool import PCETools
+
+
+def page(anchor, *others):
+    markups = {"A": {"color": "#7A0000", "subject": "Anchor", "x": str(anchor[0]), "y": str(anchor[1])}}
+    markups.update({"N{}".format(k): {"color": "#FF0000", "subject": "Note", "x": "1", "y": "2"} for k in range(len(others))})
+    return markups
+
+
+@pytest.fixture
+def documents(monkeypatch, tmp_path):
+    # {file: {page: markups}} answered by a stand-in return_markups_for_document that counts its calls
+    documents, calls = {}, []
+
+    def return_markups_for_document(file_dir, pages=None):
+        calls.append(file_dir)
+        return documents[file_dir]
+
+    def add(name, anchors):
+        path = str(tmp_path / name)
+        with open(path, "wb") as f:
+            f.write(name.encode())
+        documents[path] = {i: page(anchor, "note") for i, anchor in enumerate(anchors, 1)}
+        return path
+    monkeypatch.setattr(PCETools, "return_markups_for_document", staticmethod(return_markups_for_document))
+    monkeypatch.setattr(PCETools, "page_count", staticmethod(lambda f: len(documents[f])))
+    monkeypatch.setattr(PCETools, "ANCHOR_CACHE", AnchorCache())
+    return add, calls
+
+
+def test_index_positions():
+    index = AnchorIndex({1: {**page((10, 20), "note"), "B": {"color": "#7a0000 ", "x": "30", "y": "40"}, "C": {"color": "#7A0000"}}, 2: {}})
+    assert index.positions(1, color="#7a0000") == [(10.0, 20.0), (30.0, 40.0)]
+    assert index.anchor(1, subject="note") == (1.0, 2.0)
+    assert len(index) == 2 and index.positions(3, color="#7A0000") == []
+    with pytest.raises(AssertionError, match="page 2"):
+        index.anchor(2, color="#7A0000")
+
+
+def test_offsets_extract_each_file_once(documents):
+    add, calls = documents
+    form = add("form.pdf", [(100, 100), (200, 200)])
+    files = [add("f{}.pdf".format(k), [(100 + k, 100), (200, 200 - k)]) for k in range(3)]
+    expected = [[(k, 0), (0, -k)] for k in range(3)]
+    assert PCETools.get_offsets(form, files, scale=(1, 1)) == expected
+    assert sorted(calls) == sorted([form] + files)
+    assert PCETools.get_offset(form, files[2], scale=(1, 1)) == expected[2]
+    assert PCETools.get_offsets(form, files, scale=(2, 1), workers=1)[1] == [(0.5, 0), (0, -1)]
+    assert len(calls) == 4
+    # a changed file is extracted again, the others stay cached
+    with open(files[0], "ab") as f:
+        f.write(b"changed")
+    PCETools.invalidate_document(files[1])
+    PCETools.get_offsets(form, files)
+    assert sorted(calls[4:]) == sorted(files[:2])
+
+
+def test_offsets_from_the_engine_pool(documents):
+    # a task queued on one of the files must not wait for its own extraction
+    add, _ = documents
+    form = add("form.pdf", [(0, 0)])
+    files = [add("a.pdf", [(1, 1)]), add("b.pdf", [(2, 2)])]
+    assert PCETools.submit(files[0], PCETools.get_offsets, form, files, "#7A0000", (1, 1)).result(timeout=10) == [[(1, 1)], [(2, 2)]]
+
+
+def test_paste_all_markup_by_anchor_passes_offsets(documents, monkeypatch):
+    add, calls = documents
+    form, new_file = add("form.pdf", [(10, 10), (10, 10)]), add("new.pdf", [(15, 10), (10, 7)])
+    pasted = []
+    monkeypatch.setattr(PCETools, "paste_markup_to_file", staticmethod(lambda *args, **kwargs: pasted.append((args, kwargs))))
+    PCETools.paste_all_markup_to_file_by_anchor(form, new_file)
+    assert pasted == [((form, new_file, 1, 1), {"offset": (5, 0)}), ((form, new_file, 2, 2), {"offset": (0, -3)})]
+    assert len(calls) == 2
@@ -0,0 +1,118 @@
+import sys
+import os
+import json
+import time
+import threading
+import fitz
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.batch import BatchRunner, load_manifest, run_manifest, format_report
+from pce.cli import main
+
+
+class FakeTools:
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.overlap = False
+
+    def __getattr__(self, op):
+        def call(file_dir, tag):
+            with self.lock:
+                if self.active.get(file_dir):
+                    self.overlap = True
+                self.active[file_dir] = True
+            time.sleep(0.01)
+            with self.lock:
+                self.active[file_dir] = False
+                self.calls.append((op, tag))
+            if tag in self.fail:
+                raise RuntimeError("step {} failed".format(tag))
+        return call
+
+
+def manifest(files=4, steps=("pdf_set_color_v2", "paste_markup_to_file")):
+    # two jobs per file, so per-file ordering matters
+    jobs = []
+    for n in range(files * 2):
+        f = "f{}.pdf".format(n % files)
+        jobs.append({"id": "job{}".format(n), "file": f, "steps": [{"op": op, "args": {"file_dir": f, "tag": "{}.{}".format(n, i)}} for i, op in enumerate(steps)]})
+    return {"jobs": jobs}
+
+
+def test_jobs_on_a_file_run_in_order(tmp_path):
+    tools = FakeTools()
+    report = BatchRunner(manifest(), str(tmp_path / "journal.jsonl"), workers=4, tools=tools).run()
+    assert set(report["jobs"].values()) == {"done"} and not tools.overlap
+    for f in range(4):
+        tags = [tag for _, tag in tools.calls if int(tag.split(".")[0]) % 4 == f]
+        assert tags == sorted(tags, key=lambda t: tuple(map(int, t.split("."))))
+    stage = report["stages"]["pdf_set_color_v2"]
+    assert stage["steps"] == 8 and stage["skipped"] == 0 and stage["per_second"] > 0
+    assert "paste_markup_to_file" in format_report(report)
+
+
+def test_rerun_resumes_after_a_failure(tmp_path):
+    journal = str(tmp_path / "journal.jsonl")
+    tools = FakeTools(fail={"3.0"})
+    report = BatchRunner(manifest(), journal, workers=2, tools=tools).run()
+    assert report["jobs"]["job3"] == "failed" and sum(s == "done" for s in report["jobs"].values()) == 7
+    # the failed job's second step never ran
+    assert ("paste_markup_to_file", "3.1") not in tools.calls and len(tools.calls) == 15
+
+    tools = FakeTools()
+    report = BatchRunner(manifest(), journal, workers=2, tools=tools).run()
+    assert set(report["jobs"].values()) == {"done"}
+    assert sorted(tools.calls) == [("paste_markup_to_file", "3.1"), ("pdf_set_color_v2", "3.0")]
+    assert report["stages"]["pdf_set_color_v2"]["skipped"] == 7
+
+    # a changed step runs again, and a torn last line is ignored
+    changed = manifest()
+    changed["jobs"][0]["steps"][1]["args"]["tag"] = "0.1b"
+    with open(journal, "a") as f:
+        f.write('{"job": "job1", "st')
+    tools = FakeTools()
+    BatchRunner(changed, journal, workers=2, tools=tools).run()
+    assert tools.calls == [("paste_markup_to_file", "0.1b")]
+    # the step run after the torn line was journaled, a fourth run has nothing left to do
+    tools = FakeTools()
+    BatchRunner(changed, journal, workers=2, tools=tools).run()
+    assert tools.calls == []
+
+
+def test_manifest_validation(tmp_path):
+    path = tmp_path / "bad.json"
+    path.write_text(json.dumps([{"id": "a", "steps": [{"op": "delete_everything"}]}]))
+    with pytest.raises(AssertionError):
+        load_manifest(str(path))
+
+
+def make_pdf(path):
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    page.draw_rect(fitz.Rect(10, 10, 50, 50), color=(0, 0, 1), fill=(1, 0, 0))
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_yaml_manifest_through_pce_tools(tmp_path, capsys):
+    pytest.importorskip("yaml")
+    sources = [make_pdf(tmp_path / "in{}.pdf".format(i)) for i in range(3)]
+    lines = ["workers: 2", "jobs:"]
+    for i, src in enumerate(sources):
+        out = str(tmp_path / "out{}.pdf".format(i))
+        lines += ["  - id: sheet{}".format(i), "    file: '{}'".format(out), "    steps:",
+                  "      - op: pdf_set_color_v3", "        args: {{page: '{}', page_numbers: [0], pre_color: '#FF0000', post_color: '#00FF00', output_path: '{}'}}".format(src, out)]
+    path = tmp_path / "manifest.yaml"
+    path.write_text("\n".join(lines) + "\n")
+    report = run_manifest(str(path))
+    assert set(report["jobs"].values()) == {"done"} and report["stages"]["pdf_set_color_v3"]["steps"] == 3
+    with fitz.open(str(tmp_path / "out2.pdf")) as doc:
+        assert doc[0].get_drawings()[0]["fill"] == (0.0, 1.0, 0.0)
+    assert os.path.exists(str(path) + ".journal.jsonl")
+    assert main(["batch", str(path), "--report", str(tmp_path / "report.json")]) == 0
+    assert "3 skipped" in capsys.readouterr().out
+    assert json.loads((tmp_path / "report.json").read_text())["stages"]["pdf_set_color_v3"]["skipped"] == 3
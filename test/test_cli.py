@@ -0,0 +1,72 @@
+import sys
+import os
+import json
+import subprocess
+import fitz
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pce.pce_tool
+from pce.cli import main, parse_pages
+from pce.pce_tool import PCETools
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_pdf(path, pages=2):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=200, height=200)
+        page.draw_rect(fitz.Rect(10, 10, 50, 50), color=(0, 0, 1), fill=(1, 0, 0))
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_parse_pages():
+    assert parse_pages("1,3-5, 8") == [1, 3, 4, 5, 8]
+
+
+def test_no_heavy_imports_before_a_subcommand_runs():
+    heavy = ("fitz", "pymupdf", "pypdf", "svgwrite", "xml.etree.ElementTree", "googleapiclient", "pyautogui", "keyboard", "numpy")
+    code = "import sys; from pce.cli import build_parser; build_parser().parse_args(['markups', 'a.pdf']); print([m for m in {!r} if m in sys.modules])".format(heavy)
+    assert subprocess.check_output([sys.executable, "-c", code], cwd=ROOT).decode().strip() == "[]"
+    assert b"combine,recolor,mix,resize,markups,colors,upload" in subprocess.check_output([sys.executable, "-m", "pce", "--help"], cwd=ROOT)
+
+
+def test_combine_recolor_resize(tmp_path, capsys):
+    a, b = make_pdf(tmp_path / "a.pdf"), make_pdf(tmp_path / "b.pdf", 1)
+    combined, recolored, resized = (str(tmp_path / name) for name in ("combined.pdf", "recolored.pdf", "resized.pdf"))
+    assert main(["combine", a, b, "-o", combined, "--backend", "native"]) == 0
+    assert PCETools.page_count(combined) == 3
+    assert main(["recolor", combined, "#FF0000", "#00FF00", "-o", recolored, "--pages", "2-3"]) == 0
+    assert capsys.readouterr().out.strip() == "2 color operators changed on 2 pages"
+    with fitz.open(recolored) as doc:
+        assert [doc[i].get_drawings()[0]["fill"] for i in range(3)] == [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 1.0, 0.0)]
+    assert main(["colors", recolored, "--pages", "1-2"]) == 0
+    assert json.loads(capsys.readouterr().out)["document"]["fill"] == {"#FF0000": 1, "#00FF00": 1}
+    assert main(["resize", a, "-o", resized, "--input-scale", "100", "--input-width", "200", "--input-height", "200",
+                 "--output-scale", "100", "--output-width", "400", "--output-height", "400"]) == 0
+    with fitz.open(resized) as doc:
+        assert doc[0].rect.width == 400
+
+
+def test_markups_and_trace(monkeypatch, tmp_path, capsys):
+    calls = []
+
+    def check_output(args):
+        calls.append(args)
+        return b"1\r\n{'A': '{'x': '1', 'y': '2'}'}\r\n1\r\n{}\r\n"
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", check_output)
+    monkeypatch.setattr(PCETools, "BLUEBEAM_ENGINE_DIR", PCETools.BLUEBEAM_ENGINE_DIR)
+    pdf = make_pdf(tmp_path / "m.pdf")
+    PCETools.invalidate_document(pdf)
+    spans = str(tmp_path / "spans.jsonl")
+    assert main(["--engine", "Engine.exe", "--trace", spans, "markups", pdf, "--pages", "1-2"]) == 0
+    assert json.loads(capsys.readouterr().out) == {"1": {"A": {"x": "1", "y": "2"}}, "2": {}}
+    assert calls[0][0] == "Engine.exe"
+    with open(spans) as f:
+        assert "bluebeam.script" in [json.loads(line)["operation"] for line in f]
+
+
+def test_errors_exit_with_1(tmp_path, capsys):
+    assert main(["combine", str(tmp_path / "missing.pdf"), str(tmp_path / "missing2.pdf"), "-o", str(tmp_path / "out.pdf"), "--backend", "native"]) == 1
+    assert capsys.readouterr().err.startswith("pce combine: ")
@@ -0,0 +1,81 @@
+import sys
+import os
+import fitz
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.color_inventory import stream_colors, color_inventory, to_hex
+from pce.pce_tool import PCETools
+
+
+def make_pdf(path, pages=2):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=200, height=200)
+        page.draw_rect(fitz.Rect(10, 10, 50, 50), color=(0, 0, 1), fill=(1, 0, 0))
+        page.draw_line((0, 100), (200, 100), color=(1, 0, 0))
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_stream_colors_models():
+    data = b"q 1 0 0 rg 0 0 1 RG 0.5 g 1 G 0 1 1 0 k 0 0 0 1 K /CS0 cs 0 1 0 sc /P0 scn 1 0 0 0 SCN Q"
+    assert stream_colors(data) == {"fill": {"#FF0000": 2, "#808080": 1, "#00FF00": 1},
+                                   "stroke": {"#0000FF": 1, "#FFFFFF": 1, "#000000": 1, "#00FFFF": 1}}
+    assert to_hex([0.5], "gray") == "#808080"
+
+
+def test_stream_colors_skips_strings_and_inline_images():
+    data = b"BT (1 0 0 rg) Tj <31> Tj ET % 0 1 0 rg\nBI /W 1 /H 1 ID 0 0 1 rg EI 0 0 0 rg 1.5 0 0 0 0 1.0 cm"
+    assert stream_colors(data) == {"fill": {"#000000": 1}, "stroke": {}}
+
+
+@pytest.mark.parametrize("data", [b"BT (a (1 0 0 rg) b) Tj ET 0 0 0 rg", b"BT (a (b (1 0 0 rg)) \\) (0 1 0 rg) c) Tj ET 0 0 0 rg",
+                                  b"BT (a \\(1 0 0 rg) Tj ET 0 0 0 rg", b"% (\n(a (b) 1 0 0 rg) Tj 0 0 0 rg BI /W 1 ID ( EI"])
+def test_stream_colors_skips_nested_parentheses(data):
+    assert stream_colors(data) == {"fill": {"#000000": 1}, "stroke": {}}
+
+
+def test_inventory_pages_and_document(tmp_path):
+    src = make_pdf(tmp_path / "src.pdf")
+    result = PCETools.pdf_color_inventory(src)
+    assert result["pages"][0] == {"fill": {"#FF0000": 1}, "stroke": {"#0000FF": 1, "#FF0000": 1}}
+    assert result["document"] == {"fill": {"#FF0000": 2}, "stroke": {"#0000FF": 2, "#FF0000": 2}}
+    assert set(color_inventory(src, [1, 5])["pages"]) == {1}
+
+
+def test_inventory_counts_shared_forms_on_every_page(tmp_path):
+    template = fitz.open(make_pdf(tmp_path / "template.pdf", pages=1))
+    doc = fitz.open()
+    for _ in range(3):
+        doc.new_page(width=200, height=200).show_pdf_page(fitz.Rect(0, 0, 200, 200), template, 0)
+    doc.save(tmp_path / "forms.pdf")
+    result = color_inventory(str(tmp_path / "forms.pdf"))
+    assert all(result["pages"][p] == {"fill": {"#FF0000": 1}, "stroke": {"#0000FF": 1, "#FF0000": 1}} for p in range(3))
+    assert result["document"] == {"fill": {"#FF0000": 3}, "stroke": {"#0000FF": 3, "#FF0000": 3}}
+
+
+def test_inventory_parallel_matches_serial(tmp_path):
+    src = make_pdf(tmp_path / "src.pdf", pages=7)
+    with open(src, "rb") as f:
+        data = f.read()
+    assert color_inventory(src, workers=2, chunk_size=2) == color_inventory(data)
+
+
+def test_inventory_counts_forms_as_drawn(tmp_path):
+    template = fitz.open(make_pdf(tmp_path / "template.pdf", pages=1))
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    page.show_pdf_page(fitz.Rect(0, 0, 100, 100), template, 0)
+    page.show_pdf_page(fitz.Rect(100, 100, 200, 200), template, 0)
+    form = page.get_xobjects()[0][0]
+    unused = doc.new_page(width=200, height=200)
+    unused.draw_rect(fitz.Rect(0, 0, 10, 10), fill=(0, 1, 0))
+    # a form in page 1's resources that its content never draws
+    doc.xref_set_key(unused.xref, "Resources", "<</XObject<</Unused {} 0 R>>>>".format(form))
+    doc.save(tmp_path / "forms.pdf")
+    result = color_inventory(str(tmp_path / "forms.pdf"))
+    assert result["pages"][0] == {"fill": {"#FF0000": 2}, "stroke": {"#0000FF": 2, "#FF0000": 2}}
+    assert result["pages"][1] == {"fill": {"#00FF00": 1}, "stroke": {"#000000": 1}}
+    # the document is the sum of the pages: the form counts twice, the undrawn one not at all
+    assert result["document"] == {"fill": {"#FF0000": 2, "#00FF00": 1}, "stroke": {"#0000FF": 2, "#FF0000": 2, "#000000": 1}}
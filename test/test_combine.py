@@ -0,0 +1,59 @@
+import sys
+import os
+import io
+import fitz
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.combine import combine_documents, has_annotations
+from pce.pce_tool import PCETools
+import pce.pce_tool
+
+
+def make_pdf(path, pages, text="shared font", annot=False):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=200, height=100 + i)
+        page.insert_text((10, 50), "{} {}".format(text, i), fontname="Courier")
+        if annot:
+            page.add_text_annot((20, 20), "markup")
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_combine_documents_mixed_inputs(tmp_path):
+    a = make_pdf(tmp_path / "a.pdf", 2)
+    b = make_pdf(tmp_path / "b.pdf", 1)
+    with open(b, "rb") as f:
+        b_bytes = f.read()
+    output = str(tmp_path / "out.pdf")
+    combine_documents([a, b_bytes, io.BytesIO(b_bytes), fitz.open(a)], output)
+    with fitz.open(output) as doc:
+        assert [page.rect.height for page in doc] == [100, 101, 100, 100, 100, 101]
+        assert "shared font 1" in doc[1].get_text()
+        fonts = {doc.xref_get_key(font[0], "BaseFont")[1] for page in doc for font in page.get_fonts()}
+        font_xrefs = {font[0] for page in doc for font in page.get_fonts()}
+        assert fonts == {"/Courier"} and len(font_xrefs) == 1
+    assert combine_documents([a, b]).page_count == 3
+
+
+def test_combine_pdf_native_without_bluebeam(tmp_path, monkeypatch):
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", lambda args: pytest.fail("Bluebeam called"))
+    files = [make_pdf(tmp_path / f"{i}.pdf", 1) for i in range(3)]
+    output = str(tmp_path / "out.pdf")
+    PCETools.combine_pdf(files, output)
+    assert PCETools.page_count(output) == 3
+    PCETools.combine_pdf(files[:2], output)
+    assert PCETools.page_count(output) == 2
+    assert PCETools.combine_pdf(files, None).page_count == 3
+
+
+def test_combine_pdf_keeps_bluebeam_for_markups(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", lambda args: calls.append(args))
+    files = [make_pdf(tmp_path / "a.pdf", 1, annot=True), make_pdf(tmp_path / "b.pdf", 1)]
+    assert has_annotations(files) and not has_annotations(files[1:])
+    PCETools.combine_pdf(files, str(tmp_path / "out.pdf"))
+    assert len(calls) == 1 and calls[0][1].startswith("Combine(")
+    PCETools.combine_pdf(files, str(tmp_path / "out.pdf"), backend="native")
+    assert len(calls) == 1
@@ -0,0 +1,107 @@
+import sys
+import os
+import stat
+import fitz
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.converter import SVGConverter, PyMuPDFConverter, InkscapeConverter
+from pce.pce_tool import PCETools
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="100"><rect x="10" y="10" width="50" height="20" fill="#ff0000"/></svg>'
+
+# stand-in for `inkscape --shell`, renders every export-do with PyMuPDF and logs one line per run
+FAKE_INKSCAPE = '''#!{python}
+import sys, fitz
+with open({log!r}, "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+for line in sys.stdin:
+    actions = dict(item.strip().split(":", 1) for item in line.split(";") if ":" in item)
+    if "file-open" in actions:
+        fitz.open("pdf", fitz.open(actions["file-open"], filetype="svg").convert_to_pdf()).save(actions["export-filename"])
+'''
+
+
+def make_svgs(tmp_path, n):
+    src_list, dest_list = [], []
+    for i in range(n):
+        src = tmp_path / f"{i}.svg"
+        src.write_text(SVG.format(100 + i))
+        src_list.append(str(src))
+        dest_list.append(str(tmp_path / f"{i}.pdf"))
+    return src_list, dest_list
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pymupdf_converter(tmp_path, workers):
+    src_list, dest_list = make_svgs(tmp_path, 3)
+    PyMuPDFConverter(workers).convert_many(src_list, dest_list)
+    for i, dest in enumerate(dest_list):
+        with fitz.open(dest) as doc:
+            assert doc.page_count == 1
+            assert doc[0].rect.width == 100 + i
+
+
+def test_inkscape_converter_single_process(tmp_path):
+    log = tmp_path / "calls.log"
+    inkscape = tmp_path / "inkscape"
+    inkscape.write_text(FAKE_INKSCAPE.format(python=sys.executable, log=str(log)))
+    inkscape.chmod(inkscape.stat().st_mode | stat.S_IEXEC)
+    src_list, dest_list = make_svgs(tmp_path, 4)
+    InkscapeConverter(str(inkscape), workers=2).convert_many(src_list, dest_list)
+    assert all(os.path.exists(dest) for dest in dest_list)
+    assert log.read_text().splitlines() == ["--shell", "--shell"]
+
+
+def test_converter_reports_missing_output(tmp_path):
+    src_list, dest_list = make_svgs(tmp_path, 1)
+    inkscape = tmp_path / "inkscape"
+    inkscape.write_text("#!/bin/sh\ncat > /dev/null\n")
+    inkscape.chmod(inkscape.stat().st_mode | stat.S_IEXEC)
+    with pytest.raises(RuntimeError):
+        InkscapeConverter(str(inkscape)).convert_many(src_list, dest_list)
+
+
+def test_converter_backend_must_convert():
+    class NoBackend(SVGConverter):
+        pass
+    with pytest.raises(TypeError):
+        NoBackend()
+
+
+def test_svg_to_pdf_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(PCETools, "SVG_BACKEND", "pymupdf")
+    src_list, dest_list = make_svgs(tmp_path, 2)
+    PCETools.svg_to_pdf(src_list[0], dest_list[0])
+    assert PCETools.page_size(dest_list[0], 0) == (100, 100)
+    PCETools.svgs_to_pdf(src_list, dest_list)
+    assert PCETools.page_size(dest_list[1], 0) == (101, 100)
+
+
+def test_convert_bytes(tmp_path):
+    inkscape = tmp_path / "inkscape"
+    inkscape.write_text(FAKE_INKSCAPE.format(python=sys.executable, log=str(tmp_path / "calls.log")))
+    inkscape.chmod(inkscape.stat().st_mode | stat.S_IEXEC)
+    svg_list = [SVG.format(100 + i) for i in range(3)]
+    for converter in [PyMuPDFConverter(), PyMuPDFConverter(workers=2), InkscapeConverter(str(inkscape))]:
+        pdf_list = converter.convert_bytes(svg_list)
+        assert [fitz.open("pdf", pdf)[0].rect.width for pdf in pdf_list] == [100, 101, 102]
+
+
+def test_text_glyphs_survive_the_pymupdf_backend(tmp_path, monkeypatch):
+    # glyphs are <use xlink:href="#font_..."> in the page SVG, ElementTree must write them back as xlink:href
+    monkeypatch.setattr(PCETools, "SVG_BACKEND", "pymupdf")
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    page.insert_text((20, 50), "Hello", fontsize=20)
+    page.draw_rect(fitz.Rect(10, 100, 50, 150), color=(1, 0, 0), fill=(1, 0, 0))
+    doc.save(tmp_path / "text.pdf")
+    src, dest = str(tmp_path / "text.pdf"), str(tmp_path / "recolored.pdf")
+    direct = len(fitz.open("pdf", fitz.open("svg", doc[0].get_svg_image().encode()).convert_to_pdf())[0].get_drawings())
+    assert direct > 1
+    PCETools.pdf_set_color_v2(src, [0], "#ff0000", "#00ff00", dest)
+    with fitz.open(dest) as recolored:
+        drawings = recolored[0].get_drawings()
+        assert len(drawings) == direct and (0.0, 1.0, 0.0) in [d["fill"] for d in drawings]
+    svg = PCETools.merge_page([PCETools.get_ET(src, 0), PCETools.get_ET(src, 0, "svg1")], [(0, 0), (0, 60)], (200, 200))
+    with fitz.open("pdf", PCETools.svgs_to_pdf_bytes([svg])[0]) as merged:
+        assert len(merged[0].get_drawings()) == 2 * direct
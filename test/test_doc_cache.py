@@ -0,0 +1,97 @@
+import sys
+import os
+import threading
+import fitz
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.doc_cache import DocumentCache
+from pce.pce_tool import PCETools
+
+
+def make_pdf(path, pages=1, size=(200, 100)):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page(width=size[0], height=size[1])
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = DocumentCache(max_handles=4)
+    pdf_file = make_pdf(tmp_path / "a.pdf", pages=3)
+    assert cache.open(pdf_file).page_count == 3
+    assert cache.open(pdf_file) is cache.open(pdf_file)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_cache_reopens_changed_file(tmp_path):
+    cache = DocumentCache()
+    pdf_file = make_pdf(tmp_path / "a.pdf", pages=1)
+    doc = cache.open(pdf_file)
+    cache.invalidate(pdf_file)
+    # dropped, not closed: another thread may still be reading it
+    assert pdf_file not in cache and not doc.is_closed and doc.page_count == 1
+    make_pdf(pdf_file, pages=5)
+    assert cache.open(pdf_file).page_count == 5
+    assert cache.misses == 2
+
+
+def test_cache_detects_stale_signature(tmp_path):
+    cache = DocumentCache()
+    pdf_file = make_pdf(tmp_path / "a.pdf", pages=1)
+    doc = cache.open(pdf_file)
+    # write a different file and swap it in, bypassing invalidate()
+    other = make_pdf(tmp_path / "b.pdf", pages=2)
+    os.replace(other, pdf_file)
+    assert cache.open(pdf_file).page_count == 2
+    # dropped, not closed: it may still be in use
+    assert not doc.is_closed and doc.page_count == 1
+
+
+def test_cache_is_bounded(tmp_path):
+    cache = DocumentCache(max_handles=2)
+    files = [make_pdf(tmp_path / f"{i}.pdf") for i in range(4)]
+    docs = [cache.open(f) for f in files]
+    assert len(cache) == 2
+    assert not docs[0].is_closed and docs[0].page_count == 1
+    assert files[3] in cache and files[0] not in cache
+    cache.invalidate()
+    assert len(cache) == 0 and not docs[3].is_closed and docs[3].page_count == 1
+
+
+def test_evicted_handles_stay_usable_across_threads(tmp_path):
+    # more files in flight than handles: every thread keeps using the document it opened while others evict it
+    cache = DocumentCache(max_handles=3)
+    files = [make_pdf(tmp_path / f"{i}.pdf", pages=1 + i % 3, size=(100 + i, 100)) for i in range(24)]
+    errors = []
+
+    def work(offset):
+        try:
+            for k in range(60):
+                i = (offset + k) % len(files)
+                doc = cache.open(files[i])
+                for _ in range(3):
+                    cache.open(files[(i + 7) % len(files)])
+                    assert doc.page_count == 1 + i % 3 and doc[0].rect.width == 100 + i
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=work, args=(n * 5, )) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [] and len(cache) <= 3
+
+
+def test_pce_tools_uses_shared_cache(tmp_path):
+    pdf_file = make_pdf(tmp_path / "a.pdf", pages=2, size=(300, 150))
+    PCETools.DOC_CACHE.invalidate()
+    PCETools.DOC_CACHE.reset_stats()
+    assert PCETools.page_count(pdf_file) == 2
+    assert PCETools.page_size(pdf_file, 1) == (300, 150)
+    assert PCETools.DOC_CACHE.stats()["misses"] == 1
+    assert PCETools.DOC_CACHE.stats()["hits"] == 1
+    PCETools.resize_pdf(pdf_file, 100, 300, 150, 100, 600, 300, pdf_file)
+    assert pdf_file not in PCETools.DOC_CACHE
+    assert PCETools.page_size(pdf_file, 0) == (600, 300)
@@ -0,0 +1,76 @@
+import sys
+import os
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.google_drive import GoogleDrive
+from pce.drive_cache import DriveMetadataCache
+from drive_stand_in import DriveStandIn, LocalHttp
+
+
+@pytest.fixture
+def server():
+    with DriveStandIn() as server:
+        server.state.page_size = 7
+        yield server
+
+
+def drive(server, cache_file=None):
+    return GoogleDrive(None, api_endpoint=server.url, http_factory=LocalHttp, cache_file=cache_file)
+
+
+def test_iter_files_follows_pages(server):
+    ids = [server.state.add_file("sheet{}.pdf".format(i)) for i in range(30)]
+    google_drive = drive(server)
+    assert [f["id"] for f in google_drive.iter_files()] == ids
+    assert len(server.state.requests) == 5
+    assert [f["id"] for f in google_drive.list_all_files(q="name = 'sheet3.pdf'")] == [ids[3]]
+
+
+def test_find_files_without_cache(server):
+    file_id = server.state.add_file("it's.pdf", b"data")
+    google_drive = drive(server)
+    assert google_drive.find_file("it's.pdf") == file_id
+    assert google_drive.find_file("missing.pdf") is None
+    assert google_drive.find_files("it's.pdf", md5Checksum="0" * 32) == []
+
+
+def test_cache_refreshes_from_changes(server, tmp_path):
+    cache_file = str(tmp_path / "drive.sqlite")
+    old = [server.state.add_file("sheet{}.pdf".format(i), b"v1") for i in range(20)]
+    google_drive = drive(server, cache_file)
+    assert google_drive.find_file("sheet4.pdf") == old[4]
+    requests = len(server.state.requests)
+    # lookups and uploads don't list again, the upload goes into the cache directly
+    new = google_drive.upload(b"v2", "sheet4.pdf")
+    assert [f["id"] for f in google_drive.find_files("sheet4.pdf")] == [old[4], new]
+    assert google_drive.find_files("sheet4.pdf", google_drive.cache.get(new)["md5Checksum"])[0]["id"] == new
+    assert all(method != "GET" for method, _ in server.state.requests[requests:])
+
+    # changes made elsewhere come in through the changes feed
+    google_drive.delete_file(old[0])
+    del server.state.files[old[1]]
+    server.state.changes.append(old[1])
+    other = server.state.add_file("other.pdf")
+    requests = len(server.state.requests)
+    google_drive.refresh_cache()
+    assert [path for _, path in server.state.requests[requests:]] == ["/drive/v3/changes"]
+    assert google_drive.find_file("sheet0.pdf") is None and google_drive.find_file("sheet1.pdf") is None
+    assert google_drive.find_file("other.pdf") == other
+    google_drive.cache.close()
+
+    # the cache and its position in the feed survive a restart
+    reopened = DriveMetadataCache(cache_file)
+    assert len(reopened) == 20 and reopened.page_token() == str(len(server.state.changes))
+    reopened.close()
+
+
+def test_cache_replace_and_apply():
+    cache = DriveMetadataCache(":memory:")
+    assert cache.page_token() is None
+    cache.replace([{"id": "a", "name": "x.pdf", "md5Checksum": "1"}, {"id": "b", "name": "x.pdf", "md5Checksum": "2"}], "5")
+    assert [f["id"] for f in cache.find("x.pdf")] == ["a", "b"] and [f["id"] for f in cache.find("x.pdf", "2")] == ["b"]
+    cache.apply([{"fileId": "a", "removed": False, "file": {"id": "a", "name": "x.pdf", "trashed": True}},
+                 {"fileId": "c", "removed": False, "file": {"id": "c", "name": "y.pdf"}}], "9")
+    assert cache.get("a") is None and cache.get("c")["name"] == "y.pdf" and cache.page_token() == "9"
+    cache.clear()
+    assert len(cache) == 0 and cache.page_token() is None
@@ -0,0 +1,89 @@
+import sys
+import os
+import time
+import asyncio
+import threading
+import fitz
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pce.pce_tool
+from pce.engine import EngineExecutor
+from pce.pce_tool import PCETools
+
+
+class Recorder:
+    # records the order of calls and how many ran at once, overall and per file
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.order = []
+        self.running = {}
+        self.peak = {}
+
+    def __call__(self, file_dir, item, delay=0.02):
+        with self.lock:
+            self.running[file_dir] = self.running.get(file_dir, 0) + 1
+            self.running["*"] = self.running.get("*", 0) + 1
+            for key in (file_dir, "*"):
+                self.peak[key] = max(self.peak.get(key, 0), self.running[key])
+        time.sleep(delay)
+        with self.lock:
+            self.order.append((file_dir, item))
+            self.running[file_dir] -= 1
+            self.running["*"] -= 1
+        return item
+
+
+def test_per_file_order_and_parallel_files():
+    executor, record = EngineExecutor(4), Recorder()
+    futures = [executor.submit(f, record, f, i) for i in range(5) for f in ("a.pdf", "b.pdf")]
+    assert [future.result() for future in futures] == [i for i in range(5) for _ in range(2)]
+    assert [i for f, i in record.order if f == "a.pdf"] == list(range(5))
+    assert [i for f, i in record.order if f == "b.pdf"] == list(range(5))
+    assert record.peak["a.pdf"] == 1 and record.peak["b.pdf"] == 1 and record.peak["*"] == 2
+    executor.shutdown()
+
+
+def test_failure_does_not_block_the_file():
+    executor, record = EngineExecutor(2), Recorder()
+
+    def fail():
+        raise ValueError("engine failed")
+    first = executor.submit("a.pdf", fail)
+    second = executor.submit("a.pdf", record, "a.pdf", 1, 0)
+    with pytest.raises(ValueError):
+        first.result()
+    assert second.result() == 1
+    executor.join()
+    assert executor.stats()["outstanding"] == 0 and executor.stats()["busy_files"] == 0
+    executor.shutdown()
+
+
+def test_async_markups_for_a_register(monkeypatch, tmp_path):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def check_output(args):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        page = args[1].split("MarkupGetExList(")[1].split(")")[0]
+        return "1\r\n{{'M{}': '{{'x': '{}'}}'}}\r\n".format(page, page).encode("gbk")
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", check_output)
+    monkeypatch.setattr(PCETools, "ENGINE", EngineExecutor(4))
+    files = []
+    for i in range(4):
+        doc = fitz.open()
+        doc.new_page()
+        files.append(str(tmp_path / f"{i}.pdf"))
+        doc.save(files[-1])
+        PCETools.invalidate_document(files[-1])
+
+    async def register():
+        return await asyncio.gather(*[PCETools.areturn_markup_by_page(f, 1) for f in files])
+    assert asyncio.run(register()) == [{"M1": {"x": "1"}}] * 4
+    assert peak[0] == 4
+    assert PCETools.map_files(PCETools.return_markup_by_page, files, 1) == [{"M1": {"x": "1"}}] * 4
+    PCETools.ENGINE.shutdown()
@@ -0,0 +1,105 @@
+import sys
+import os
+import io
+from datetime import timedelta
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.google_drive import GoogleDrive
+from drive_stand_in import DriveStandIn, LocalHttp
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    monkeypatch.setattr(GoogleDrive, "CHUNK_SIZE", 256 * 1024)
+    monkeypatch.setattr(GoogleDrive, "RETRY_DELAY", 0.01)
+    with DriveStandIn() as server:
+        yield GoogleDrive(None, api_endpoint=server.url, http_factory=LocalHttp), server.state
+
+
+def test_upload_paths_and_buffers(drive, tmp_path):
+    google_drive, state = drive
+    path = tmp_path / "sheet.pdf"
+    path.write_bytes(b"%PDF" + b"p" * 600000)
+    data = b"%PDF" + b"m" * 300000
+    file_ids = google_drive.upload_many([str(path), (data, "memory.pdf"), (io.BytesIO(b"small"), "stream.pdf")], workers=3)
+    assert [state.files[i]["name"] for i in file_ids] == ["sheet.pdf", "memory.pdf", "stream.pdf"]
+    assert state.files[file_ids[0]]["content"] == path.read_bytes()
+    assert state.files[file_ids[1]]["content"] == data
+    assert state.files[file_ids[2]]["content"] == b"small"
+
+
+def test_upload_resumes_after_failed_chunk(drive):
+    google_drive, state = drive
+    data = bytes(range(256)) * 4000
+    state.fail_puts = {2}
+    file_id = google_drive.upload(data, "resumed.pdf")
+    assert state.files[file_id]["content"] == data
+    # 4 chunks, the failed one again and the status query before it
+    assert state.puts == 4 + 1 + 1
+
+
+def test_upload_many_for_someone_read(drive):
+    google_drive, state = drive
+    files = [("%PDF sheet {}".format(i).encode(), "sheet{}.pdf".format(i)) for i in range(150)]
+    links = google_drive.upload_many_for_someone_read(files, expirationTime=timedelta(days=7), workers=4)
+    assert len(links) == 150 and all(link.startswith("https://drive.google.com/uc?id=F") for link in links)
+    assert 1 < state.peak_uploads <= 4
+    assert state.batches == [100, 50]
+    for link in links:
+        permissions = state.files[link.split("id=")[1].split("&")[0]]["permissions"]
+        assert len(permissions) == 1 and permissions[0]["type"] == "anyone" and permissions[0]["role"] == "reader" and "expirationTime" in permissions[0]
+
+
+def test_change_permissions_reports_missing_file(drive):
+    google_drive, state = drive
+    with pytest.raises(Exception):
+        google_drive.change_permissions(["missing"], "anyone", "reader")
+
+
+def test_sync_uploads_only_changed_files(drive, tmp_path):
+    google_drive, state = drive
+    for i in range(4):
+        (tmp_path / "sheet{}.pdf".format(i)).write_bytes("%PDF sheet {}".format(i).encode())
+    first = google_drive.sync(str(tmp_path))
+    assert [action for _, action in first.values()] == ["uploaded"] * 4
+    uploads = len(state.uploads)
+    assert all(action == "skipped" for _, action in google_drive.sync(str(tmp_path)).values())
+    assert len(state.uploads) == uploads
+
+    (tmp_path / "sheet2.pdf").write_bytes(b"%PDF sheet 2, revised")
+    (tmp_path / "sheet9.pdf").write_bytes(b"%PDF new sheet")
+    result = google_drive.sync(str(tmp_path))
+    assert {name: action for name, (_, action) in result.items()} == {
+        "sheet0.pdf": "skipped", "sheet1.pdf": "skipped", "sheet2.pdf": "updated", "sheet3.pdf": "skipped", "sheet9.pdf": "uploaded"}
+    # a new revision of the same file, not a second file with that name
+    assert result["sheet2.pdf"][0] == first["sheet2.pdf"][0]
+    assert state.files[result["sheet2.pdf"][0]]["content"] == b"%PDF sheet 2, revised" and state.files[result["sheet2.pdf"][0]]["revisions"] == 2
+    assert len(state.files) == 5
+
+
+def test_sync_with_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(GoogleDrive, "RETRY_DELAY", 0.01)
+    local_dir = tmp_path / "out"
+    local_dir.mkdir()
+    (local_dir / "a.pdf").write_bytes(b"a")
+    with DriveStandIn() as server:
+        google_drive = GoogleDrive(None, api_endpoint=server.url, http_factory=LocalHttp, cache_file=str(tmp_path / "drive.sqlite"))
+        existing = server.state.add_file("a.pdf", b"a")
+        assert google_drive.sync(str(local_dir)) == {"a.pdf": (existing, "skipped")}
+        server.state.set_content(existing, b"changed elsewhere")
+        assert google_drive.sync(str(local_dir)) == {"a.pdf": (existing, "updated")}
+        assert server.state.files[existing]["content"] == b"a"
+
+
+def test_download_in_ranges(drive, tmp_path):
+    google_drive, state = drive
+    data = bytes(range(256)) * 1000 + b"tail"
+    file_id = state.add_file("big.pdf", data)
+    local_path = tmp_path / "big.pdf"
+    google_drive.download_file(file_id, str(local_path), chunk_size=10000, workers=4)
+    assert local_path.read_bytes() == data
+    assert sorted(state.ranges) == [(start, min(start + 9999, len(data) - 1)) for start in range(0, len(data), 10000)]
+
+    empty = state.add_file("empty.pdf")
+    google_drive.download_file(empty, str(local_path))
+    assert local_path.read_bytes() == b""
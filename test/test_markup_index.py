@@ -0,0 +1,62 @@
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.markup_index import MarkupIndex
+from pce.pce_tool import PCETools
+
+
+def random_markups(n, seed=0):
+    rnd = random.Random(seed)
+    markups = {}
+    for i in range(n):
+        markups["M{}".format(i)] = {"x": str(rnd.uniform(0, 1000)), "y": str(rnd.uniform(0, 800)), "width": str(rnd.uniform(1, 30)), "height": "10",
+                                    "color": rnd.choice(["#7A0000", "#ff0000", "#0000FF"]), "subject": rnd.choice(["Text Box", "Rectangle"]), "comment": rnd.choice(["A", " b ", "C"])}
+    markups["NOPOS"] = {"color": "#7A0000", "comment": "A"}
+    return markups
+
+
+def brute_force_region(markups, region):
+    return {k: v for k, v in markups.items() if 'x' in v and region[0] < float(v['x']) < region[0] + region[2] and region[1] < float(v['y']) < region[1] + region[3]}
+
+
+def test_region_matches_scan():
+    markups = random_markups(2000)
+    index = MarkupIndex(markups)
+    rnd = random.Random(1)
+    for _ in range(50):
+        region = [rnd.uniform(-50, 1000), rnd.uniform(-50, 800), rnd.uniform(0, 300), rnd.uniform(0, 300)]
+        expected = brute_force_region(markups, region)
+        assert list(index.region(region)) == list(expected)
+        assert list(PCETools.get_markup_in_region(index, region)) == list(expected)
+
+
+def test_point_filters_and_nearest():
+    markups = random_markups(500)
+    index = MarkupIndex(markups, cell_size=20)
+    pos = (float(markups["M42"]["x"]), float(markups["M42"]["y"]))
+    assert "M42" in index.near(pos, 1)
+    assert list(index.nearest(pos, k=1)) == ["M42"]
+    nearest = list(index.nearest((500, 400), k=5))
+    distances = [((float(markups[k]["x"]) - 500) ** 2 + (float(markups[k]["y"]) - 400) ** 2) for k in nearest]
+    assert distances == sorted(distances) and len(nearest) == 5
+    red_b = index.filter(color="#FF0000", comment="B")
+    assert list(red_b) == [k for k, v in markups.items() if v["color"] == "#ff0000" and v["comment"] == " b "]
+    assert set(index.filter(color=["#7a0000"])) == {k for k, v in markups.items() if v["color"] == "#7A0000"}
+    region = [0, 0, 500, 500]
+    assert list(index.region(region, subject="rectangle")) == [k for k in brute_force_region(markups, region) if markups[k]["subject"] == "Rectangle"]
+
+
+def test_overlapping_uses_size():
+    index = MarkupIndex({"A": {"x": "0", "y": "0", "width": "10", "height": "10"}, "B": {"x": "20", "y": "20", "width": "1", "height": "1"}})
+    assert list(index.to_dict(index.query_overlapping([5, 5, 2, 2]))) == ["A"]
+    assert list(index.region([5, 5, 2, 2])) == []
+
+
+def test_structured_markups_with_index():
+    markups = {"R{}".format(i): {"x": "10", "y": str(100 - i * 10), "comment": "rev {}".format(i)} for i in range(4)}
+    markups["P"] = {"x": "200", "y": "50", "comment": "project"}
+    context = {"PROJECT": [200, 50], "VERSION": {"$TYPE": "while-list", "$UPLIFT_SIZE": (0, -10), "REV": [10, 100]}}
+    result = PCETools.get_structured_markups_from(markups, context, tol=6)
+    assert result["PROJECT"] == ["P", [200.0, 50.0, "project"]]
+    assert [row["REV"][0] for row in result["VERSION"]] == ["R0", "R1", "R2", "R3"]
@@ -0,0 +1,75 @@
+import re
+import sys
+import os
+import json
+import glob
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce import markup_parser
+from pce.markup_parser import parse_markups, iter_markups, MarkupParseError
+from pce.pce_tool import PCETools
+
+CORPUS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "data", "markup_corpus", "*.txt")))
+
+
+@pytest.mark.parametrize("sample", CORPUS, ids=[os.path.basename(f) for f in CORPUS])
+def test_corpus(sample):
+    with open(sample, encoding="utf-8") as f:
+        text = f.read()
+    with open(sample[:-4] + ".json", encoding="utf-8") as f:
+        expected = json.load(f)
+    assert parse_markups(text) == expected
+    assert PCETools._parse_markup_text(text) == expected
+
+
+def test_selected_fields():
+    with open(CORPUS[0], encoding="utf-8") as f:
+        text = f.read()
+    assert parse_markups(text, fields=["x", "comment"]) == {"AAA": {"x": "10.5", "comment": "FOR APPROVAL"}, "BBB": {"x": "1", "comment": "PROJECT ADDRESS\r"}}
+
+
+def test_incremental():
+    text = "{'A': '{'x': '1'}', 'B': '{'x': '2'}', broken"
+    markups = iter_markups(text)
+    assert next(markups) == ("A", {"x": "1"})
+    assert next(markups) == ("B", {"x": "2"})
+    with pytest.raises(MarkupParseError):
+        next(markups)
+
+
+@pytest.mark.parametrize("text", ["{'A': '{'x': '1'}'", "{'A' '1'}", "{'A': 'x'} tail", "{'A': 'unterminated}"])
+def test_malformed(text):
+    with pytest.raises(MarkupParseError):
+        parse_markups(text)
+
+
+@pytest.fixture
+def generic_parse(monkeypatch):
+    # parse_markups with the one regex per markup path turned off, so every value goes through the token by token parser
+    def parse(text, fields=None):
+        with monkeypatch.context() as m:
+            m.setattr(markup_parser, "_FLAT_ITEM", re.compile(r"(?!)"))
+            m.setattr(markup_parser, "_FLAT_DICT", re.compile(r"(?!)"))
+            return parse_markups(text, fields)
+    return parse
+
+
+@pytest.mark.parametrize("sample", CORPUS, ids=[os.path.basename(f) for f in CORPUS])
+def test_flat_path_matches_generic_path(sample, generic_parse):
+    with open(sample, encoding="utf-8") as f:
+        text = f.read()
+    assert parse_markups(text) == generic_parse(text)
+    assert parse_markups(text, fields=["x", "comment"]) == generic_parse(text, fields=["x", "comment"])
+
+
+@pytest.mark.parametrize("comment", ["{}", "{} ", "{", "}", "{TBC}", "{|'a|': |'1|'}", "C:||", "C:||||", "|||'x", "||q", "||u12", "x||"])
+def test_flat_path_edge_comments(comment, generic_parse):
+    text = "{'A': '{'x': '1', 'comment': '" + comment + "'}', 'B': '{'comment': '" + comment + "', 'x': '2'}'}"
+    assert parse_markups(text) == generic_parse(text)
+    assert parse_markups(text, fields=["comment"]) == generic_parse(text, fields=["comment"])
+
+
+def test_braces_only_open_a_dict_in_structural_position():
+    # '{}' is an empty dict, '{} ' and '{|'a|'}' are comments
+    text = "{'A': '{'a': '{}', 'b': '{} ', 'c': '{|'a|'}', 'd': '{'e': 'True'}'}'}"
+    assert parse_markups(text) == {"A": {"a": {}, "b": "{} ", "c": "{'a'}", "d": {"e": True}}}
@@ -0,0 +1,59 @@
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.palette import palette_colors, palette_region, FIRST_SWATCH, PROBE, STEP
+
+
+def screen(rows, width=3840, height=2160, seed=0):
+    # a white screen with a rows x 8 palette of random swatches, some colors repeated, and the probe column
+    # turning dark below the palette
+    rng = np.random.default_rng(seed)
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    colors = rng.integers(0, 255, size=(6, 3), dtype=np.uint8)
+    for i in range(rows):
+        for j in range(8):
+            x, y = FIRST_SWATCH[0] + STEP * j, FIRST_SWATCH[1] + STEP * i
+            pixels[y - 5:y + 5, x - 5:x + 5] = colors[rng.integers(0, len(colors))]
+    pixels[PROBE[1] + STEP * (rows + 1):, PROBE[0]] = (40, 40, 40)
+    return pixels
+
+
+def reference(pixels):
+    # the per-pixel loop get_color used to run
+    def getpixel(xy):
+        return tuple(int(c) for c in pixels[xy[1], xy[0]])
+    lines = 0
+    while PROBE[1] + STEP * lines < pixels.shape[0]:
+        if getpixel((PROBE[0], PROBE[1] + STEP * lines)) != (255, 255, 255):
+            break
+        lines += 1
+    lines -= 1
+    res = {}
+    for i in range(lines):
+        for j in range(8):
+            xy = (FIRST_SWATCH[0] + STEP * j, FIRST_SWATCH[1] + STEP * i)
+            color = getpixel(xy)
+            if color not in res:
+                res[color] = xy
+    return res
+
+
+def test_matches_the_pixel_loop():
+    for rows in (1, 4, 12):
+        pixels = screen(rows, seed=rows)
+        colors = palette_colors(pixels)
+        assert colors == reference(pixels) and list(colors.items()) == list(reference(pixels).items())
+        assert len(colors) > 1
+
+
+def test_region_capture_gives_the_same_palette():
+    pixels = screen(5)
+    left, top, width, height = palette_region(pixels.shape[0])
+    assert palette_colors(pixels[top:top + height, left:left + width], (left, top)) == reference(pixels)
+
+
+def test_no_palette():
+    assert palette_colors(np.zeros((2160, 3840, 3), dtype=np.uint8)) == {}
+    assert palette_colors(np.full((2160, 3840, 4), 255, dtype=np.uint8)) == {}
+
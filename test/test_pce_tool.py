@@ -3,8 +3,13 @@ import json
 import os
 import shutil
 import functools
+import io
+import re
+import fitz
+import pytest
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from pce.pce_tool import PCETools
+import pce.pce_tool
 
 """
 def test_overlay():
@@ -143,4 +148,173 @@ def test_version_setter():
     new_line = {"REV":["",[0,0,"D"]],"REVISION DESCRIPTION":["",[34.50598,808.8484,"FOR CONSTRUCTION"]],"DRW":["",[142.6079,808.8484,"YX"]],"CHK":["",[0,0,"FY"]],"DATE Y.M.D":["",[181.502,808.8484,"20240830"]]}
     DATA_A = {"VERSION": structured_context["VERSION"], "PROJECT":["VTEEWTAAIDLFTHAP",[869.0056,747.4893,"299 Sussex St"]],"SCALE":["OBHMQOQPTKPYILCW",[1075.596,747.387,"1:1000000"]],"PROJECT No.":["WNHCNQNOOAEPUSUN",[1079.934,771.3923,"00233"]],"DRAWING No.":["MAIEOBPIPHPVHLGM",[1084.874,794.3511,"09874"]],"TYPE OF ISSUE":["RJAGNINEVSPMQEEO",[1084.786,815.5005,"Bill"]],"DRAWN BY":["WLBEZUIWNGGJEGNT",[1141.957,748.9429,"Hello"]],"CHECKED BY":["EIGQDLSYXVPYNYMR",[1143.425,771.4201,"Boss"]]}
     DATA_A["VERSION"].append(new_line)
-    PCETools.set_structured_markups(pdf_file, 1, DATA_A, (0, UPLIFT_SIZE))
\ No newline at end of file
+    PCETools.set_structured_markups(pdf_file, 1, DATA_A, (0, UPLIFT_SIZE))
+
+def bluebeam_markup_text(markups):
+    return "{" + ", ".join("'{}': '{{{}}}'".format(k, ", ".join("'{}': '{}'".format(a, b) for a, b in v.items())) for k, v in markups.items()) + "}"
+
+
+@pytest.fixture
+def fake_engine(monkeypatch, tmp_path):
+    # emulates ScriptEngine.exe for MarkupGetExList, one header line and one result line per query
+    pages = {1: {"A1": {"color": "#7A0000", "x": "10", "y": "20", "comment": "anchor"}}, 2: {}, 3: {"C1": {"color": "#FF0000", "x": "1.5", "y": "2.5", "comment": "note"}}}
+    calls = []
+
+    def check_output(args):
+        command = args[1]
+        script = re.match(r"Script\('(.*)'\)", command)
+        if script is not None:
+            with open(script.group(1)) as f:
+                command = f.read()
+        calls.append(command)
+        lines = []
+        for page in re.findall(r"MarkupGetExList\((\d+)\)", command):
+            lines.extend(["", bluebeam_markup_text(pages[int(page)]) if pages[int(page)] else ""])
+        return ("\r\n".join(lines) + "\r\n").encode("gbk")
+
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", check_output)
+    monkeypatch.chdir(tmp_path)
+    doc = fitz.open()
+    for _ in pages:
+        doc.new_page()
+    doc.save(tmp_path / "markups.pdf")
+    PCETools.invalidate_document(str(tmp_path / "markups.pdf"))
+    return str(tmp_path / "markups.pdf"), calls
+
+
+def test_return_markups_for_document(fake_engine):
+    pdf_file, calls = fake_engine
+    markups = PCETools.return_markups_for_document(pdf_file)
+    assert len(calls) == 1
+    assert list(markups) == [1, 2, 3]
+    assert markups[1]["A1"]["x"] == "10"
+    assert markups[2] == {}
+    assert markups[3]["C1"]["comment"] == "note"
+    assert not os.path.exists("get_markup.bci")
+
+
+def test_return_markups_for_document_cached(fake_engine):
+    pdf_file, calls = fake_engine
+    PCETools.return_markups_for_document(pdf_file, [1, 3])
+    assert PCETools.return_markups_for_document(pdf_file, [3])[3]["C1"]["x"] == "1.5"
+    assert PCETools.return_markup_by_page(pdf_file, 1)["A1"]["color"] == "#7A0000"
+    PCETools.return_markups_for_document(pdf_file)
+    assert len(calls) == 2 and "MarkupGetExList(1)" not in calls[1]
+    # results are copies, callers can't poison the cache
+    PCETools.return_markup_by_page(pdf_file, 1)["A1"]["x"] = "0"
+    assert PCETools.return_markup_by_page(pdf_file, 1)["A1"]["x"] == "10"
+    PCETools.invalidate_document(pdf_file)
+    PCETools.return_markups_for_document(pdf_file, [1])
+    assert len(calls) == 3
+
+
+def test_markups_of_a_file_saved_while_reading_are_not_cached(fake_engine, monkeypatch):
+    # another session saves the file while the script runs: what it read may be the old markups
+    pdf_file, calls = fake_engine
+    check_output = pce.pce_tool.subprocess.check_output
+
+    def saved_meanwhile(args):
+        with open(pdf_file, "ab") as f:
+            f.write(b"\n")
+        return check_output(args)
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", saved_meanwhile)
+    PCETools.return_markups_for_document(pdf_file, [1, 3])
+    PCETools.return_markup_by_page(pdf_file, 2)
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", check_output)
+    PCETools.return_markups_for_document(pdf_file)
+    assert len(calls) == 3 and all("MarkupGetExList({})".format(i) in calls[2] for i in (1, 2, 3))
+    PCETools.return_markups_for_document(pdf_file)
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_mix_patch_pipeline(tmp_path, monkeypatch, workers):
+    # Bluebeam parts are replaced: anchors come from a dict, combine is a plain PyMuPDF concatenation
+    standard_form = str(tmp_path / "form.pdf")
+    file_list = [str(tmp_path / f"{i}.pdf") for i in range(2)]
+    for path, pages in [(standard_form, 1), (file_list[0], 3), (file_list[1], 2)]:
+        doc = fitz.open()
+        for _ in range(pages):
+            doc.new_page(width=300, height=200).draw_rect(fitz.Rect(10, 10, 20, 20), fill=(1, 0, 0))
+        doc.save(path)
+    anchors = {standard_form: "#7A0000", file_list[0]: "#7A0000", file_list[1]: "#00007A"}
+
+    def fake_markups(file_dir, pages=None):
+        pages = range(1, PCETools.page_count(file_dir) + 1) if pages is None else pages
+        result = {i: {"A": {"color": anchors[file_dir], "x": "5", "y": "5"}} for i in pages}
+        if file_dir == standard_form:
+            result[1]["B"] = {"color": "#00007A", "x": "50", "y": "5"}
+        return result
+
+    def fake_combine(input_file_list, output_file):
+        doc = fitz.open()
+        for f in input_file_list:
+            doc.insert_pdf(fitz.open(f))
+        doc.save(output_file)
+
+    pasted = []
+    monkeypatch.setattr(PCETools, "return_markups_for_document", staticmethod(fake_markups))
+    monkeypatch.setattr(PCETools, "return_markup_by_page", staticmethod(lambda file_dir, i: fake_markups(file_dir, [i])[i]))
+    monkeypatch.setattr(PCETools, "paste_markup_to_file", staticmethod(lambda standard_form, new_file: pasted.append(new_file)))
+    monkeypatch.setattr(PCETools, "combine_pdf", staticmethod(fake_combine))
+    monkeypatch.setattr(PCETools, "SVG_BACKEND", "pymupdf")
+    monkeypatch.setattr(PCETools, "TEMP_PATH", str(tmp_path))
+    output_path = str(tmp_path / "mixed.pdf")
+    PCETools.mix_patch(standard_form, file_list, output_path, workers=workers, max_in_flight=1, chunk_size=1)
+    assert PCETools.page_count(output_path) == 3
+    assert [round(v) for v in PCETools.page_size(output_path, 2)] == [300, 200]
+    assert pasted == [os.path.join(str(tmp_path), f"{output_path}.{i}.pdf") for i in range(3)]
+    assert sorted(os.listdir(tmp_path)) == ["0.pdf", "1.pdf", "form.pdf", "mixed.pdf"]
+
+
+def test_pdf_set_color_in_memory(tmp_path, monkeypatch):
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+    monkeypatch.setattr(PCETools, "SVG_BACKEND", "pymupdf")
+    monkeypatch.setattr(PCETools, "TEMP_PATH", str(workspace))
+    monkeypatch.chdir(workspace)
+    src = str(tmp_path / "src.pdf")
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page(width=200, height=100).draw_rect(fitz.Rect(10, 10, 50, 50), fill=(0, 0, 1))
+    doc.save(src)
+    output = str(tmp_path / "out.pdf")
+    PCETools.pdf_set_color_v2(src, [1], "#0000ff", "#ff0000", output)
+    assert os.listdir(workspace) == []
+    with fitz.open(output) as out:
+        assert out.page_count == 2
+        assert [d["fill"] for d in out[0].get_drawings()][-1] == (0.0, 0.0, 1.0)
+        assert [d["fill"] for d in out[1].get_drawings()][-1] == (1.0, 0.0, 0.0)
+
+
+def test_in_memory_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(PCETools, "SVG_BACKEND", "pymupdf")
+    doc = fitz.open()
+    doc.new_page(width=200, height=100).draw_rect(fitz.Rect(10, 10, 50, 50), fill=(0, 0, 1))
+    pdf_bytes = doc.tobytes()
+    svg = PCETools.merge_page([PCETools.get_ET(pdf_bytes, 0), PCETools.get_ET(doc, 0)], [(0, 0), (20, 0)], (200, 100))
+    assert svg.startswith("<svg")
+    page = PCETools.svg_to_pdf(svg)
+    assert PCETools.page_size(page, 0) == (200, 100)
+    resized = PCETools.resize_pdf(page, 100, 200, 100, 100, 400, 200)
+    assert PCETools.page_size(resized, 0) == (400, 200)
+    assert PCETools.combine_pdf([resized, page], None).page_count == 2
+
+
+def test_run_script_without_fixed_files(tmp_path, monkeypatch):
+    calls = []
+
+    def check_output(args):
+        script = re.match(r"Script\('(.*)'\)", args[1])
+        with open(script.group(1)) if script else io.StringIO(args[1]) as f:
+            calls.append((script is not None, f.read()))
+        return b""
+
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", check_output)
+    monkeypatch.chdir(tmp_path)
+    PCETools._run_script("set_markup.bci", ["Open('a.pdf')", "Save()", "Close()"])
+    long_command = ["Open('a.pdf')"] + ["MarkupSet(1, 'ID{}', '{{}}')".format(i) for i in range(1000)] + ["Close()"]
+    PCETools._run_script("set_markup.bci", long_command)
+    assert calls[0] == (False, "Open('a.pdf') Save() Close()")
+    assert calls[1] == (True, '\n'.join(long_command))
+    assert os.listdir(tmp_path) == []
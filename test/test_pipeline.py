@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.pipeline import imap_bounded, chunked
+
+
+def square(x):
+    return x * x
+
+
+def test_imap_bounded_keeps_order():
+    assert list(imap_bounded(square, range(20), workers=3, max_in_flight=2)) == [x * x for x in range(20)]
+    assert list(imap_bounded(square, range(5))) == [0, 1, 4, 9, 16]
+
+
+def test_imap_bounded_is_lazy():
+    submitted = []
+
+    def items():
+        for i in range(10):
+            submitted.append(i)
+            yield i
+    results = imap_bounded(square, items(), workers=2, max_in_flight=3)
+    assert next(results) == 0
+    assert len(submitted) == 3
+    results.close()
+
+
+def test_chunked():
+    assert chunked(range(5), 2) == [[0, 1], [2, 3], [4]]
+    assert chunked([], 3) == []
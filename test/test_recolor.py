@@ -0,0 +1,113 @@
+import sys
+import os
+import fitz
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pypdf.generic import NameObject
+from pce.recolor import recolor_pdf, recolor_operations
+from pce.pce_tool import PCETools
+
+
+def make_pdf(path, pages=2):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=200, height=200)
+        page.draw_rect(fitz.Rect(10, 10, 50, 50), color=(0, 0, 1), fill=(1, 0, 0))
+        page.draw_line((0, 100), (200, 100), color=(1, 0, 0))
+        page.insert_text((20, 150), "keep me", color=(0, 0, 0))
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def colors(pdf_file, page_number):
+    with fitz.open(pdf_file) as doc:
+        return [(d.get("fill"), d.get("color"), d.get("fill_opacity"), d.get("stroke_opacity")) for d in doc[page_number].get_drawings()]
+
+
+def test_recolor_selected_pages(tmp_path):
+    src = make_pdf(tmp_path / "src.pdf")
+    dest = str(tmp_path / "dest.pdf")
+    stats = PCETools.pdf_set_color_v3(src, [0], "#FF0000", "#00ff00", dest)
+    assert stats == {0: 2}
+    assert colors(dest, 0)[0][:2] == ((0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+    assert colors(dest, 0)[1][1] == (0.0, 1.0, 0.0)
+    with fitz.open(src) as a, fitz.open(dest) as b:
+        assert a[1].read_contents() == b[1].read_contents()
+        assert "keep me" in b[0].get_text()
+
+
+def test_recolor_opacity(tmp_path):
+    src = make_pdf(tmp_path / "src.pdf", pages=1)
+    dest = str(tmp_path / "dest.pdf")
+    PCETools.pdf_set_color_v3(src, [0], "#ff0000", "#000000", dest, opacity=0.5)
+    fill, stroke = colors(dest, 0)[:2]
+    assert fill[0] == (0.0, 0.0, 0.0) and fill[2] == 0.5 and fill[3] == 1.0
+    assert stroke[1] == (0.0, 0.0, 0.0) and stroke[3] == 0.5
+
+
+def test_recolor_form_xobject(tmp_path):
+    template = make_pdf(tmp_path / "template.pdf", pages=1)
+    doc, template_doc = fitz.open(), fitz.open(template)
+    for _ in range(2):
+        doc.new_page(width=200, height=200).show_pdf_page(fitz.Rect(0, 0, 200, 200), template_doc, 0)
+    doc.save(tmp_path / "forms.pdf")
+    src, dest = str(tmp_path / "forms.pdf"), str(tmp_path / "dest.pdf")
+    # the form is shared with page 1, which is not recolored: page 0 gets a recolored copy
+    assert recolor_pdf(src, [0], "#ff0000", "#00ff00", dest) == {0: 2}
+    assert colors(dest, 0)[0][0] == (0.0, 1.0, 0.0) and colors(dest, 1)[0][0] == (1.0, 0.0, 0.0)
+    with fitz.open(src) as a, fitz.open(dest) as b:
+        assert a[1].get_xobjects() == b[1].get_xobjects() and a[0].get_xobjects() != b[0].get_xobjects()
+    assert recolor_pdf(src, [0, 1], "#ff0000", "#00ff00", dest) == {0: 2, 1: 0}
+    assert colors(dest, 1)[0][0] == (0.0, 1.0, 0.0)
+    with fitz.open(src) as a, fitz.open(dest) as b:
+        assert a[1].get_xobjects() == b[1].get_xobjects()
+
+
+def test_recolor_opacity_restores_the_content_alpha(tmp_path):
+    # a translucent fill set by the content's own ExtGState stays translucent after a recolored fill
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    gs = doc.get_new_xref()
+    doc.update_object(gs, "<</Type/ExtGState/ca 0.5>>")
+    contents = doc.get_new_xref()
+    doc.update_object(contents, "<<>>")
+    doc.update_stream(contents, b"/Half gs 1 0 0 rg 10 10 40 40 re f 0 0 1 rg 60 10 40 40 re f")
+    doc.xref_set_key(page.xref, "Contents", "{} 0 R".format(contents))
+    doc.xref_set_key(page.xref, "Resources", "<</ExtGState<</Half {} 0 R>>>>".format(gs))
+    doc.save(tmp_path / "src.pdf")
+    src, dest = str(tmp_path / "src.pdf"), str(tmp_path / "dest.pdf")
+    assert recolor_pdf(src, [0], "#ff0000", "#00ff00", dest, opacity=0.25) == {0: 1}
+    recolored, untouched = colors(dest, 0)[:2]
+    assert recolored[0] == (0.0, 1.0, 0.0) and recolored[2] == 0.25
+    assert untouched[0] == (0.0, 0.0, 1.0) and untouched[2] == 0.5
+
+
+def test_recolor_opacity_only_for_the_recolored_paints():
+    # images, shadings and a later content gs don't get or drop the injected alpha
+    operations = [([1, 0, 0], b'rg'), ([0, 0, 10, 10], b're'), ([], b'f'), ([NameObject("/Im0")], b'Do'),
+                  ([NameObject("/Half")], b'gs'), ([0, 0, 5, 5], b're'), ([], b'f'), ([NameObject("/Sh0")], b'sh')]
+    result, changed, gs_used = recolor_operations(operations, (255, 0, 0), (0, 255, 0), 0.5, gs_alpha=lambda name: {"ca": 0.25})
+    assert changed == 1 and set(gs_used) == {"PCEFillAlpha0_5", "PCEFillAlpha1", "PCEFillAlpha0_25"}
+    assert [str(operands[0]) if op == b'gs' else op for operands, op in result] == [
+        b'rg', "/PCEFillAlpha0_5", b're', b'f', "/PCEFillAlpha1", b'Do',
+        "/Half", "/PCEFillAlpha0_5", b're', b'f', "/PCEFillAlpha0_25", b'sh']
+
+
+def test_recolor_sc_only_in_rgb_spaces(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    icc = doc.get_new_xref()
+    doc.update_object(icc, "<</N 3>>")
+    doc.update_stream(icc, b"profile")
+    contents = doc.get_new_xref()
+    doc.update_object(contents, "<<>>")
+    doc.update_stream(contents, b"/Lab cs 1 0 0 sc 0 0 10 10 re f /ICC cs 1 0 0 scn 20 0 10 10 re f 0 0 0 1 k 1 0 0 sc /DeviceRGB CS 1 0 0 SC")
+    doc.xref_set_key(page.xref, "Contents", "{} 0 R".format(contents))
+    doc.xref_set_key(page.xref, "Resources", "<</ColorSpace<</Lab[/Lab<</WhitePoint[1 1 1]>>]/ICC[/ICCBased {} 0 R]>>>>".format(icc))
+    doc.save(tmp_path / "src.pdf")
+    src, dest = str(tmp_path / "src.pdf"), str(tmp_path / "dest.pdf")
+    assert recolor_pdf(src, [0], "#ff0000", "#00ff00", dest) == {0: 2}
+    def tokens(data):
+        return [float(t) if t[0] in b"0123456789." else t for t in data.split()]
+    with fitz.open(dest) as result:
+        assert tokens(result[0].read_contents()) == tokens(b"/Lab cs 1 0 0 sc 0 0 10 10 re f /ICC cs 0 1 0 scn 20 0 10 10 re f 0 0 0 1 k 1 0 0 sc /DeviceRGB CS 0 1 0 SC")
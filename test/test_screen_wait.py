@@ -0,0 +1,75 @@
+import sys
+import os
+import numpy as np
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.screen_wait import ScreenWaiter
+
+
+class FakeScreen:
+    # synthetic frames on a fake clock: frames[i] is shown from times[i] on
+    def __init__(self, times, frames, titles=None):
+        self.now = 0.0
+        self.times, self.frames, self.titles = times, frames, titles
+        self.sleeps = []
+
+    def index(self):
+        return max(i for i, t in enumerate(self.times) if t <= self.now)
+
+    def screenshot(self):
+        return self.frames[self.index()]
+
+    def window_title(self):
+        return self.titles[self.index()]
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def waiter(self, **kwargs):
+        return ScreenWaiter(self.screenshot, self.window_title, clock=lambda: self.now, sleep=self.sleep, **kwargs)
+
+
+def frame(value=255, patch=None):
+    image = np.full((100, 200, 3), value, dtype=np.uint8)
+    if patch is not None:
+        image[10:20, 10:20] = patch
+    return image
+
+
+def test_for_change_returns_as_soon_as_the_region_changes():
+    screen = FakeScreen([0, 1.0], [frame(), frame(patch=(255, 0, 0))])
+    changed = screen.waiter(interval=0.05, backoff=2, max_interval=0.4).for_change((0, 0, 50, 50))
+    assert changed[15, 15].tolist() == [255, 0, 0]
+    assert 1.0 <= screen.now < 1.4
+    assert screen.sleeps[:4] == [0.05, 0.1, 0.2, 0.4] and max(screen.sleeps) == 0.4
+
+
+def test_change_outside_the_region_is_ignored():
+    screen = FakeScreen([0, 1.0], [frame(), frame(patch=(255, 0, 0))])
+    with pytest.raises(TimeoutError):
+        screen.waiter().for_change((100, 0, 200, 100), timeout=3)
+    assert screen.now == pytest.approx(3)
+
+
+def test_for_stable_waits_for_rendering_to_finish():
+    frames = [frame(), frame(patch=(200, 200, 200)), frame(patch=(100, 100, 100)), frame(patch=(0, 0, 0))]
+    screen = FakeScreen([0, 0.5, 1.0, 1.5], frames)
+    settled = screen.waiter(max_interval=0.1).for_stable(settle=0.5)
+    assert settled[15, 15].tolist() == [0, 0, 0] and 2.0 <= screen.now < 2.2
+
+
+def test_for_pixel_and_window():
+    screen = FakeScreen([0, 2.0], [frame(), frame(patch=(250, 5, 0))], ["*a.pdf - Revu", "a.pdf - Revu"])
+    waiter = screen.waiter()
+    assert waiter.for_pixel((12, 12), (255, 0, 0), tolerance=5)
+    assert waiter.for_window(lambda title: "*" not in title) and screen.now >= 2.0
+    assert waiter.for_window("Revu")
+    with pytest.raises(TimeoutError):
+        waiter.for_window("Inkscape", timeout=1)
+
+
+def test_until_returns_the_condition_value():
+    screen = FakeScreen([0], [frame()])
+    calls = iter([None, 0, "done"])
+    assert screen.waiter().until(lambda: next(calls)) == "done"
@@ -0,0 +1,89 @@
+import sys
+import os
+import re
+import json
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.session import ScriptSession
+from pce.pce_tool import PCETools
+
+
+class FakeEngine:
+    # keeps markups in memory and answers scripts in the ScriptEngine output format
+    def __init__(self, markups):
+        self.markups = markups
+        self.scripts = []
+        self.saved = 0
+        self.next_id = 0
+
+    def run(self, command):
+        self.scripts.append(command)
+        out = []
+        for line in command:
+            copy = re.match(r"MarkupCopy\((\d+), '(.*)'\)", line)
+            paste = re.match(r"MarkupPaste\((\d+), '(.*)', (.*), (.*)\)", line)
+            for setter in re.findall(r"MarkupSet\((\d+), '(.*?)', '(.*?)'\)", line):
+                self.markups[setter[1]].update(json.loads(setter[2]))
+            if copy is not None:
+                out.extend(["1", "xml:" + copy.group(2)])
+            elif paste is not None:
+                self.next_id += 1
+                new_id = "NEW{}".format(self.next_id)
+                self.markups[new_id] = dict(self.markups[paste.group(2)[len("xml:"):]])
+                out.extend(["1", new_id])
+            elif line == "Save()":
+                self.saved += 1
+        return "\r\n".join(out).encode("utf-8")
+
+
+@pytest.fixture
+def engine():
+    return FakeEngine({"A": {"comment": "a"}, "B": {"comment": "b"}})
+
+
+def test_session_coalesces_sets(engine):
+    with ScriptSession("f.pdf", engine.run) as s:
+        for _ in range(10):
+            s.set(1, {"A": {"comment": "x"}})
+            s.set(1, {"B": {"comment": "y"}})
+    assert len(engine.scripts) == 1 and engine.saved == 1
+    assert engine.markups["A"]["comment"] == "x"
+
+
+def test_session_resolves_pasted_ids(engine):
+    with ScriptSession("f.pdf", engine.run) as s:
+        new_ids = []
+        for row in range(5):
+            s.set(1, {"B": {"comment": str(row)}})
+            content = s.copy(1, "A")
+            new_id = s.paste(1, content, (0, 0))
+            s.set(1, {new_id: {"comment": "row {}".format(row)}})
+            new_ids.append(new_id)
+    # sets + copies, then pastes, then sets on pasted markups
+    assert len(engine.scripts) == 3 and engine.saved == 3
+    assert [engine.markups[i.get()[0]]["comment"] for i in new_ids] == ["row {}".format(row) for row in range(5)]
+    assert engine.markups["B"]["comment"] == "4"
+
+
+def test_session_discards_on_error(engine):
+    with pytest.raises(ValueError):
+        with ScriptSession("f.pdf", engine.run) as s:
+            s.set(1, {"A": {"comment": "x"}})
+            raise ValueError()
+    assert engine.scripts == []
+    assert s.copy(1, "A").resolved is False
+
+
+def test_set_structured_markups_in_session(engine, monkeypatch):
+    monkeypatch.setattr(PCETools, "_run_script", staticmethod(lambda name, command: engine.run(command)))
+    engine.markups.update({"R0": {"comment": "A"}, "D0": {"comment": "first"}})
+    context = {
+        "PROJECT": ["A", [1, 2, "project"]],
+        "VERSION": [{"REV": ["R0", [10, 20, "A"]], "DESC": ["D0", [30, 20, "first"]]},
+                    {"REV": ["", [0, 0, "B"]], "DESC": ["", [0, 0, "second"]]},
+                    {"REV": ["", [0, 0, "C"]], "DESC": ["", [0, 0, "third"]]}],
+    }
+    PCETools.set_structured_markups("f.pdf", 1, context, (0, -5))
+    assert len(engine.scripts) == 3
+    assert engine.markups["A"] == {"comment": "project", "x": "1", "y": "2"}
+    assert engine.markups["NEW4"] == {"comment": "third", "x": "30", "y": "10"}
@@ -1,7 +1,61 @@
 import sys
 import os
+import fitz
+import numpy as np
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pce.simulator
 from pce.simulator import Simulator
+from pce.screen_wait import ScreenWaiter
+
+
+class FakeRevu(Simulator):
+    # synthetic frames on a fake clock: every click, key press and the launch draws a new frame, the title loses
+    # its unsaved marker after ctrl+s; nothing touches pyautogui, keyboard or a display
+    def __init__(self):
+        super().__init__(screenshot=self.screenshot, window_title=self.window_title)
+        self.now, self.frame, self.saved, self.actions = 0.0, 0, False, []
+        self.wait = ScreenWaiter(self.screenshot, self.window_title, timeout=60.0, clock=lambda: self.now, sleep=self.sleep)
+
+    def screenshot(self):
+        return np.full((2160, 3840, 3), self.frame % 256, dtype=np.uint8)
+
+    def window_title(self):
+        return "b.pdf - Revu" if self.saved else "b.pdf * - Revu"
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def act(self, action):
+        self.actions.append(action)
+        self.frame += 1
+
+    def click_at(self, position):
+        self.act(position)
+
+    def press(self, keys):
+        self.saved = self.saved or keys == 'ctrl+s'
+        self.act(keys)
+
+
+def test_copy_and_write_on_synthetic_frames(tmp_path, monkeypatch):
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page()
+    doc.save(tmp_path / "a.pdf")
+    sim = FakeRevu()
+    monkeypatch.setattr(pce.simulator.subprocess, "Popen", lambda *args, **kwargs: sim.act("launch"))
+    Simulator.copy_and_write(str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf"), sim=sim)
+    keys = [action for action in sim.actions if isinstance(action, str)]
+    assert keys == ["launch"] + ["ctrl+a", "ctrl+c", "ctrl+shift+v"] * 2 + ["ctrl+s"]
+    assert sim.actions[-1] == (3820, 15) and sim.saved
+    # no fixed sleeps: the fake clock only moved while waiting for frames to settle
+    assert sim.now < 30
+
+
+def test_injected_screenshot_needs_no_pyautogui(monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyautogui", None)
+    sim = Simulator(screenshot=lambda: np.zeros((4, 4, 3), dtype=np.uint8))
+    assert sim.wait.window_title is None and sim.wait.pixel((1, 1)) == (0, 0, 0)
 
 # def test_simulate_copy_and_write():
 #     file_path_a = os.path.join(os.path.dirname(__file__), "copy_markup\\2.pdf")
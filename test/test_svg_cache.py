@@ -0,0 +1,143 @@
+import sys
+import os
+import pickle
+import threading
+import fitz
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.pce_tool import PCETools
+from pce.svg_cache import SVGCache, page_key
+from xml.etree import ElementTree as ET
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SVGCache(str(tmp_path / "svg_cache"))
+    monkeypatch.setattr(PCETools, "SVG_CACHE", cache)
+    return cache
+
+
+def make_pdf(path, color=(1, 0, 0), note=None):
+    doc = fitz.open()
+    for i in range(2):
+        page = doc.new_page(width=200, height=200)
+        page.draw_rect(fitz.Rect(10, 10, 50 + i, 50), color=color, fill=color)
+        page.insert_text((20, 150), "sheet {}".format(i))
+        if note is not None:
+            page.add_text_annot((100, 100), note)
+    doc.save(path)
+    doc.close()
+    PCETools.invalidate_document(str(path))
+    return str(path)
+
+
+def test_same_content_is_rendered_once(cache, tmp_path):
+    a, b = make_pdf(tmp_path / "a.pdf"), make_pdf(tmp_path / "b.pdf")
+    first = ET.tostring(PCETools.get_ET(a, 0))
+    assert cache.stats()["misses"] == 1 and cache.stats()["writes"] == 1
+    # another file with the same page, found by content
+    assert ET.tostring(PCETools.get_ET(b, 0)) == first
+    assert PCETools.pdf_color(b, 0) == PCETools.pdf_color(a, 0)
+    stats = cache.stats()
+    assert stats["hits"] == 3 and stats["misses"] == 1 and stats["hit_rate"] == 0.75
+    # the second page differs
+    PCETools.get_ET(a, 1)
+    assert cache.stats()["misses"] == 2
+
+
+def test_changed_content_annotations_or_geometry_miss(cache, tmp_path):
+    with fitz.open(make_pdf(tmp_path / "a.pdf")) as doc:
+        key = page_key(doc, doc[0])
+        assert key == page_key(doc, doc[0]) and key != page_key(doc, doc[1])
+    for variant in (make_pdf(tmp_path / "b.pdf", color=(0, 0, 1)), make_pdf(tmp_path / "c.pdf", note="moved")):
+        with fitz.open(variant) as doc:
+            assert page_key(doc, doc[0]) != key
+    with fitz.open(tmp_path / "a.pdf") as doc:
+        doc[0].set_rotation(90)
+        assert page_key(doc, doc[0]) != key
+
+
+def test_lru_eviction(tmp_path):
+    cache = SVGCache(str(tmp_path / "svg_cache"), max_bytes=3400)
+    for i in range(3):
+        cache.put("{:064x}".format(i), "<svg>{}</svg>".format("x" * 900))
+    # 0 is used again, so 1 is the oldest when 3 pushes the size over the limit
+    os.utime(cache._path("{:064x}".format(1)), ns=(1, 1))
+    os.utime(cache._path("{:064x}".format(0)), ns=(2, 2))
+    os.utime(cache._path("{:064x}".format(2)), ns=(3, 3))
+    assert cache.get("{:064x}".format(0)) is not None
+    cache.put("{:064x}".format(3), "<svg>{}</svg>".format("x" * 900))
+    assert cache.get("{:064x}".format(1)) is None
+    assert all(cache.get("{:064x}".format(i)) is not None for i in (0, 2, 3))
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] <= 3060
+
+
+def test_concurrent_writers(tmp_path):
+    caches = [SVGCache(str(tmp_path / "svg_cache")) for _ in range(8)]
+    svg = "<svg>{}</svg>".format("y" * 100000)
+    threads = [threading.Thread(target=c.put, args=("ab" * 32, svg)) for c in caches for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert caches[0].get("ab" * 32) == svg
+    assert os.listdir(os.path.dirname(caches[0]._path("ab" * 32))) == ["ab" * 32 + ".svg"]
+
+
+def test_disabled_and_pickled(tmp_path):
+    assert not SVGCache().enabled
+    cache = pickle.loads(pickle.dumps(SVGCache(str(tmp_path), 10)))
+    assert cache.directory == str(tmp_path) and cache.max_bytes == 10 and cache.stats()["hits"] == 0
+
+
+def test_unchanged_file_skips_the_object_walk(cache, tmp_path, monkeypatch):
+    import pce.svg_cache
+    a = make_pdf(tmp_path / "a.pdf")
+    walks = []
+    page_key_impl = pce.svg_cache.page_key
+    monkeypatch.setattr(pce.svg_cache, "page_key", lambda doc, page: walks.append(page.number) or page_key_impl(doc, page))
+    signature = SVGCache.file_signature(a)
+    with fitz.open(a) as doc:
+        key = cache.key(a, doc, 0, signature)
+        assert cache.key(a, doc, 0, signature) == key
+    # a new process (a fresh cache object) finds the alias on disk
+    with fitz.open(a) as doc:
+        assert SVGCache(cache.directory).key(a, doc, 0, signature) == key
+        assert cache.key(a, doc, 1, signature) != key
+    assert walks == [0, 1]
+    make_pdf(tmp_path / "a.pdf", color=(0, 0, 1))
+    with fitz.open(a) as doc:
+        assert cache.key(a, doc, 0, SVGCache.file_signature(a)) != key
+    assert walks == [0, 1, 0]
+    # clear() drops the aliases and the remembered file hashes, the next lookup walks the page again
+    cache.clear()
+    assert cache._file_digests == {}
+    with fitz.open(a) as doc:
+        cache.key(a, doc, 0, SVGCache.file_signature(a))
+    assert walks == [0, 1, 0, 0]
+
+
+def test_file_changed_after_opening_gets_no_alias(cache, tmp_path):
+    # doc was opened before the file was rewritten: its key must not become the new file's alias
+    a = make_pdf(tmp_path / "a.pdf")
+    signature = SVGCache.file_signature(a)
+    with fitz.open(a) as doc:
+        make_pdf(tmp_path / "a.pdf", color=(0, 0, 1))
+        os.utime(a, ns=(signature[0] + 10 ** 9, signature[0] + 10 ** 9))
+        old = cache.key(a, doc, 0, signature)
+        assert old == page_key(doc, doc[0])
+    with fitz.open(a) as doc:
+        assert cache.key(a, doc, 0, SVGCache.file_signature(a)) == page_key(doc, doc[0]) != old
+
+
+def gen_pdf(alpha):
+    # the page's ExtGState is object 5 generation 1, as after some incremental updates
+    objects = [b"1 0 obj <</Type/Catalog/Pages 2 0 R>> endobj", b"2 0 obj <</Type/Pages/Kids[3 0 R]/Count 1>> endobj",
+               b"3 0 obj <</Type/Page/Parent 2 0 R/MediaBox[0 0 100 100]/Resources<</ExtGState<</G0 5 1 R>>>>/Contents 4 0 R>> endobj",
+               b"4 0 obj <</Length 8>> stream\n/G0 gs q\nendstream endobj", b"5 1 obj <</Type/ExtGState/ca " + alpha + b">> endobj"]
+    return b"%PDF-1.4\n" + b"\n".join(objects) + b"\ntrailer <</Root 1 0 R>>\n%%EOF"
+
+
+def test_page_key_walks_nonzero_generations():
+    with fitz.open("pdf", gen_pdf(b"0.5")) as a, fitz.open("pdf", gen_pdf(b"0.25")) as b:
+        assert page_key(a, a[0]) != page_key(b, b[0])
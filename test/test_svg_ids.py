@@ -0,0 +1,41 @@
+import sys
+import os
+from xml.etree import ElementTree as ET
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.svg_ids import rename_ids, parse_with_renamed_ids, make_suffix
+from pce.pce_tool import PCETools
+
+SVG = ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="10" height="10">'
+       '<defs><clipPath id="clip_1"><path d="M0 0"/></clipPath><path id="font_1" d="M1 1"/></defs>'
+       '<g clip-path="url(#clip_1)" fill="#ff0000"><use xlink:href="#font_1" x="1"/><a href="http://example.com"/></g>'
+       '<rect style="fill:url(#grad_2);stroke:url(#grad_3)" class="c#1"/></svg>')
+XLINK = "{http://www.w3.org/1999/xlink}href"
+
+
+def check_renamed(root):
+    elems = list(root.iter())
+    assert elems[2].get("id") == "clip_1_s1"
+    assert elems[4].get("id") == "font_1_s1"
+    assert elems[5].get("clip-path") == "url(#clip_1_s1)"
+    assert elems[5].get("fill") == "#ff0000"
+    assert elems[6].get(XLINK) == "#font_1_s1"
+    assert elems[7].get("href") == "http://example.com"
+    assert elems[8].get("style") == "fill:url(#grad_2_s1);stroke:url(#grad_3_s1)"
+    assert elems[8].get("class") == "c#1"
+
+
+def test_rename_ids():
+    check_renamed(rename_ids(ET.fromstring(SVG), "s1"))
+
+
+def test_parse_with_renamed_ids():
+    check_renamed(parse_with_renamed_ids(SVG, "s1"))
+    check_renamed(parse_with_renamed_ids(SVG.encode("ascii"), "s1"))
+
+
+def test_legacy_entry_point_and_suffix():
+    root = ET.fromstring(SVG)
+    PCETools._rename_id(root, "s1")
+    check_renamed(root)
+    assert make_suffix("a.pdf", 0) == make_suffix("a.pdf", 0) != make_suffix("a.pdf", 1)
+    assert make_suffix() != make_suffix()
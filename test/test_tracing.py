@@ -0,0 +1,75 @@
+import sys
+import os
+import json
+import subprocess
+import fitz
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pce.pce_tool
+from pce.pce_tool import PCETools
+from pce.tracing import tracer, trace, JSONLinesSink, format_summary
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    def check_output(args):
+        if "fail.pdf" in args[1]:
+            raise subprocess.CalledProcessError(3, args)
+        return b"1\r\n{'A': '{'x': '1', 'y': '2'}'}\r\n"
+    monkeypatch.setattr(pce.pce_tool.subprocess, "check_output", check_output)
+    monkeypatch.setattr(PCETools, "BLUEBEAM_ENGINE_DIR", "ScriptEngine.exe")
+    doc = fitz.open()
+    doc.new_page()
+    doc.save(tmp_path / "a.pdf")
+    PCETools.invalidate_document(str(tmp_path / "a.pdf"))
+    return str(tmp_path / "a.pdf")
+
+
+def test_disabled_tracer_is_a_no_op():
+    assert not tracer.enabled
+    with tracer.span("anything", file="x") as span:
+        span.set(bytes_out=1)
+    assert tracer.span("other") is span
+
+
+def test_bluebeam_spans(engine, tmp_path):
+    jsonl = str(tmp_path / "spans.jsonl")
+    with trace(jsonl) as spans:
+        PCETools.return_markup_by_page(engine, 2)
+        with pytest.raises(subprocess.CalledProcessError):
+            PCETools.copy_markup(str(tmp_path / "fail.pdf"), 1, "A")
+    assert not tracer.enabled
+    ok, failed = spans.spans
+    assert ok["operation"] == "bluebeam.get_markup" and ok["file"] == engine and ok["page"] == 2 and ok["status"] == 0
+    assert ok["command_length"] == len(f"Open('{engine}') MarkupGetExList(2) Close()") and ok["bytes_out"] > 0
+    assert failed["operation"] == "bluebeam.copy_markup" and failed["status"] == 3
+    with open(jsonl) as f:
+        assert [json.loads(line)["operation"] for line in f] == ["bluebeam.get_markup", "bluebeam.copy_markup"]
+    summary = spans.summary()
+    assert summary["spans"] == 2 and summary["operations"]["bluebeam.copy_markup"]["errors"] == 1
+    assert "bluebeam.get_markup" in format_summary(summary)
+
+
+def test_script_and_stage_spans(engine, tmp_path):
+    doc = fitz.open()
+    doc.new_page(width=100, height=100)
+    pdf_bytes = doc.tobytes()
+    with trace() as spans:
+        PCETools.return_markups_for_document(engine, [1])
+        resized = PCETools.resize_pdf(pdf_bytes, "100", 100, 100, "100", 200, 200)
+    script, resize = spans.spans
+    assert script["operation"] == "bluebeam.script" and script["file"] == engine and script["commands"] == 3
+    assert resize["operation"] == "pdf.resize" and resize["bytes_in"] == len(pdf_bytes) and resize["bytes_out"] == len(resized)
+
+
+def test_jsonl_sink_to_stream(tmp_path):
+    path = tmp_path / "out.jsonl"
+    with open(path, "w") as f:
+        sink = tracer.add_sink(JSONLinesSink(f))
+        try:
+            with tracer.span("stage", page=1):
+                pass
+        finally:
+            tracer.remove_sink(sink)
+    record = json.loads(path.read_text())
+    assert record["operation"] == "stage" and record["page"] == 1 and record["duration"] >= 0
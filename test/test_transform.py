@@ -0,0 +1,67 @@
+import sys
+import os
+import fitz
+import pypdf
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from pce.transform import transform_pages
+from pce.pce_tool import PCETools
+
+
+def make_pdf(path, rotations):
+    doc = fitz.open()
+    for rotation in rotations:
+        page = doc.new_page(width=200, height=100)
+        page.draw_rect(fitz.Rect(10, 10, 20, 20), fill=(1, 0, 0))
+        page.set_rotation(rotation)
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def rect_positions(pdf_file):
+    # drawing rects in unrotated page space, y measured from the top
+    with fitz.open(pdf_file) as doc:
+        return [tuple(round(v, 3) for v in page.get_drawings()[0]["rect"]) for page in doc]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_transform_pages_per_page(tmp_path, workers):
+    src = make_pdf(tmp_path / "src.pdf", [0, 0, 90, 0, 0])
+    output = str(tmp_path / "out.pdf")
+    transform_pages(src, output, {0: (5, 0), 2: (5, 0), 3: pypdf.Transformation().translate(0, -3), 4: {"page_scale": (2, 2)}}, workers=workers, shard_size=2)
+    positions = rect_positions(output)
+    assert positions[0] == (15, 10, 25, 20)
+    assert positions[1] == (10, 10, 20, 20)
+    assert positions[2] == (10, 5, 20, 15)
+    assert positions[3] == (10, 13, 20, 23)
+    assert positions[4] == (20, 20, 40, 40)
+    with fitz.open(output) as doc:
+        assert doc.page_count == 5 and doc[2].rotation == 90
+        assert (doc[4].rect.width, doc[4].rect.height) == (400, 200)
+
+
+def test_pdf_content_move_all_pages(tmp_path):
+    src = make_pdf(tmp_path / "src.pdf", [0, 0, 0])
+    doc = fitz.open(src)
+    doc[1].draw_rect(fitz.Rect(100, 50, 110, 60), fill=(0, 0, 1))
+    doc.saveIncr()
+    doc.close()
+    output = str(tmp_path / "out.pdf")
+    PCETools.pdf_content_move(src, output, (5, 5), pages=[1, 2])
+    with fitz.open(output) as out:
+        assert len(out[1].get_drawings()) == 2
+    assert rect_positions(output) == [(10, 10, 20, 20), (15, 5, 25, 15), (15, 5, 25, 15)]
+    PCETools.pdf_content_move(output, output, (-5, -5))
+    assert rect_positions(output) == [(5, 15, 15, 25), (10, 10, 20, 20), (10, 10, 20, 20)]
+
+
+def test_transform_pages_in_memory(tmp_path):
+    src = make_pdf(tmp_path / "src.pdf", [0, 0])
+    with open(src, "rb") as f:
+        data = f.read()
+    for workers in (1, 2):
+        result = PCETools.transform_pages(data, None, {1: {"content_scale": (0.5, 0.5)}}, workers=workers)
+        with fitz.open("pdf", result) as doc:
+            assert doc.page_count == 2
+            assert tuple(round(v, 3) for v in doc[1].get_drawings()[0]["rect"]) == (5, 55, 10, 60)